@@ -1,15 +1,24 @@
 import streamlit as st
 import sys
-import requests
 import json
 import os
 from datetime import datetime
 import uuid
 import glob
-import subprocess
 import socket
+import sqlite3
 import time
 import database
+import deployer
+import llm_client
+import response_cache
+import image_store
+import llm_gateway
+import discovery
+import metrics
+import supervisor
+import context_window
+import history_store
 
 # --- Helper Functions ---
 
@@ -49,12 +58,40 @@ def save_system_settings(settings):
 
 # Initialize DB
 database.init_db()
-database.cleanup_zombies() # Cleanup on startup
 
 st.set_page_config(page_title="DSE AI Tutor Platform", page_icon="🎓", layout="wide")
 
 # Apply System Customization (CSS) if exists
 sys_settings = load_system_settings()
+
+@st.cache_resource(show_spinner=False)
+def start_services():
+    """Start this process's background services once; the settings form re-applies them on save.
+
+    Returns a warning to show, or None. Once running, the gateway is kept
+    alive by the supervisor, not by page loads.
+    """
+    settings = load_system_settings()
+    # Keep pre-loaded runners warm for instant publishing
+    deployer.set_warm_pool_size(int(settings.get("warm_pool_size", 2)))
+    # Watch published runners and servers: health checks, restarts, CPU/memory stats for the dashboard
+    supervisor.ensure_running(
+        memory_limit_mb=int(settings.get("runner_memory_limit_mb", 0)),
+        idle_timeout=int(settings.get("idle_timeout_minutes", 0)) * 60
+    )
+    # Queue every runner's vision requests through one gateway so the shared Ollama box is not swamped
+    if settings.get("llm_gateway"):
+        try:
+            deployer.ensure_gateway(concurrency=int(settings.get("gateway_concurrency", 2)))
+        except deployer.LaunchError as e:
+            return f"{e} Tutors will call Ollama directly."
+    return None
+
+startup_warning = start_services()
+if startup_warning:
+    st.warning(startup_warning)
+# Prometheus text export of the tutor metrics (metrics.py); 0 turns it off, a new port moves it
+metrics.serve(int(sys_settings.get("metrics_port", metrics.DEFAULT_PORT)))
 if sys_settings.get("background_url"):
     page_bg_img = f'''
     <style>
@@ -79,7 +116,7 @@ def load_config(username):
     config_file = os.path.join(get_user_dir(username), "config.json")
     if os.path.exists(config_file):
         try:
-            with open(config_file, "r", encoding="utf-8") as f:
+            with metrics.timer("config_load", username), open(config_file, "r", encoding="utf-8") as f:
                 return json.load(f)
         except:
             pass
@@ -87,65 +124,34 @@ def load_config(username):
 
 def save_config(username, config):
     config_file = os.path.join(get_user_dir(username), "config.json")
-    with open(config_file, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2)
-
-def get_free_port():
-    """Find a free port starting from 8502."""
-    active_ports = database.get_all_active_ports()
-    port = 8502
-    while True:
-        if port not in active_ports:
-            # Double check if port is actually free on OS
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            result = sock.connect_ex(('127.0.0.1', port))
-            sock.close()
-            if result != 0: # Port is closed (free)
-                return port
-        port += 1
+    # Write then rename: a running tutor never reads a half-written file, and the new
+    # inode tells its config cache (tutor_cache.py) to re-read
+    tmp_file = f"{config_file}.{os.getpid()}.tmp"
+    with metrics.timer("config_save", username):
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+        os.replace(tmp_file, config_file)
 
 def start_student_app(user_id, username):
-    """Launch runner.py for a specific user on a new port."""
-    # Check if already running
-    dep = database.get_deployment(user_id)
-    if dep and dep['status'] == 'running':
-        # Check if process is actually alive
-        try:
-            os.kill(dep['pid'], 0)
-            return dep['port'] # Still running
-        except OSError:
-            pass # Process dead, restart
+    """Launch runner.py for a specific user using the configured serving mode.
 
-    port = get_free_port()
-    
-    # Command to run Streamlit
-    cmd = [
-        sys.executable, "-m", "streamlit", "run", "runner.py",
-        "--server.port", str(port),
-        "--server.headless", "true",
-        "--server.address", "0.0.0.0",
-        "--server.fileWatcherType", "none",
-        "--", f"user_id={user_id}"
-    ]
-    
-    # Start process
-    process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    
-    # Update DB
-    database.update_deployment(user_id, port, process.pid)
-    
-    # Wait a bit for it to start
-    time.sleep(2)
-    return port
+    Returns the port, or None after showing an error if the tutor did not start.
+    """
+    settings = load_system_settings()
+    mode = settings.get("serving_mode", "process")
+    hibernate = mode == "process" and int(settings.get("idle_timeout_minutes", 0)) > 0
+    try:
+        with metrics.timer("publish", username):
+            return deployer.start_student_app(user_id, username, mode=mode, hibernate=hibernate)
+    except deployer.LaunchError as e:
+        st.error(f"{e} It has been stopped; please try again.")
+        return None
 
 def stop_student_app(user_id):
-    dep = database.get_deployment(user_id)
-    if dep and dep['pid']:
-        try:
-            os.kill(dep['pid'], 15) # SIGTERM
-        except OSError:
-            pass
-        database.stop_deployment_record(user_id)
+    deployer.stop_student_app(user_id)
+
+def get_app_url(dep):
+    return f"http://{SERVER_IP}:{dep['port']}{deployer.get_app_path(dep)}"
 
 # --- UI Components ---
 
@@ -206,16 +212,50 @@ def render_profile(user):
             else:
                 st.error(msg)
 
+def reset_dashboard_page():
+    st.session_state.dash_page = 1
+
 def render_teacher_dashboard():
     st.title("👨‍🏫 Teacher Dashboard")
     
-    tab_students, tab_system = st.tabs(["👥 Student Management", "⚙️ System Customization"])
+    tab_students, tab_performance, tab_system = st.tabs(["👥 Student Management", "📈 Performance", "⚙️ System Customization"])
     
     with tab_students:
-        if st.button("Refresh List"):
+        ctrl = st.columns([3, 1.5, 1.5, 1, 1])
+        search = ctrl[0].text_input("Search", placeholder="Name or username", key="dash_search", on_change=reset_dashboard_page)
+        status_filter = ctrl[1].selectbox(
+            "Status", ["all", "running", "stopped", "active", "banned"], key="dash_status", on_change=reset_dashboard_page,
+            format_func=lambda s: {"all": "All", "running": "App running", "stopped": "App stopped", "active": "Account active", "banned": "Account banned"}[s]
+        )
+        sort_by = ctrl[2].selectbox(
+            "Sort by", list(database.STUDENT_SORT_COLUMNS), key="dash_sort", on_change=reset_dashboard_page,
+            format_func=lambda k: k.replace("_", " ").title()
+        )
+        descending = ctrl[3].toggle("Desc", key="dash_desc", on_change=reset_dashboard_page)
+        page_size = ctrl[4].selectbox("Per page", [25, 50, 100], key="dash_page_size", on_change=reset_dashboard_page)
+        
+        status = None if status_filter == "all" else status_filter
+        with metrics.timer("dashboard_count"):
+            total = database.count_students(status=status, search=search)
+        pages = max(1, -(-total // page_size))
+        page = min(st.session_state.get("dash_page", 1), pages)
+        
+        nav = st.columns([1, 1, 4, 1])
+        if nav[0].button("◀ Prev", disabled=page <= 1):
+            st.session_state.dash_page = page - 1
+            st.rerun()
+        if nav[1].button("Next ▶", disabled=page >= pages):
+            st.session_state.dash_page = page + 1
+            st.rerun()
+        nav[2].caption(f"Page {page} of {pages} · {total} students")
+        if nav[3].button("Refresh List"):
             st.rerun()
             
-        students = database.get_all_students()
+        with metrics.timer("dashboard_page"):
+            students = database.get_students_with_deployments(
+                limit=page_size, offset=(page - 1) * page_size,
+                sort_by=sort_by, descending=descending, status=status, search=search
+            )
         
         # Table Header
         cols = st.columns([1, 2, 2, 1.5, 1.5, 4])
@@ -233,23 +273,33 @@ def render_teacher_dashboard():
                 cols[1].write(s['name'])
                 cols[2].write(s['username'])
                 
-                # App Status
-                dep = database.get_deployment(s['id'])
+                # App Status (as last recorded by the supervisor)
                 app_status = "🔴 Stopped"
                 app_url = ""
                 is_running = False
-                if dep and dep['status'] == 'running':
-                    try:
-                        os.kill(dep['pid'], 0)
-                        app_status = f"🟢 (: {dep['port']})"
-                        app_url = f"http://{SERVER_IP}:{dep['port']}"
-                        is_running = True
-                    except:
-                        app_status = "⚠️ Zombie"
+                if s['dep_status'] == 'running':
+                    health = s['dep_health'] or supervisor.STARTING
+                    is_running = True
+                    app_url = get_app_url({"user_id": s['id'], "port": s['dep_port'], "mode": s['dep_mode']})
+                    if health == supervisor.HEALTHY:
+                        app_status = f"🟢 (: {s['dep_port']})"
+                    elif health == supervisor.STARTING:
+                        app_status = "🟡 Starting"
+                    else:
+                        app_status = f"⚠️ {health.replace('_', ' ').title()}"
+                elif s['dep_status'] == 'hibernated':
+                    # Still published: the front proxy wakes it on the next visit
+                    is_running = True
+                    app_url = get_app_url({"user_id": s['id'], "port": s['dep_port'], "mode": s['dep_mode']})
+                    app_status = f"💤 Hibernated (: {s['dep_port']})"
+                elif s['dep_health'] == supervisor.FAILED:
+                    app_status = "❌ Failed"
                 cols[3].write(app_status)
+                if s['dep_status'] == 'running' and s['dep_rss_bytes'] is not None:
+                    cols[3].caption(f"{s['dep_rss_bytes'] / 2**20:.0f} MB · {s['dep_cpu_percent'] or 0:.0f}% CPU" + (f" · {s['dep_restarts']} restarts" if s['dep_restarts'] else ""))
                 
                 # Account Status
-                acc_status = s.get('account_status', 'active')
+                acc_status = s.get('account_status') or 'active'
                 if acc_status == 'banned':
                     cols[4].markdown("🔴 **BANNED**")
                 else:
@@ -268,8 +318,8 @@ def render_teacher_dashboard():
                                 st.rerun()
                         else:
                             if st.button("▶️ Run", key=f"run_{s['id']}", use_container_width=True):
-                                 start_student_app(s['id'], s['username'])
-                                 st.rerun()
+                                 if start_student_app(s['id'], s['username']) is not None:
+                                     st.rerun()
                     with sub_cols[1]:
                         if app_url:
                             st.link_button("🔗 Open", app_url, use_container_width=True)
@@ -307,9 +357,17 @@ def render_teacher_dashboard():
                             with col_b:
                                 if st.form_submit_button("🗑️ Delete User", type="primary", use_container_width=True):
                                     database.delete_user(s['id'])
+                                    try:
+                                        image_store.prune(history_store.image_references()) # Free images only this user uploaded
+                                    except (sqlite3.Error, OSError) as e:
+                                        st.warning(f"User deleted, but their images could not be cleaned up: {e}")
+                                        time.sleep(1)
                                     st.rerun()
                 st.divider()
 
+    with tab_performance:
+        render_performance()
+    
     with tab_system:
         st.header("🎨 System Customization")
         st.info("Customize the login page branding for your school.")
@@ -322,14 +380,162 @@ def render_teacher_dashboard():
             # Or upload logic could be added here but simple URL or local path is easier for now
             bg_url = st.text_input("Background Image URL", value=sys_settings.get("background_url", ""), help="Enter a URL for the login page background.")
             
+            st.markdown("### 🖥️ Tutor Hosting")
+            current_mode = sys_settings.get("serving_mode", "process")
+            serving_mode = st.radio(
+                "Serving Mode",
+                deployer.SERVING_MODES,
+                index=deployer.SERVING_MODES.index(current_mode) if current_mode in deployer.SERVING_MODES else 0,
+                format_func=lambda m: "One process per student" if m == "process" else "Shared tutor server (all students in one process)",
+                help="Shared mode serves every published tutor from a single Streamlit process, which uses far less memory for large classes. Applies to tutors launched after saving."
+            )
+            warm_pool_size = st.number_input(
+                "Warm Runner Pool Size",
+                min_value=0, max_value=32,
+                value=int(sys_settings.get("warm_pool_size", 2)),
+                help="Number of pre-loaded runner processes kept ready so 'Publish & Launch' starts instantly. 0 disables the pool."
+            )
+            memory_limit_mb = st.number_input(
+                "Runner Memory Limit (MB)",
+                min_value=0, max_value=65536, step=64,
+                value=int(sys_settings.get("runner_memory_limit_mb", 0)),
+                help="A tutor process using more memory than this is restarted by the supervisor. 0 means no limit."
+            )
+            idle_timeout_minutes = st.number_input(
+                "Hibernate Idle Tutors After (minutes)",
+                min_value=0, max_value=10080,
+                value=int(sys_settings.get("idle_timeout_minutes", 0)),
+                help="Tutors nobody has opened for this long are stopped to free memory and start again automatically on the next visit. 0 keeps tutors running. Applies to tutors launched after saving (one process per student mode)."
+            )
+            use_gateway = st.checkbox(
+                "Queue vision requests (LLM gateway)",
+                value=sys_settings.get("llm_gateway", False),
+                help="Image questions from every tutor wait in one fair queue instead of all hitting the Ollama server at once. Students see their place in the queue. Identical requests are answered once."
+            )
+            metrics_port = st.number_input(
+                "Metrics Export Port",
+                min_value=0, max_value=65535,
+                value=int(sys_settings.get("metrics_port", metrics.DEFAULT_PORT)),
+                help="Tutor latency, error and token metrics are served in Prometheus format on http://127.0.0.1:<port>/metrics. 0 turns the export off."
+            )
+            gateway_concurrency = st.number_input(
+                "Vision Requests at Once (per Ollama server)",
+                min_value=1, max_value=64,
+                value=int(sys_settings.get("gateway_concurrency", 2)),
+                help="How many image requests the gateway lets through to each Ollama server at the same time. Match it to what the GPU can serve."
+            )
+            
             if st.form_submit_button("💾 Save Branding"):
                 new_settings = {
                     "school_name": school_name,
                     "logo_url": logo_url,
-                    "background_url": bg_url
+                    "background_url": bg_url,
+                    "serving_mode": serving_mode,
+                    "warm_pool_size": int(warm_pool_size),
+                    "runner_memory_limit_mb": int(memory_limit_mb),
+                    "idle_timeout_minutes": int(idle_timeout_minutes),
+                    "llm_gateway": use_gateway,
+                    "gateway_concurrency": int(gateway_concurrency),
+                    "metrics_port": int(metrics_port)
                 }
+                gateway_changed = (use_gateway, int(gateway_concurrency)) != (sys_settings.get("llm_gateway", False), int(sys_settings.get("gateway_concurrency", 2)))
                 save_system_settings(new_settings)
+                deployer.set_warm_pool_size(int(warm_pool_size))
+                if not metrics.serve(int(metrics_port)):
+                    st.warning(f"Port {int(metrics_port)} is in use; metrics are not exported.")
+                supervisor.ensure_running(memory_limit_mb=int(memory_limit_mb), idle_timeout=int(idle_timeout_minutes) * 60)
+                if gateway_changed:
+                    deployer.stop_gateway()
+                    start_services.clear() # Drop a stale startup warning about the old gateway
+                    if use_gateway:
+                        try:
+                            deployer.ensure_gateway(concurrency=int(gateway_concurrency))
+                        except deployer.LaunchError as e:
+                            st.warning(f"{e} Tutors will call Ollama directly.")
                 st.success("System settings updated! Refresh the page to see changes.")
+        
+        cache_stats = response_cache.stats()
+        if cache_stats["hits"] or cache_stats["misses"]:
+            st.markdown("### ⚡ Answer Cache")
+            m = st.columns(3)
+            m[0].metric("Hit Rate", f"{cache_stats['hit_rate']:.0%}")
+            m[1].metric("Cached Answers Served", int(cache_stats["hits"]))
+            m[2].metric("Backend Time Saved", f"{cache_stats['saved_seconds'] / 60:.1f} min")
+        
+        image_stats = image_store.stats()
+        if image_stats["uploads"]:
+            st.markdown("### 🖼️ Image Uploads")
+            m = st.columns(4)
+            m[0].metric("Distinct Images", image_stats["images"], help=f"{image_stats['uploads']} uploads")
+            m[1].metric("Disk Saved", f"{image_stats['saved_bytes'] / 2**20:.1f} MB")
+            m[2].metric("Vision Calls Avoided", image_stats["vision_calls_avoided"])
+            m[3].metric("Vision Time Saved", f"{image_stats['vision_seconds_saved'] / 60:.1f} min")
+        
+        gateway = llm_gateway.gateway_url()
+        if gateway:
+            try:
+                gw = llm_client.get(f"{gateway}/stats", read_timeout=2).json()
+            except Exception:
+                gw = None
+            if gw:
+                st.markdown("### 🚦 Vision Queue")
+                m = st.columns(4)
+                m[0].metric("Waiting Now", sum(b["queued"] for b in gw["backends"].values()))
+                m[1].metric("Running Now", sum(b["active"] for b in gw["backends"].values()))
+                m[2].metric("Duplicate Requests Merged", gw["coalesced"])
+                m[3].metric("Avg Wait", f"{gw['queued_seconds'] / gw['started']:.1f} s" if gw["started"] else "–")
+        
+        hib = database.get_hibernation_stats()
+        if hib['awake'] or hib['hibernated']:
+            st.markdown("### 💤 Hibernation")
+            m = st.columns(4)
+            m[0].metric("Awake", hib['awake'])
+            m[1].metric("Hibernated", hib['hibernated'])
+            m[2].metric("Memory Reclaimed", f"{hib['reclaimed_bytes'] / 2**20:.0f} MB")
+            m[3].metric("Avg Wake Time", f"{hib['avg_wake_ms'] / 1000:.1f} s" if hib['avg_wake_ms'] else "–")
+
+def render_performance():
+    """Where time goes in tutor turns, from the metrics every runner records."""
+    st.header("📈 Performance")
+    ctrl = st.columns([3, 1, 1])
+    tutor = ctrl[0].selectbox("Tutor", [None] + metrics.tutors(), format_func=lambda t: "All tutors" if t is None else t, key="perf_tutor")
+    ctrl[1].write("") # Spacer
+    if ctrl[1].button("Refresh", key="perf_refresh"):
+        st.rerun()
+    ctrl[2].write("") # Spacer
+    if ctrl[2].button("Reset Metrics", key="perf_reset"):
+        metrics.reset()
+        st.rerun()
+    
+    summary = metrics.summarize(tutor)
+    if not summary:
+        st.info("No tutor activity recorded yet.")
+        return
+    ops = {row["operation"]: row for row in summary}
+    counters = metrics.counter_totals(tutor)
+    m = st.columns(4)
+    answer = ops.get("answer")
+    m[0].metric("Answers", answer["calls"] if answer else 0)
+    m[1].metric("Avg Answer Time", f"{answer['avg_s']:.1f} s" if answer else "–")
+    m[2].metric("Answer Error Rate", f"{answer['error_rate']:.1%}" if answer else "–")
+    m[3].metric("Tokens Streamed", f"{int(counters.get('answer_tokens', 0) + counters.get('vision_tokens', 0)):,}")
+    
+    def seconds(value):
+        return "–" if value is None else ("> 180 s" if value == float("inf") else f"{value:g} s")
+    st.dataframe([{
+        "Operation": row["operation"],
+        "Calls": row["calls"],
+        "Errors": f"{row['error_rate']:.1%}",
+        "Avg": f"{row['avg_s'] * 1000:.0f} ms",
+        "p50 ≤": seconds(row["p50_s"]),
+        "p90 ≤": seconds(row["p90_s"]),
+        "p99 ≤": seconds(row["p99_s"]),
+        "Total": f"{row['total_s']:.1f} s",
+        "Avg Payload": f"{row['avg_bytes'] / 1024:.1f} KB" if row["avg_bytes"] else "–",
+    } for row in summary], hide_index=True, use_container_width=True)
+    port = int(load_system_settings().get("metrics_port", metrics.DEFAULT_PORT))
+    st.caption(f"Sorted by total time. Percentiles are histogram bucket bounds. Prometheus export: http://127.0.0.1:{port}/metrics" if port else "Sorted by total time. Percentiles are histogram bucket bounds. Prometheus export is off.")
+
 def render_student_workspace(user):
     username = user['username']
     config = load_config(username)
@@ -364,23 +570,22 @@ def render_student_workspace(user):
             with col1:
                 ollama_url = st.text_input("Ollama URL", value=config.get("ollama_url", DEFAULT_OLLAMA_URL))
             with col2:
-                # Dynamic Model Loading
+                # Model lists are cached for every session (discovery.py); the button forces a refresh
                 st.write("") # Spacer
                 st.write("") # Spacer
-                if st.form_submit_button("🔄 Load Models"):
-                    try:
-                        res = requests.get(f"{ollama_url}/api/tags", timeout=2)
-                        if res.status_code == 200:
-                            models = [m['name'] for m in res.json()['models']]
-                            st.session_state['ollama_models'] = models
-                            st.toast("Models Loaded!", icon="✅")
-                        else:
-                            st.toast("Failed to load models", icon="❌")
-                    except Exception as e:
-                        st.toast(f"Error: {e}", icon="❌")
+                refresh_models = st.form_submit_button("🔄 Load Models")
+            models = discovery.get_models(ollama_url, refresh=refresh_models, wait=False)
+            if refresh_models:
+                if models.error:
+                    st.toast(f"Failed to load models: {models.error}", icon="❌")
+                else:
+                    st.toast("Models Loaded!", icon="✅")
             
-            model_options = st.session_state.get('ollama_models', [config.get("ollama_model", "qwen3-vl:8b")])
-            ollama_model = st.selectbox("Select Ollama Model", model_options, index=0 if model_options else None)
+            current_model = config.get("ollama_model", "qwen3-vl:8b")
+            model_options = list(models.items or [])
+            if current_model not in model_options:
+                model_options.insert(0, current_model)
+            ollama_model = st.selectbox("Select Ollama Model", model_options, index=model_options.index(current_model))
             
             st.divider()
             
@@ -388,31 +593,18 @@ def render_student_workspace(user):
             allm_url = st.text_input("AnythingLLM URL", value=config.get("url", DEFAULT_ANYTHINGLLM_URL))
             allm_key = st.text_input("AnythingLLM API Key", value=config.get("api_key", ""), type="password")
             
-            if st.form_submit_button("🔍 Load Workspaces"):
-                 if not allm_key:
-                     st.warning("Please enter API Key first.")
-                 else:
-                    try:
-                        headers = {
-                            "Authorization": f"Bearer {allm_key}", 
-                            "accept": "application/json"
-                        }
-                        # Use correct endpoint to list workspaces
-                        res = requests.get(f"{allm_url}/workspaces", headers=headers, timeout=5)
-                        if res.status_code == 200:
-                             data = res.json()
-                             # Expecting {"workspaces": [{"slug": "...", "name": "..."}, ...]}
-                             workspaces = data.get("workspaces", [])
-                             slug_options = {w['slug']: f"{w['name']} ({w['slug']})" for w in workspaces}
-                             st.session_state['allm_workspaces'] = slug_options
-                             st.toast(f"Loaded {len(workspaces)} workspaces!", icon="✅")
-                        else:
-                             st.toast(f"Connection Failed: {res.status_code} - {res.text[:50]}", icon="⚠️")
-                    except Exception as e:
-                        st.toast(f"Error: {e}", icon="❌")
+            refresh_workspaces = st.form_submit_button("🔍 Load Workspaces")
+            workspaces = discovery.get_workspaces(allm_url, allm_key, refresh=refresh_workspaces, wait=False) if allm_key else None
+            if refresh_workspaces:
+                if not allm_key:
+                    st.warning("Please enter API Key first.")
+                elif workspaces.error:
+                    st.toast(f"Connection Failed: {workspaces.error[:80]}", icon="⚠️")
+                else:
+                    st.toast(f"Loaded {len(workspaces.items)} workspaces!", icon="✅")
 
             # Workspace selection dropdown
-            workspace_options = st.session_state.get('allm_workspaces', {})
+            workspace_options = {slug: f"{name} ({slug})" for slug, name in (workspaces.items or {}).items()} if workspaces else {}
             current_slug = config.get("slug", "default")
             
             # If current slug not in loaded list, add it manually to options so it shows up
@@ -427,6 +619,24 @@ def render_student_workspace(user):
             ) 
             allm_slug = selected_slug_key if selected_slug_key else st.text_input("Workspace Slug (Manual)", value=current_slug)
             
+            stream_responses = st.checkbox("Stream responses", value=config.get("stream_responses", True), help="Show the tutor's answer word by word as it is generated instead of waiting for the full reply.")
+            turn_deadline = st.number_input("Image Question Deadline (seconds)", min_value=20, max_value=600, value=int(config.get("turn_deadline", 150)), help="If image analysis runs past this budget, the tutor answers with what it has so far.")
+            col1, col2 = st.columns(2)
+            with col1:
+                image_max_side = st.number_input("Image Size Sent to Vision Model (px)", min_value=0, max_value=8192, value=int(config.get("image_max_side", 1536)), step=128, help="Photos are scaled down so their longer side is at most this many pixels before analysis. 0 sends the original upload.")
+            with col2:
+                st.write("") # Spacer
+                image_grayscale = st.checkbox("Analyse images in grayscale", value=config.get("image_grayscale", False), help="Smaller uploads and faster analysis. Suits worksheets and handwritten maths; leave off if colour matters.")
+            col1, col2 = st.columns(2)
+            with col1:
+                context_budget = st.number_input("Conversation Memory (tokens)", min_value=0, max_value=32000, value=int(config.get("context_budget", context_window.DEFAULT_CONTEXT_BUDGET)), step=250, help="How much of the recent conversation is sent with each question, so follow-ups make sense. 0 sends the question alone.")
+            with col2:
+                summary_budget = st.number_input("Summary of Older Messages (tokens)", min_value=0, max_value=4000, value=int(config.get("summary_budget", context_window.DEFAULT_SUMMARY_BUDGET)), step=50, help="Older messages are summarized in the background and the summary is sent too. Keeps long chats coherent at a fixed cost per question.")
+            use_response_cache = st.checkbox("Reuse answers to repeated questions", value=config.get("response_cache", True), help="When the opening question of a chat has already been answered by this workspace (for any student), reply instantly with the cached answer. With conversation memory on, follow-ups depend on the chat so far and are always answered fresh.")
+            if st.form_submit_button("🧹 Clear Cached Answers"):
+                response_cache.invalidate_workspace(allm_url, allm_slug)
+                st.toast("Cached answers for this workspace cleared.", icon="✅")
+            
             st.markdown("---")
             if st.form_submit_button("💾 Save Configuration", type="primary"):
                 new_config = {
@@ -436,7 +646,14 @@ def render_student_workspace(user):
                     "ollama_model": ollama_model,
                     "url": allm_url,
                     "api_key": allm_key,
-                    "slug": allm_slug
+                    "slug": allm_slug,
+                    "stream_responses": stream_responses,
+                    "turn_deadline": int(turn_deadline),
+                    "image_max_side": int(image_max_side),
+                    "image_grayscale": image_grayscale,
+                    "context_budget": int(context_budget),
+                    "summary_budget": int(summary_budget),
+                    "response_cache": use_response_cache
                 }
                 save_config(username, new_config)
                 st.success("Configuration Saved!")
@@ -446,17 +663,11 @@ def render_student_workspace(user):
         st.info("Publishing your app will launch it on a dedicated port, accessible to others on the network.")
         
         dep = database.get_deployment(user['id'])
-        is_running = False
-        if dep and dep['status'] == 'running':
-            try:
-                os.kill(dep['pid'], 0)
-                is_running = True
-            except:
-                pass
+        is_running = bool(dep) and (dep['status'] == 'hibernated' or (dep['status'] == 'running' and deployer.is_runner_alive(dep['pid'], dep.get('pid_started'))))
         
         if is_running:
             st.success(f"✅ App is Running!")
-            url = f"http://{SERVER_IP}:{dep['port']}"
+            url = get_app_url(dep)
             st.markdown(f"### 🔗 [Click to Open App]({url})")
             st.info("⚠️ Note: If URL not accessible, check if you are connected to the same network.")
             st.code(url, language="text")
@@ -468,6 +679,7 @@ def render_student_workspace(user):
             if st.button("▶️ Publish & Launch"):
                 with st.spinner("Launching your app..."):
                     port = start_student_app(user['id'], username)
+                if port is not None:
                     st.success(f"App launched on port {port}!")
                     time.sleep(1)
                     st.rerun()
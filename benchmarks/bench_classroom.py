@@ -0,0 +1,274 @@
+"""Load test: a simulated classroom using published tutors at once.
+
+Seeds N students with database.create_user, points their tutors at the local
+stub backends, publishes them through deployer.start_student_app (the call the
+dashboard's Publish button makes) and then drives one scripted browser session
+per student concurrently over the Streamlit websocket (see tutor_client.py):
+chat turns, image turns (upload + question), adding the last answer to the
+notebook (a background job since job_queue.py) and searching it.
+
+Reports publish latency, throughput, p50/p95/p99 per action and for the first
+answer text, runner memory per tutor (after publishing and at the peak of the
+load), and SQLite lock waits: a probe thread takes the write lock on each shared
+database every 50 ms and records how long it had to wait, and the tutors' own
+timings of their database writes are read back from metrics.py.
+
+Exits with status 1 if any session failed or chat p95 exceeds --max-p95, so it
+can gate a release before term starts.
+
+Usage: python benchmarks/bench_classroom.py --students 20 --turns 4 --image-every 2 --mode process
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import deployer
+import image_store
+import job_queue
+import metrics
+import response_cache
+from bench_publish import percentile
+from bench_serving import total_rss
+from stub_backend import StubBackend
+from tutor_client import TutorSession
+
+QUESTIONS = [
+    "How do I solve x^2 - 5x + 6 = 0?", "What does the discriminant tell me?", "Why is log(ab) = log a + log b?",
+    "How do I find the sum of an arithmetic sequence?", "When do I use the sine rule instead of the cosine rule?",
+    "What is the difference between mean and median?", "How do I complete the square?", "What is a radian?",
+    "How do I draw a probability tree?", "How do I find the equation of a circle through three points?",
+    "What is conditional probability?", "How do I use the remainder theorem?", "How do I solve 2^x = 10?",
+    "What is standard deviation used for?", "How do I find the locus of a moving point?",
+]
+PROBE_INTERVAL = 0.05
+TUTOR_DB_OPS = ("history_save", "notebook_add", "image_save", "config_load")
+
+
+def worksheet(index, size=(1600, 1200)):
+    """A deterministic worksheet photo; a few distinct ones, so some uploads are repeats."""
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    for line in range(20):
+        y = 60 + line * 55
+        draw.line((80, y, size[0] - 80, y), fill=(200, 200, 220), width=2)
+        draw.text((90, y - 30), f"Worksheet {index} - Question {line + 1}: solve for x", fill="black")
+    out = io.BytesIO()
+    img.save(out, "PNG")
+    return out.getvalue()
+
+
+class LockProbe(threading.Thread):
+    """Time how long it takes to get each database's write lock while the class is working."""
+
+    def __init__(self, paths):
+        super().__init__(name="lock-probe", daemon=True)
+        self.paths = paths
+        self.waits = {name: [] for name in paths}
+        self.busy = {name: 0 for name in paths}
+        self.stopped = threading.Event()
+
+    def run(self):
+        conns = {}
+        while not self.stopped.wait(PROBE_INTERVAL):
+            for name, path in self.paths.items():
+                if not os.path.exists(path):
+                    continue
+                if name not in conns:
+                    conns[name] = sqlite3.connect(path, timeout=database.BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+                start = time.perf_counter()
+                try:
+                    conns[name].execute("BEGIN IMMEDIATE")
+                    conns[name].execute("ROLLBACK")
+                except sqlite3.OperationalError:
+                    self.busy[name] += 1
+                    continue
+                self.waits[name].append(time.perf_counter() - start)
+        for conn in conns.values():
+            conn.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pids):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.pids = pids
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(0.5):
+            self.peak = max(self.peak, total_rss(self.pids))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_student(student, url, args, images, record):
+    rng = random.Random(args.seed + student['id'])
+    time.sleep(rng.uniform(0, args.ramp)) # Students don't all open the tutor in the same second
+    tab = TutorSession(url, timeout=args.timeout)
+    try:
+        record("open", tab.open())
+        for turn in range(args.turns):
+            image_turn = args.image_every and (turn + 1) % args.image_every == 0
+            if image_turn:
+                record("attach", tab.attach("worksheet.png", images[rng.randrange(len(images))]))
+            record("image turn" if image_turn else "chat turn", tab.chat(rng.choice(QUESTIONS)))
+            if tab.first_text is not None:
+                record("first text", tab.first_text)
+            if image_turn:
+                tab.detach()
+            time.sleep(rng.uniform(0, 2 * args.think))
+        record("notebook add", tab.click("📝 Add Last Q&A to Notebook"))
+        record("switch view", tab.select("View", "📓 Notebook"))
+        record("notebook search", tab.type("🔍 Search notebook", rng.choice(["discriminant", "log", "probability"])))
+    finally:
+        tab.close()
+
+
+def print_table(title, rows, unit="s", scale=1):
+    print(f"\n{title:<18}{'n':>6}{f'p50 {unit}':>10}{f'p95 {unit}':>10}{f'p99 {unit}':>10}{f'max {unit}':>10}")
+    for label, values in rows:
+        values = [v * scale for v in values]
+        print(f"{label:<18}{len(values):>6}{percentile(values, 50):>10.2f}{percentile(values, 95):>10.2f}"
+              f"{percentile(values, 99):>10.2f}{max(values, default=float('nan')):>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=4, help="chat turns per student")
+    parser.add_argument("--image-every", type=int, default=2, help="every Nth turn attaches a worksheet photo (0 = never)")
+    parser.add_argument("--mode", default="process", choices=deployer.SERVING_MODES)
+    parser.add_argument("--hibernate", action="store_true", help="publish behind the front proxy (process mode)")
+    parser.add_argument("--gateway", action="store_true", help="send vision requests through the LLM gateway")
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub seconds to first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="stub seconds per token")
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--megapixel-delay", type=float, default=0.5, help="stub vision seconds per image megapixel")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds a student pauses between turns")
+    parser.add_argument("--ramp", type=float, default=5.0, help="students open their tutor within this many seconds")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds before an action counts as failed")
+    parser.add_argument("--max-p95", type=float, default=None, help="fail if chat turn p95 exceeds this many seconds")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_load_")
+    os.chdir(workdir)
+    database.init_db()
+    deployer.set_warm_pool_size(args.pool_size)
+    stub = StubBackend(latency=args.latency, token_delay=args.token_delay, answer_tokens=args.answer_tokens).start()
+    stub.megapixel_delay = args.megapixel_delay
+    stub.contention = True
+    students, failures = [], []
+    timings = {}
+    timings_lock = threading.Lock()
+
+    def record(action, seconds):
+        with timings_lock:
+            timings.setdefault(action, []).append(seconds)
+
+    try:
+        if args.gateway:
+            deployer.ensure_gateway()
+        publish = []
+        for i in range(args.students):
+            username = f"load_{i}"
+            database.create_user(username, "pw", "student", f"Student {i}")
+            student = database.get_user_by_username(username)
+            os.makedirs(os.path.join("data", username), exist_ok=True)
+            with open(os.path.join("data", username, "config.json"), "w", encoding="utf-8") as f:
+                json.dump({"url": stub.anythingllm_url, "api_key": "load", "slug": "default", "ollama_url": stub.ollama_url}, f)
+            start = time.perf_counter()
+            deployer.start_student_app(student['id'], username, mode=args.mode, hibernate=args.hibernate and args.mode == "process")
+            publish.append(time.perf_counter() - start)
+            students.append(student)
+        deployments = {s['id']: database.get_deployment(s['id']) for s in students}
+        urls = {uid: f"http://127.0.0.1:{dep['port']}{deployer.get_app_path(dep)}" for uid, dep in deployments.items()}
+        pids = [dep['pid'] for dep in deployments.values()]
+        time.sleep(1) # Let imports settle before sampling memory
+        idle_rss = total_rss(pids)
+
+        probe = LockProbe({
+            "platform": database.DB_FILE, "response_cache": response_cache.CACHE_DB,
+            "images": image_store.IMAGE_DB, "metrics": metrics.METRICS_DB, "jobs": job_queue.JOBS_DB,
+        })
+        sampler = MemorySampler(pids)
+        probe.start()
+        sampler.start()
+        images = [worksheet(i) for i in range(3)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.students) as pool:
+            futures = {pool.submit(run_student, s, urls[s['id']], args, images, record): s for s in students}
+            for future, student in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    failures.append((student['username'], f"{type(e).__name__}: {e}"))
+                    traceback.print_exc()
+        wall = time.perf_counter() - start
+        probe.stop()
+        sampler.stop()
+        time.sleep(metrics.FLUSH_INTERVAL + 1) # Let the runners flush their own timings
+
+        turns = len(timings.get("chat turn", [])) + len(timings.get("image turn", []))
+        actions = sum(len(v) for k, v in timings.items() if k not in ("first text",))
+        print(f"{args.students} students, mode={args.mode}{' (hibernate)' if args.hibernate else ''}{' + gateway' if args.gateway else ''}, "
+              f"{args.turns} turns each, stub latency {args.latency}s + {args.token_delay}s/token")
+        print_table("publish", [("publish", publish)])
+        print_table("action", [(k, timings[k]) for k in ("open", "chat turn", "image turn", "first text", "attach", "notebook add", "switch view", "notebook search") if k in timings])
+        print(f"\nthroughput: {turns / wall:.2f} tutor turns/s, {actions / wall:.2f} actions/s over {wall:.1f} s")
+        print(f"memory: {idle_rss / 2**20 / args.students:.0f} MB/tutor after publishing, {sampler.peak / 2**20 / args.students:.0f} MB/tutor at peak "
+              f"({sampler.peak / 2**20:.0f} MB total)")
+        print_table("lock wait (probe)", [(name, waits) for name, waits in probe.waits.items() if waits], unit="ms", scale=1000)
+        if any(probe.busy.values()):
+            print("busy (lock not acquired within the timeout): " + ", ".join(f"{k}={v}" for k, v in probe.busy.items() if v))
+        tutor_side = {row["operation"]: row for row in metrics.summarize()}
+        print(f"\n{'tutor-side db op':<18}{'calls':>6}{'avg ms':>10}{'p99 ≤ s':>10}")
+        for op in TUTOR_DB_OPS:
+            if op in tutor_side:
+                row = tutor_side[op]
+                print(f"{op:<18}{row['calls']:>6}{row['avg_s'] * 1000:>10.1f}{row['p99_s']:>10g}")
+        print(f"\nstub: {stub.requests} requests, {stub.generate_requests} vision calls, peak {stub.generate_peak} concurrent")
+        if failures:
+            print(f"\n{len(failures)} sessions failed:")
+            for username, error in failures:
+                print(f"  {username}: {error}")
+        chat_p95 = percentile(timings.get("chat turn", []), 95)
+        if args.max_p95 is not None and chat_p95 > args.max_p95:
+            print(f"\nchat turn p95 {chat_p95:.2f}s exceeds --max-p95 {args.max_p95}s")
+            failures.append(("p95", chat_p95))
+    finally:
+        for student in students:
+            deployer.stop_student_app(student['id'])
+        deployer.stop_hub()
+        deployer.stop_proxy()
+        deployer.stop_gateway()
+        deployer.runner_pool.shutdown()
+        stub.stop()
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
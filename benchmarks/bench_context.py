@@ -0,0 +1,120 @@
+"""Prompt size and per-turn latency over long chats, with and without the context window.
+
+Plays --turns question/answer turns against the stub backend, whose chat
+endpoint takes --prefill seconds per 1000 prompt characters (a model reading
+its prompt), for three ways of building the prompt:
+
+  - "question": the latest question only (what the tutor sent before);
+  - "full": the whole conversation in front of the question;
+  - "window": context_window.ConversationContext, recent turns within the
+    budget plus a rolling summary folded in the background.
+
+Reports the prompt tokens and the turn time at checkpoints, the per-turn cost
+of building the prompt, and how many summary folds ran. The window's cost
+should stay flat from the first few turns on, while "full" grows with the chat.
+
+Usage: python benchmarks/bench_context.py --turns 200 --budget 1500 --summary 300
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import context_window
+from context_window import ConversationContext, estimate_tokens
+from llm_client import call_anythingllm_chat
+from stub_backend import StubBackend
+
+QUESTIONS = [
+    "How do I find the discriminant of {n}x^2 + 5x - 3 = 0?",
+    "Why does a negative discriminant mean there are no real roots for question {n}?",
+    "Can you check my working for part ({n}): I got x = 2 and x = -1.5",
+    "What is the next step after completing the square in example {n}?",
+    "是不是判别式等于零时只有一个实根？第{n}题",
+]
+
+
+def full_prompt(history, question):
+    lines = "\n".join(f"{context_window.ROLES[m['role']]}: {m['content']}" for m in history)
+    return f"Conversation so far:\n{lines}\n\nStudent's new message:\n{question}" if history else question
+
+
+def play(stub, mode, turns, budget, summary):
+    allm = (stub.anythingllm_url, "", "bench")
+    context = ConversationContext("bench", allm, budget, summary, tutor="bench")
+    messages = []
+    rows = []
+    for n in range(turns):
+        question = QUESTIONS[n % len(QUESTIONS)].format(n=n + 1)
+        start = time.perf_counter()
+        if mode == "question":
+            prompt = question
+        elif mode == "full":
+            prompt = full_prompt(messages, question)
+        else:
+            prompt = context.build_prompt(messages, question)
+        build = time.perf_counter() - start
+        answer = call_anythingllm_chat(*allm, prompt)
+        rows.append((estimate_tokens(prompt), build, time.perf_counter() - start))
+        messages.append({"role": "user", "content": question})
+        messages.append({"role": "assistant", "content": answer})
+    context.wait(60)
+    return rows, context
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--budget", type=int, default=context_window.DEFAULT_CONTEXT_BUDGET, help="context_budget tokens")
+    parser.add_argument("--summary", type=int, default=context_window.DEFAULT_SUMMARY_BUDGET, help="summary_budget tokens")
+    parser.add_argument("--prefill", type=float, default=0.01, help="stub seconds per 1000 prompt characters")
+    parser.add_argument("--answer-words", type=int, default=120)
+    args = parser.parse_args()
+
+    text = "Complete the square: x^2 + 6x + 5 = (x + 3)^2 - 4, so x = -1 or x = -5. " * 20
+    start = time.perf_counter()
+    for _ in range(10000):
+        estimate_tokens(text)
+    print(f"estimate_tokens(): {(time.perf_counter() - start) / 10000 * 1e6:.2f} µs for a {len(text)}-character message")
+
+    checkpoints = sorted({t for t in (1, 10, 25, 50, 100, 150, args.turns) if t <= args.turns})
+    workdir = tempfile.mkdtemp(prefix="bench_context_") # Summary folds record metrics under data/
+    os.chdir(workdir)
+    try:
+        with StubBackend(latency=0.02, answer_tokens=args.answer_words) as stub:
+            stub.prefill_delay = args.prefill
+            results = {}
+            for mode in ("question", "full", "window"):
+                results[mode] = play(stub, mode, args.turns, args.budget, args.summary)
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{args.turns} turns, budget {args.budget} + summary {args.summary} tokens, prefill {args.prefill * 1000:.0f} ms per 1000 characters")
+    print(f"{'turn':>6}" + "".join(f"{mode + ' tok':>14}{mode + ' ms':>13}" for mode in results))
+    for turn in checkpoints:
+        row = f"{turn:>6}"
+        for rows, _ in results.values():
+            tokens, _, seconds = rows[turn - 1]
+            row += f"{tokens:>14,}{seconds * 1000:>13.1f}"
+        print(row)
+
+    print(f"\n{'':<10}{'max tok':>9}{'first 20 ms':>13}{'last 20 ms':>12}{'build µs':>10}")
+    for mode, (rows, _) in results.items():
+        first = statistics.median(r[2] for r in rows[:20]) * 1000
+        last = statistics.median(r[2] for r in rows[-20:]) * 1000
+        build = statistics.median(r[1] for r in rows) * 1e6
+        print(f"{mode:<10}{max(r[0] for r in rows):>9,}{first:>13.1f}{last:>12.1f}{build:>10.1f}")
+    rows, context = results["window"]
+    cap = args.budget + args.summary + max(estimate_tokens(q.format(n=args.turns)) for q in QUESTIONS) + 50
+    print(f"\nwindow: {context.folds} summary folds in the background, {context.covered} of {2 * args.turns} messages summarized, "
+          f"summary {estimate_tokens(context.summary)} tokens; prompts {'within' if max(r[0] for r in rows) <= cap else 'OVER'} the {cap:,}-token cap")
+
+
+if __name__ == "__main__":
+    main()
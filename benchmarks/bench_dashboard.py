@@ -0,0 +1,95 @@
+"""Teacher dashboard data cost: per-student lookups vs one paged, joined query.
+
+Seeds classes of 30, 300 and 3,000 students (half of them with a running
+deployment) and times what the Student Management tab does on every rerun:
+first the old way (get_all_students, then get_deployment and an os.kill probe
+per student), then the new way (count_students + one page of
+get_students_with_deployments, liveness as recorded by the supervisor).
+
+Usage: python benchmarks/bench_dashboard.py --sizes 30 300 3000 --page-size 50
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+def seed(size):
+    database.init_db()
+    conn = database.get_connection()
+    now = datetime.now().isoformat()
+    # Password hashing is not what we are measuring, so insert rows directly
+    conn.executemany(
+        "INSERT INTO users (username, password, role, name, created_at) VALUES (?, 'x', 'student', ?, ?)",
+        [(f"student{i}", f"Student {i}", now) for i in range(size)]
+    )
+    ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'student'")]
+    live_pid = os.getpid()
+    conn.executemany(
+        "INSERT INTO deployments (user_id, port, pid, status, mode) VALUES (?, ?, ?, 'running', 'process')",
+        [(user_id, 9000 + n, live_pid if n % 4 else 999999) for n, user_id in enumerate(ids[::2])]
+    )
+    conn.commit()
+
+
+def legacy_render():
+    rows = []
+    for s in database.get_all_students():
+        dep = database.get_deployment(s['id'])
+        running = False
+        if dep and dep['status'] == 'running':
+            try:
+                os.kill(dep['pid'], 0)
+                running = True
+            except OSError:
+                pass
+        rows.append((s, running))
+    return rows
+
+
+def paged_render(page_size):
+    database.count_students()
+    return [(s, s['dep_status'] == 'running' and s['dep_health'] == 'healthy')
+            for s in database.get_students_with_deployments(limit=page_size)]
+
+
+def time_it(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[30, 300, 3000])
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    try:
+        print(f"median ms per dashboard rerun ({args.repeats} runs, page size {args.page_size})")
+        print(f"{'students':>9}{'per-row':>10}{'paged':>10}")
+        for size in args.sizes:
+            database.DB_FILE = os.path.join(workdir, f"class_{size}.db")
+            seed(size)
+            legacy = time_it(legacy_render, args.repeats)
+            paged = time_it(lambda: paged_render(args.page_size), args.repeats)
+            print(f"{size:>9}{legacy:>10.2f}{paged:>10.2f}")
+    finally:
+        database.close_connections()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""SQLite contention: per-call connections vs the pooled WAL connection manager.
+
+Simulates R runner processes repeatedly reading their user and deployment rows
+while a dashboard process keeps writing deployment updates, first with the old
+connect-per-call / rollback-journal behaviour and then with database.py's
+thread-local WAL connections.
+
+Usage: python benchmarks/bench_db_contention.py --readers 50 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+STUDENTS = 200
+
+
+def legacy_connect():
+    # What every database.py function used to do: a fresh connection per call
+    conn = sqlite3.connect(database.DB_FILE)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def use_mode(mode, db_file):
+    database.DB_FILE = db_file
+    if mode == "legacy":
+        database.get_connection = legacy_connect
+
+
+def reader(mode, db_file, seconds, user_id, results):
+    use_mode(mode, db_file)
+    latencies, errors = [], 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            database.get_user_by_id(user_id)
+            database.get_deployment(user_id)
+        except sqlite3.OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+    results.put(("read", latencies, errors))
+
+
+def writer(mode, db_file, seconds, results):
+    use_mode(mode, db_file)
+    latencies, errors = [], 0
+    deadline = time.time() + seconds
+    i = 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            user_id = i % STUDENTS + 2
+            database.update_deployment(user_id, 9000 + user_id, 1000 + i)
+        except sqlite3.OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        i += 1
+    results.put(("write", latencies, errors))
+
+
+def seed(mode, db_file):
+    use_mode(mode, db_file)
+    database.init_db()
+    conn = sqlite3.connect(db_file)
+    conn.execute(f"PRAGMA journal_mode={'DELETE' if mode == 'legacy' else 'WAL'}")
+    conn.close()
+    for i in range(STUDENTS):
+        database.create_user(f"s{i}", "pw", "student", f"S {i}")
+
+
+def run(mode, workdir, readers, seconds):
+    db_file = os.path.join(workdir, f"{mode}.db")
+    ctx = multiprocessing.get_context("spawn")
+    seed_proc = ctx.Process(target=seed, args=(mode, db_file))
+    seed_proc.start()
+    seed_proc.join()
+
+    results = ctx.Queue()
+    procs = [ctx.Process(target=reader, args=(mode, db_file, seconds, i % STUDENTS + 2, results)) for i in range(readers)]
+    procs.append(ctx.Process(target=writer, args=(mode, db_file, seconds, results)))
+    for p in procs:
+        p.start()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    reads = [l for kind, lat, _ in collected if kind == "read" for l in lat]
+    writes = [l for kind, lat, _ in collected if kind == "write" for l in lat]
+    read_errors = sum(e for kind, _, e in collected if kind == "read")
+    write_errors = sum(e for kind, _, e in collected if kind == "write")
+    return reads, writes, read_errors, write_errors
+
+
+def p99(values):
+    return statistics.quantiles(values, n=100)[-1] * 1000 if len(values) > 1 else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    try:
+        print(f"{args.readers} readers + 1 writer for {args.seconds:.0f}s")
+        print(f"{'mode':<8}{'reads/s':>10}{'read p99 ms':>13}{'writes/s':>10}{'write p99 ms':>14}{'errors':>8}")
+        for mode in ("legacy", "pooled"):
+            reads, writes, read_errors, write_errors = run(mode, workdir, args.readers, args.seconds)
+            print(f"{mode:<8}{len(reads) / args.seconds:>10.0f}{p99(reads):>13.2f}{len(writes) / args.seconds:>10.0f}{p99(writes):>14.2f}{read_errors + write_errors:>8}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
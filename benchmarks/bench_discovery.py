@@ -0,0 +1,76 @@
+"""Model and workspace lists in the App Designer: per-session fetches vs the shared discovery cache.
+
+Simulates a class of students opening the App Designer at the same time and
+pressing around it for a while. Each render needs the Ollama model list and
+the AnythingLLM workspace list. The old code fetched both from the backends
+for every session (on each Load press); discovery.py serves all sessions from
+one cache with stale-while-revalidate refreshes. The stub's catalog endpoints
+answer after `--latency` seconds, like a busy GPU box.
+
+Reports render latency (time spent getting both lists) and backend requests.
+
+Usage: python benchmarks/bench_discovery.py --students 30 --renders 10 --latency 0.3
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import discovery
+import llm_client
+from bench_publish import percentile
+from stub_backend import StubBackend
+
+
+def legacy_lists(ollama_url, allm_url, api_key):
+    # What the App Designer used to do on Load Models / Load Workspaces
+    models = [m['name'] for m in llm_client.get(f"{ollama_url}/api/tags", read_timeout=2).json()['models']]
+    workspaces = llm_client.get(f"{allm_url}/workspaces", read_timeout=5, headers={"Authorization": f"Bearer {api_key}"}).json()['workspaces']
+    return models, workspaces
+
+
+def cached_lists(ollama_url, allm_url, api_key):
+    return discovery.get_models(ollama_url).items, discovery.get_workspaces(allm_url, api_key).items
+
+
+def session(lists, stub, renders, pause, times):
+    for _ in range(renders):
+        start = time.perf_counter()
+        models, workspaces = lists(stub.ollama_url, stub.anythingllm_url, "key")
+        assert models and workspaces
+        times.append((time.perf_counter() - start) * 1000)
+        time.sleep(pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--renders", type=int, default=10, help="App Designer renders per student")
+    parser.add_argument("--pause", type=float, default=0.2, help="seconds between renders")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--fresh-for", type=float, default=1.0, help="discovery.FRESH_FOR for the run (seconds)")
+    args = parser.parse_args()
+
+    discovery.FRESH_FOR = args.fresh_for
+    llm_client.configure(pool_size=args.students)
+    with StubBackend() as stub:
+        stub.catalog_latency = args.latency
+        print(f"{args.students} students x {args.renders} renders, catalog latency {args.latency * 1000:.0f} ms")
+        print(f"{'lists':<10}{'requests':>10}{'p50 ms':>9}{'p90 ms':>9}{'max ms':>9}{'wall s':>8}")
+        for label, lists in (("per-press", legacy_lists), ("cached", cached_lists)):
+            stub.catalog_requests = 0
+            times = []
+            threads = [threading.Thread(target=session, args=(lists, stub, args.renders, args.pause, times)) for _ in range(args.students)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            wall = time.perf_counter() - start
+            print(f"{label:<10}{stub.catalog_requests:>10}{percentile(times, 50):>9.1f}{percentile(times, 90):>9.1f}{max(times):>9.1f}{wall:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""A class uploading images at once: direct to Ollama vs through the LLM gateway.
+
+Every student sends a streaming vision request at the same moment against the
+stub backend in contention mode (concurrent requests share one GPU, like a real
+Ollama box). A third of the class photographs the same worksheet (identical
+requests), and one student fires off several questions in a row. Runs the burst
+once straight at the backend and once through an in-process gateway.
+
+Reports the most requests the backend had in progress at once, how many it
+served, failed requests (read timeouts), completion time for the students who
+asked once vs the student who asked many times, and the queue positions the
+students were shown.
+
+Usage: python benchmarks/bench_gateway.py --students 30 --concurrency 2 --read-timeout 30
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import llm_client
+from bench_publish import percentile
+from llm_gateway import GatewayServer
+from stub_backend import StubBackend
+
+
+def ask(stub, gateway, student, prompt, image, read_timeout, results):
+    positions = []
+    start = time.perf_counter()
+    text = "".join(llm_client.stream_ollama_generate(
+        stub.ollama_url, "qwen3-vl:8b", prompt, image_b64=image, read_timeout=read_timeout,
+        gateway=gateway, client_id=student, on_queue=positions.append
+    ))
+    results.append((student, time.perf_counter() - start, "[Vision Error]" in text, positions))
+
+
+def burst(stub, gateway, args):
+    stub.generate_requests = stub.generate_peak = 0
+    results = []
+    threads = []
+    for i in range(args.students):
+        student = f"student{i}"
+        if i == 0:
+            asks = [(f"Question {q} about my photo", f"own{q}") for q in range(args.greedy)]
+        elif i % 3 == 0:
+            asks = [("Describe this image", "worksheet")] # Same photo, same prompt: identical request
+        else:
+            asks = [("Describe this image", f"own-photo-{i}")]
+        for prompt, image in asks:
+            threads.append(threading.Thread(target=ask, args=(stub, gateway, student, prompt, image, args.read_timeout, results)))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--greedy", type=int, default=5, help="requests sent by the one impatient student")
+    parser.add_argument("--concurrency", type=int, default=2, help="gateway requests per backend at once")
+    parser.add_argument("--latency", type=float, default=0.4, help="stub seconds to first token for one request alone")
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--read-timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    llm_client.configure(pool_size=args.students + args.greedy, max_retries=0)
+    with StubBackend(latency=args.latency, token_delay=args.token_delay, answer_tokens=40) as stub, GatewayServer(concurrency=args.concurrency, backends=[stub.ollama_url]) as gateway:
+        stub.contention = True
+        print(f"{args.students} students at once, gateway concurrency {args.concurrency}")
+        print(f"{'route':<9}{'peak':>6}{'served':>8}{'failed':>8}{'once p50 s':>12}{'once p90 s':>12}{'greedy last s':>15}{'max pos':>9}")
+        for label, url in (("direct", None), ("gateway", gateway.url)):
+            results = burst(stub, url, args)
+            once = [elapsed for student, elapsed, failed, _ in results if student != "student0"]
+            greedy = [elapsed for student, elapsed, failed, _ in results if student == "student0"]
+            failed = sum(1 for _, _, f, _ in results if f)
+            max_position = max((max(p) for *_, p in results if p), default=0)
+            print(f"{label:<9}{stub.generate_peak:>6}{stub.generate_requests:>8}{failed:>8}"
+                  f"{percentile(once, 50):>12.1f}{percentile(once, 90):>12.1f}{max(greedy):>15.1f}{max_position:>9}")
+        print(f"gateway counters: {gateway.gateway.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Idle hibernation across a simulated class: memory reclaimed and wake latency.
+
+Publishes N tutors behind the front proxy, leaves K of them "in use" and lets
+the supervisor's idle reaper hibernate the rest. Reports the runner memory
+before and after, then visits each hibernated tutor through its public port and
+measures how long the first request takes to be answered (the proxy holds it
+while the runner starts), both as seen by the client and as recorded by the proxy.
+
+Usage: python benchmarks/bench_hibernation.py --tutors 8 --active 2
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import psutil
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import deployer
+import supervisor
+from bench_publish import percentile
+
+
+def runner_rss(user_ids):
+    total = 0
+    for uid in user_ids:
+        dep = database.get_deployment(uid)
+        if dep and dep['status'] == 'running' and deployer.is_runner_alive(dep['pid'], dep['pid_started']):
+            total += psutil.Process(dep['pid']).memory_info().rss
+    return total
+
+
+def wait_for_proxy(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/_stcore/health", timeout=1)
+            return True
+        except requests.RequestException:
+            time.sleep(0.1)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tutors", type=int, default=8)
+    parser.add_argument("--active", type=int, default=2, help="tutors kept in use (not hibernated)")
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    os.chdir(workdir)
+    database.init_db()
+    deployer.set_warm_pool_size(args.pool_size)
+    user_ids = []
+    try:
+        for i in range(args.tutors):
+            database.create_user(f"hib_{i}", "pw", "student", f"Student {i}")
+            user = database.get_user_by_username(f"hib_{i}")
+            user_ids.append(user['id'])
+            deployer.start_student_app(user['id'], user['username'], hibernate=True)
+        public_ports = {uid: database.get_deployment(uid)['port'] for uid in user_ids}
+        for port in public_ports.values():
+            wait_for_proxy(port)
+
+        before = runner_rss(user_ids)
+        active, idle = user_ids[:args.active], user_ids[args.active:]
+        conn = database.get_connection()
+        conn.executemany("UPDATE deployments SET last_active = '2000-01-01T00:00:00' WHERE user_id = ?", [(uid,) for uid in idle])
+        conn.commit()
+        database.touch_deployments(active)
+
+        reaper = supervisor.Supervisor(idle_timeout=60)
+        reaped = reaper.reap_idle()
+        after = runner_rss(user_ids)
+        stats = database.get_hibernation_stats()
+
+        print(f"{args.tutors} tutors published, {args.active} in use")
+        print(f"runner memory before: {before / 2**20:8.0f} MB")
+        print(f"runner memory after:  {after / 2**20:8.0f} MB  ({len(reaped)} hibernated)")
+        print(f"reclaimed (recorded): {stats['reclaimed_bytes'] / 2**20:8.0f} MB")
+
+        time.sleep(2) # Let the proxy pick up the hibernated routes and its pool warm up
+        client_ms = []
+        for uid in idle:
+            start = time.perf_counter()
+            response = requests.get(f"http://127.0.0.1:{public_ports[uid]}/_stcore/health", timeout=60)
+            client_ms.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200
+        proxy_ms = [database.get_deployment(uid)['last_wake_ms'] for uid in idle]
+        proxy_ms = [ms for ms in proxy_ms if ms is not None]
+        print(f"{'wake latency':<14}{'n':>4}{'p50 ms':>9}{'p90 ms':>9}{'max ms':>9}")
+        print(f"{'client':<14}{len(client_ms):>4}{percentile(client_ms, 50):>9.0f}{percentile(client_ms, 90):>9.0f}{max(client_ms, default=0):>9.0f}")
+        print(f"{'proxy':<14}{len(proxy_ms):>4}{percentile(proxy_ms, 50):>9.0f}{percentile(proxy_ms, 90):>9.0f}{max(proxy_ms, default=0):>9.0f}")
+    finally:
+        for uid in user_ids:
+            deployer.stop_student_app(uid)
+        deployer.stop_proxy()
+        deployer.runner_pool.shutdown()
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
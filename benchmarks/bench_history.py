@@ -0,0 +1,68 @@
+"""Sidebar history listing: full JSON scan vs the session index.
+
+Creates a user with N sessions of M messages each and times one sidebar
+render's worth of work for the old glob + json.load scan and for
+history_store.list_sessions.
+
+Usage: python benchmarks/bench_history.py --sessions 500 --messages 40
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import history_store
+
+
+def legacy_scan(history_dir):
+    files = glob.glob(os.path.join(history_dir, "*.json"))
+    files.sort(key=os.path.getmtime, reverse=True)
+    titles = []
+    for fpath in files:
+        with open(fpath, "r", encoding="utf-8") as f:
+            titles.append(json.load(f).get("title", "Untitled Chat"))
+    return titles
+
+
+def best_of(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=40)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    os.chdir(workdir)
+    try:
+        messages = []
+        for i in range(args.messages):
+            role = "user" if i % 2 == 0 else "assistant"
+            messages.append({"role": role, "content": f"Message {i} " + "lorem ipsum " * 40})
+        for i in range(args.sessions):
+            history_store.save_session("bench", f"session-{i:05d}", messages)
+
+        history_dir = history_store.get_history_dir("bench")
+        print(f"{args.sessions} sessions x {args.messages} messages")
+        print(f"  legacy glob + json.load scan : {best_of(lambda: legacy_scan(history_dir)):9.2f} ms")
+        print(f"  index, first page (30)       : {best_of(lambda: history_store.list_sessions('bench', 30)):9.2f} ms")
+        print(f"  index, all sessions          : {best_of(lambda: history_store.list_sessions('bench', args.sessions)):9.2f} ms")
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
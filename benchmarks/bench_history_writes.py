@@ -0,0 +1,59 @@
+"""Bytes written per turn: full-file rewrite vs the append-only journal.
+
+Simulates a conversation of N turns (one user and one assistant message each)
+and reports bytes written by the turn at several conversation lengths, plus
+the total, for the old indent=2 JSON rewrite and for history_store.
+
+Usage: python benchmarks/bench_history_writes.py --turns 200
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import history_store
+
+
+def legacy_bytes(messages):
+    # What the old save_session wrote on every turn
+    data = {"id": "s", "title": "t", "updated_at": "2024-01-01T00:00:00", "messages": messages}
+    return len(json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    os.chdir(workdir)
+    history_store.FSYNC_POLICY = "never"
+    try:
+        journal = history_store._journal_file(history_store.get_history_dir("bench"), "s")
+        messages = []
+        legacy_total = journal_total = 0
+        checkpoints = {1, 10, 50, 100, args.turns}
+        print(f"{'turn':>6}{'rewrite B/turn':>16}{'journal B/turn':>16}")
+        for turn in range(1, args.turns + 1):
+            messages.append({"role": "user", "content": f"Question {turn}: " + "why is the sky blue? " * 5})
+            messages.append({"role": "assistant", "content": f"Answer {turn}: " + "Rayleigh scattering. " * 30})
+            before = os.path.getsize(journal) if os.path.exists(journal) else 0
+            history_store.save_session("bench", "s", messages)
+            written = os.path.getsize(journal) - before
+            rewrite = legacy_bytes(messages)
+            legacy_total += rewrite
+            journal_total += written
+            if turn in checkpoints:
+                print(f"{turn:>6}{rewrite:>16,}{written:>16,}")
+        print(f"{'total':>6}{legacy_total:>16,}{journal_total:>16,}")
+        assert history_store.load_session("bench", "s")[0] == messages
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
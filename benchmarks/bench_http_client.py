@@ -0,0 +1,64 @@
+"""Per-call overhead of bare requests.post vs the pooled llm_client session.
+
+Runs N chat calls against the local stub backend, first opening a new
+connection per call (the old behaviour) and then through llm_client.
+
+Usage: python benchmarks/bench_http_client.py --calls 500
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import llm_client
+from stub_backend import StubBackend
+
+
+def bare_chat(base_url, slug, message):
+    url = f"{base_url}/workspace/{slug}/chat"
+    response = requests.post(url, json={"message": message, "mode": "chat"}, headers={"Authorization": "Bearer x"}, timeout=60)
+    response.raise_for_status()
+    return response.json().get("textResponse")
+
+
+def pooled_chat(base_url, slug, message):
+    return llm_client.call_anythingllm_chat(base_url, "x", slug, message)
+
+
+def measure(fn, base_url, calls):
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(base_url, "default", f"question {i}")
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=300)
+    args = parser.parse_args()
+
+    with StubBackend() as stub:
+        # Warm both paths once so imports and DNS are not counted
+        bare_chat(stub.anythingllm_url, "default", "warmup")
+        pooled_chat(stub.anythingllm_url, "default", "warmup")
+
+        print(f"{'client':<10}{'calls':>7}{'mean ms':>10}{'p50 ms':>9}{'p95 ms':>9}")
+        for label, fn in (("bare", bare_chat), ("pooled", pooled_chat)):
+            samples = measure(fn, stub.anythingllm_url, args.calls)
+            p95 = statistics.quantiles(samples, n=20)[-1]
+            print(f"{label:<10}{len(samples):>7}{statistics.mean(samples):>10.3f}{statistics.median(samples):>9.3f}{p95:>9.3f}")
+
+        # Retries: the first two POSTs fail with 503 and should be retried transparently
+        stub.fail_next = 2
+        answer = pooled_chat(stub.anythingllm_url, "default", "retry check")
+        print(f"retry on 503: {'ok' if not answer.startswith('[RAG Error]') else answer}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Image uploads across a class: disk saved by content addressing and vision calls avoided.
+
+Replays a class working through worksheets: most students photograph one of a
+few shared worksheets (sending the identical file the teacher handed out),
+some upload a photo of their own, and each asks a couple of questions about
+their image. Every question runs as a real image turn against the stub
+backend. Reports the disk the old one-file-per-upload layout would have used
+against the content-addressed store, how many uploads needed the vision model,
+and the time from upload to a full description for a new vs an already-described
+image (saving the upload included).
+
+Usage: python benchmarks/bench_image_cache.py --students 30 --worksheets 3 --latency 0.5
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import image_store
+from pipeline import ImageTurn
+from stub_backend import StubBackend
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--worksheets", type=int, default=3, help="distinct shared worksheet images")
+    parser.add_argument("--own-photos", type=float, default=0.2, help="share of students uploading their own photo")
+    parser.add_argument("--questions", type=int, default=2, help="questions per student about their image")
+    parser.add_argument("--image-kb", type=int, default=800)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub seconds to first vision token")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    png_header = b"\x89PNG\r\n\x1a\n"
+    worksheets = [png_header + rng.randbytes(args.image_kb * 1024) for _ in range(args.worksheets)]
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    os.chdir(workdir)
+    legacy_bytes = 0
+    cold_ms, warm_ms = [], []
+    try:
+        with StubBackend(latency=args.latency, token_delay=0.005) as stub:
+            config = {"ollama_url": stub.ollama_url, "url": stub.anythingllm_url, "turn_deadline": 120}
+            for student in range(args.students):
+                if rng.random() < args.own_photos:
+                    image = png_header + rng.randbytes(args.image_kb * 1024)
+                else:
+                    image = rng.choice(worksheets)
+                for q in range(args.questions):
+                    before = stub.generate_requests
+                    start = time.perf_counter()
+                    turn = ImageTurn(config, image, f"Question {q} from student {student}", stub.ollama_url, stub.anythingllm_url)
+                    image_store.save_image(image)
+                    legacy_bytes += len(image) # The old layout wrote a new uuid file per upload
+                    turn.wait_vision()
+                    elapsed = (time.perf_counter() - start) * 1000
+                    assert not turn.partial, turn.description
+                    (cold_ms if stub.generate_requests > before else warm_ms).append(elapsed)
+                    turn.finish()
+            vision_calls = stub.generate_requests
+
+        stats = image_store.stats()
+        stored = directory_size(image_store.IMAGE_DIR)
+        turns = len(cold_ms) + len(warm_ms)
+        print(f"{turns} image questions from {args.students} students, {stats['images']} distinct images")
+        print(f"disk, one file per upload:     {legacy_bytes / 2**20:8.1f} MB")
+        print(f"disk, content-addressed:       {stored / 2**20:8.1f} MB  (saved {stats['saved_bytes'] / 2**20:.1f} MB)")
+        print(f"vision model calls:            {vision_calls} instead of {turns}  ({stats['vision_calls_avoided']} avoided)")
+        print(f"upload to description, new:    p50 {statistics.median(cold_ms):7.1f} ms")
+        print(f"upload to description, cached: p50 {statistics.median(warm_ms) if warm_ms else float('nan'):7.1f} ms")
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Vision payload size and latency: raw uploads vs preprocessed images.
+
+Builds a corpus of sample uploads like the ones students send: 12 MP phone
+photos (some rotated via EXIF), photographed worksheets and phone screenshots.
+For each, sends the raw bytes and the preprocessed image (image_prep.py, in
+colour and grayscale) through the streaming vision call to the stub backend,
+which charges `--megapixel-delay` seconds per image megapixel to model the
+vision model's cost per pixel.
+
+Reports the base64 payload size, preprocessing + encode time and end-to-end
+vision latency per image kind.
+
+Usage: python benchmarks/bench_image_prep.py --per-kind 4 --megapixel-delay 0.05
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import image_prep
+import llm_client
+from stub_backend import StubBackend
+
+
+def phone_photo(rng):
+    img = Image.linear_gradient("L").resize((4032, 3024)).convert("RGB")
+    noise = Image.effect_noise((4032, 3024), rng.randint(20, 40)).convert("RGB")
+    img = Image.blend(img, noise, 0.3).filter(ImageFilter.GaussianBlur(1))
+    exif = img.getexif()
+    exif[image_prep.ORIENTATION_TAG] = rng.choice([1, 6])
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+
+def worksheet(rng):
+    img = Image.new("L", (3024, 4032), 235)
+    draw = ImageDraw.Draw(img)
+    for line in range(60):
+        draw.text((150, 150 + line * 62), f"{line + 1}. Solve {rng.randint(2, 9)}x^2 + {rng.randint(1, 20)}x - {rng.randint(1, 50)} = 0", fill=30)
+    noise = Image.effect_noise(img.size, 25)
+    img = Image.blend(img, noise, 0.15).convert("RGB")
+    exif = img.getexif()
+    exif[image_prep.ORIENTATION_TAG] = rng.choice([1, 6, 8])
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+
+def screenshot(rng):
+    img = Image.new("RGB", (1170, 2532), "white")
+    draw = ImageDraw.Draw(img)
+    for line in range(80):
+        draw.text((40, 40 + line * 30), f"Q{line}: f(x) = {rng.randint(1, 9)}sin(x) + {rng.randint(1, 9)}", fill=(20, 20, 20))
+    out = io.BytesIO()
+    img.save(out, "PNG")
+    return out.getvalue()
+
+
+def vision_once(stub, image_bytes, prepare):
+    start = time.perf_counter()
+    if prepare:
+        image_bytes = image_prep.prepare_for_vision(image_bytes, **prepare)
+    image_b64 = llm_client.encode_image(image_bytes)
+    prepared = time.perf_counter() - start
+    text = "".join(llm_client.stream_ollama_generate(stub.ollama_url, "m", "Describe", image_b64=image_b64))
+    assert "Error" not in text, text
+    return len(image_b64), prepared, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--per-kind", type=int, default=4, help="sample images of each kind")
+    parser.add_argument("--max-side", type=int, default=image_prep.DEFAULT_MAX_SIDE)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--megapixel-delay", type=float, default=0.05, help="stub seconds per image megapixel")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = {kind: [make(rng) for _ in range(args.per_kind)] for kind, make in
+              (("phone photo", phone_photo), ("worksheet", worksheet), ("screenshot", screenshot))}
+    variants = {
+        "raw": None,
+        "resized": {"max_side": args.max_side},
+        "resized+gray": {"max_side": args.max_side, "grayscale": True},
+    }
+    with StubBackend(latency=args.latency, token_delay=0.0) as stub:
+        stub.megapixel_delay = args.megapixel_delay
+        print(f"{'kind':<13}{'variant':<14}{'payload MB':>11}{'prep+b64 ms':>13}{'vision ms':>11}")
+        for kind, images in corpus.items():
+            for label, prepare in variants.items():
+                sizes, prep_ms, total_ms = [], [], []
+                for image in images:
+                    size, prepared, total = vision_once(stub, image, prepare)
+                    sizes.append(size / 2**20)
+                    prep_ms.append(prepared * 1000)
+                    total_ms.append(total * 1000)
+                print(f"{kind:<13}{label:<14}{statistics.mean(sizes):>11.2f}{statistics.median(prep_ms):>13.0f}{statistics.median(total_ms):>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
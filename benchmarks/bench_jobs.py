@@ -0,0 +1,137 @@
+"""Background job queue (job_queue.py): page blocking, throughput, and recovery after a runner dies.
+
+1. Time the page is blocked by "Add Last Q&A to Notebook": the synchronous
+   summary call it used to make versus enqueueing the job.
+2. Enqueue --jobs summary jobs for --tutors tutors and let --processes
+   worker processes (stand-ins for tutor runners, each with job_queue.WORKERS
+   threads) drain them against a stub backend with --latency seconds per
+   answer. Reports jobs/s and queue wait percentiles.
+3. Kill a worker process (SIGKILL) while it is running jobs, start a new
+   one, and check that every job still finishes and lands in its notebook exactly once.
+
+Usage: python benchmarks/bench_jobs.py --jobs 200 --tutors 20 --processes 4 --latency 0.5
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import job_queue
+import llm_client
+import tutor_jobs
+from bench_publish import percentile
+from llm_client import call_anythingllm_chat
+from notebook_store import count_entries
+from stub_backend import StubBackend
+
+
+def worker_process():
+    llm_client.configure() # Don't share the parent's pooled connections across the fork
+    job_queue.start_workers()
+    while True:
+        time.sleep(1)
+
+
+def start_workers(ctx, count):
+    processes = [ctx.Process(target=worker_process, daemon=True) for _ in range(count)]
+    for p in processes:
+        p.start()
+    return processes
+
+
+def wait_done(job_ids, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        jobs = [job_queue.get(job_id) for job_id in job_ids]
+        if all(job["status"] not in job_queue.ACTIVE for job in jobs):
+            return jobs
+        time.sleep(0.2)
+    raise SystemExit(f"jobs still running after {timeout} s")
+
+
+def write_configs(stub, tutors):
+    """Point every tutor at the stub: jobs read the backend from config.json when they run."""
+    for i in range(tutors):
+        os.makedirs(os.path.join("data", f"tutor{i}"), exist_ok=True)
+        with open(os.path.join("data", f"tutor{i}", "config.json"), "w", encoding="utf-8") as f:
+            json.dump({"url": stub.anythingllm_url, "api_key": "", "slug": "bench"}, f)
+
+
+def enqueue(tutors, jobs, tag):
+    return [tutor_jobs.add_qa(f"tutor{i % tutors}", f"{tag} question {i}: factorise x^2 + {i}x", "Worked answer. " * 30)
+            for i in range(jobs)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--tutors", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub seconds per answer")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_jobs_")
+    os.chdir(workdir)
+    ctx = multiprocessing.get_context("fork")
+    try:
+        with StubBackend(latency=args.latency) as stub:
+            allm = (stub.anythingllm_url, "", "bench")
+            write_configs(stub, args.tutors)
+
+            # 1. Page blocking
+            start = time.perf_counter()
+            call_anythingllm_chat(*allm, tutor_jobs.SUMMARY_PROMPT.format(question="q", answer="a"))
+            sync = time.perf_counter() - start
+            start = time.perf_counter()
+            job_id = tutor_jobs.add_qa("tutor0", "q", "a")
+            queued = time.perf_counter() - start
+            job_queue.cancel(job_id)
+            print(f"page blocked: {sync * 1000:.0f} ms calling the backend, {queued * 1000:.1f} ms enqueueing")
+
+            # 2. Throughput
+            job_ids = enqueue(args.tutors, args.jobs, "load")
+            start = time.perf_counter()
+            processes = start_workers(ctx, args.processes)
+            jobs = wait_done(job_ids, args.jobs * args.latency + 120)
+            elapsed = time.perf_counter() - start
+            for p in processes:
+                p.kill()
+            waits = sorted(job["updated_at"] - job["created_at"] for job in jobs)
+            done = sum(job["status"] == job_queue.DONE for job in jobs)
+            workers = args.processes * job_queue.WORKERS
+            print(f"{args.jobs} jobs, {args.processes} processes x {job_queue.WORKERS} workers: {done} done in {elapsed:.1f} s, "
+                  f"{args.jobs / elapsed:.1f} jobs/s (ideal {workers / args.latency:.1f})")
+            print(f"enqueue to done: p50 {percentile(waits, 50):.1f} s, p95 {percentile(waits, 95):.1f} s, max {waits[-1]:.1f} s")
+
+            # 3. A runner dies mid-job
+            job_ids = enqueue(args.tutors, args.tutors * 2, "restart")
+            victim = start_workers(ctx, 1)[0]
+            while not any(job_queue.get(job_id)["status"] == job_queue.RUNNING for job_id in job_ids):
+                time.sleep(0.05)
+            time.sleep(args.latency / 2)
+            os.kill(victim.pid, signal.SIGKILL)
+            victim.join()
+            orphaned = sum(job_queue.get(job_id)["status"] == job_queue.RUNNING for job_id in job_ids)
+            start = time.perf_counter()
+            processes = start_workers(ctx, 1)
+            jobs = wait_done(job_ids, len(job_ids) * args.latency + 120)
+            for p in processes:
+                p.kill()
+            entries = sum(count_entries(f"tutor{t}", query="restart") for t in range(args.tutors))
+            done = sum(job["status"] == job_queue.DONE for job in jobs)
+            print(f"runner killed with {orphaned} jobs running: {done}/{len(job_ids)} done by its replacement in {time.perf_counter() - start:.1f} s, "
+                  f"{entries} notebook entries ({'no duplicates' if entries == len(job_ids) else 'MISMATCH'})")
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Metrics overhead on the hot path, and the cost of aggregating it across runners.
+
+Measures, per call, what metrics.timer() and metrics.timed_stream() add over
+the bare operation; then starts --processes worker processes (stand-ins for
+tutor runners) that each record --turns turns for their tutors and flush to a
+shared metrics.db, and checks nothing is lost or double counted. Finally it
+times summarize() and render_prometheus() on the combined store, as the
+Performance tab and a Prometheus scrape would.
+
+Usage: python benchmarks/bench_metrics.py --processes 8 --tutors 30 --turns 2000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics
+
+OPS = ["answer", "retrieval", "vision", "history_save", "notebook_search"]
+
+
+def per_call(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def worker(args):
+    index, processes, tutors, turns, seed = args
+    rng = random.Random(seed + index)
+    names = [f"tutor{t}" for t in range(index, tutors, processes)]
+    start = time.perf_counter()
+    for i in range(turns):
+        tutor = names[i % len(names)]
+        op = OPS[i % len(OPS)]
+        metrics.observe(op, rng.lognormvariate(-1, 1.2), tutor, error=rng.random() < 0.02, size=rng.randint(200, 4000))
+        metrics.count("answer_tokens", 150, tutor)
+    record = time.perf_counter() - start
+    start = time.perf_counter()
+    metrics.flush()
+    return record, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--tutors", type=int, default=30)
+    parser.add_argument("--turns", type=int, default=2000, help="turns recorded per process")
+    parser.add_argument("--calls", type=int, default=100000, help="calls for the per-call overhead loops")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_metrics_")
+    os.chdir(workdir)
+    try:
+        # Hot path overhead
+        def bare():
+            pass
+        def timed():
+            with metrics.timer("answer", "tutor0") as t:
+                t.size = 1200
+        base = per_call(bare, args.calls)
+        timer_cost = per_call(timed, args.calls) - base
+        tokens = [f"tok{i} " for i in range(args.calls)]
+        start = time.perf_counter()
+        for _ in iter(tokens):
+            pass
+        bare_stream = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in metrics.timed_stream("answer", iter(tokens), "tutor0"):
+            pass
+        stream_cost = (time.perf_counter() - start - bare_stream) / args.calls
+        metrics.reset()
+        print(f"timer(): {timer_cost * 1e6:.2f} µs per call")
+        print(f"timed_stream(): {stream_cost * 1e6:.2f} µs per token")
+
+        # Cross-process aggregation
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(args.processes) as pool:
+            results = pool.map(worker, [(i, args.processes, args.tutors, args.turns, args.seed) for i in range(args.processes)])
+        records = [r for r, _ in results]
+        flushes = [f for _, f in results]
+        expected = args.processes * args.turns
+        summary = metrics.summarize()
+        recorded = sum(row["calls"] for row in summary)
+        tokens_total = metrics.counter_totals().get("answer_tokens", 0)
+        print(f"{args.processes} processes x {args.turns} turns: recorded {recorded}/{expected} calls, {tokens_total:,.0f}/{expected * 150:,} tokens")
+        print(f"recording: {max(records) / args.turns * 1e6:.2f} µs per turn (slowest process)")
+        print(f"flush: max {max(flushes) * 1000:.1f} ms per process")
+        assert recorded == expected and tokens_total == expected * 150, "metrics lost or double counted"
+
+        # Reading
+        start = time.perf_counter()
+        summary = metrics.summarize()
+        summarize_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        text = metrics.render_prometheus()
+        render_ms = (time.perf_counter() - start) * 1000
+        print(f"summarize(): {summarize_ms:.1f} ms for {len(summary)} operations")
+        print(f"render_prometheus(): {render_ms:.1f} ms, {len(text) / 1024:.0f} KB, {text.count(chr(10))} lines ({len(metrics.tutors())} tutors)")
+        for row in summary:
+            print(f"  {row['operation']:<16} calls={row['calls']:<6} avg={row['avg_s']:.2f}s p50<={row['p50_s']}s p99<={row['p99_s']}s errors={row['error_rate']:.1%}")
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Notebook render and mutation latency: notebook.json vs notebook_store.
+
+Seeds a notebook with N entries and times the work one Notebook-tab render
+does (load + newest-first ordering) and single-entry add / retitle / delete,
+for the old JSON file and for the SQLite store. Also times a full-text search.
+
+Usage: python benchmarks/bench_notebook.py --entries 5000
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import notebook_store
+
+TOPICS = ["quadratic equations", "trigonometry", "probability", "vectors", "calculus", "logarithms", "sequences"]
+
+
+def make_entries(n):
+    start = datetime(2024, 1, 1)
+    entries = []
+    for i in range(n):
+        topic = TOPICS[i % len(TOPICS)]
+        entries.append({
+            "id": str(uuid.uuid4()),
+            "timestamp": (start + timedelta(minutes=i)).isoformat(),
+            "title": f"{topic} mistake {i}",
+            "question": f"Question {i} about {topic}: " + "solve for x " * 10,
+            "answer": f"Answer {i}: " + "step by step working " * 20,
+            "summary": f"Remember the key idea of {topic} #{i}",
+        })
+    return entries
+
+
+# --- Old notebook.json behaviour (as runner.py used to do it) ---
+
+def legacy_load(path):
+    with open(path, "r", encoding="utf-8") as f:
+        notebook = json.load(f)
+    notebook.sort(key=lambda x: x['timestamp'], reverse=True)
+    return notebook
+
+def legacy_save(path, notebook):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(notebook, f, ensure_ascii=False, indent=2)
+
+def legacy_add(path):
+    notebook = legacy_load(path)
+    notebook.append(make_entries(1)[0])
+    legacy_save(path, notebook)
+
+def legacy_retitle(path, entry_id):
+    notebook = legacy_load(path)
+    for n in notebook:
+        if n['id'] == entry_id:
+            n['title'] = "renamed"
+    legacy_save(path, notebook)
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=5000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    os.chdir(workdir)
+    try:
+        entries = make_entries(args.entries)
+        os.makedirs("data/legacy", exist_ok=True)
+        legacy_path = "data/legacy/notebook.json"
+        legacy_save(legacy_path, entries)
+
+        # The store imports notebook.json on first open, like a real migration
+        os.makedirs("data/store", exist_ok=True)
+        shutil.copy(legacy_path, "data/store/notebook.json")
+        start = time.perf_counter()
+        notebook_store.count_entries("store")
+        migrate_ms = (time.perf_counter() - start) * 1000
+
+        target = entries[len(entries) // 2]['id']
+        rows = [
+            ("render: load + order", timed(lambda: legacy_load(legacy_path)), timed(lambda: notebook_store.list_entries("store"))),
+            ("render: first page (20)", timed(lambda: legacy_load(legacy_path)[:20]), timed(lambda: notebook_store.list_entries("store", limit=20))),
+            ("add one entry", timed(lambda: legacy_add(legacy_path)), timed(lambda: notebook_store.add_to_notebook("store", "q", "a", "s"))),
+            ("retitle one entry", timed(lambda: legacy_retitle(legacy_path, target)), timed(lambda: notebook_store.update_notebook_entry_title("store", target, "renamed"))),
+            ("search 'trigonometry'", timed(lambda: [n for n in legacy_load(legacy_path) if "trigonometry" in json.dumps(n)]), timed(lambda: notebook_store.list_entries("store", query="trigonometry"))),
+        ]
+        print(f"{args.entries} entries (one-time import: {migrate_ms:.0f} ms)")
+        print(f"{'operation':<26}{'json ms':>10}{'sqlite ms':>11}")
+        for label, legacy_ms, store_ms in rows:
+            print(f"{label:<26}{legacy_ms:>10.2f}{store_ms:>11.2f}")
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
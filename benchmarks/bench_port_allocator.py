@@ -0,0 +1,120 @@
+"""Port allocation under concurrent publishes: connect-probe scan vs the reserved port range.
+
+Starts N publisher processes that all pick a port at the same moment, listen on
+it (standing in for the runner) and record their deployment. The old allocator
+scans upward from the first port with connect_ex, so publishers that probe
+before anyone has started listening pick the same port. The new one reserves
+ports transactionally in the database and bind-tests them.
+
+Reports collisions (two publishers given one port), failed binds and the
+median / worst allocation time. Exits non-zero if the new allocator collides.
+
+Usage: python benchmarks/bench_port_allocator.py --publishers 200
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import deployer
+
+FIRST_PORT = 21000 # away from the real runner range so a live platform is not disturbed
+
+
+def legacy_get_free_port():
+    # What deployer.get_free_port used to do
+    conn = database.get_connection()
+    active_ports = [row[0] for row in conn.execute("SELECT port FROM deployments WHERE status = 'running'")]
+    port = FIRST_PORT
+    while True:
+        if port not in active_ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            result = sock.connect_ex(('127.0.0.1', port))
+            sock.close()
+            if result != 0:
+                return port
+        port += 1
+
+
+def publisher(mode, user_id, barrier, done, results):
+    barrier.wait()
+    start = time.perf_counter()
+    if mode == "legacy":
+        port = legacy_get_free_port()
+    else:
+        port = deployer.allocate_port(f"user:{user_id}")
+    elapsed = time.perf_counter() - start
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind(("0.0.0.0", port))
+        sock.listen()
+        bound = True
+    except OSError:
+        bound = False
+    database.update_deployment(user_id, port, os.getpid())
+    results.put((port, bound, elapsed))
+    done.wait() # Keep listening until every publisher has picked its port
+    sock.close()
+
+
+def run(mode, workdir, publishers):
+    database.DB_FILE = os.path.join(workdir, f"{mode}.db")
+    database.PORT_RANGE_START = FIRST_PORT
+    database.PORT_RANGE_END = FIRST_PORT + publishers * 2
+    database.init_db()
+    for i in range(publishers):
+        database.create_user(f"s{i}", "pw", "student", f"S {i}")
+    user_ids = [s['id'] for s in database.get_all_students()]
+    database.close_connections()
+
+    ctx = multiprocessing.get_context("fork")
+    barrier = ctx.Barrier(publishers)
+    done = ctx.Event()
+    results = ctx.Queue()
+    procs = [ctx.Process(target=publisher, args=(mode, uid, barrier, done, results)) for uid in user_ids]
+    for p in procs:
+        p.start()
+    collected = [results.get() for _ in procs]
+    done.set()
+    for p in procs:
+        p.join()
+
+    ports = Counter(port for port, _, _ in collected)
+    collisions = sum(count - 1 for count in ports.values() if count > 1)
+    failed_binds = sum(1 for _, bound, _ in collected if not bound)
+    times = [elapsed * 1000 for _, _, elapsed in collected]
+    return collisions, failed_binds, statistics.median(times), max(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--publishers", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    try:
+        print(f"{args.publishers} concurrent publishes")
+        print(f"{'allocator':<10}{'collisions':>12}{'bind fails':>12}{'median ms':>11}{'max ms':>9}")
+        outcome = {}
+        for mode in ("legacy", "reserved"):
+            outcome[mode] = run(mode, workdir, args.publishers)
+            collisions, failed_binds, median, worst = outcome[mode]
+            print(f"{mode:<10}{collisions:>12}{failed_binds:>12}{median:>11.2f}{worst:>9.2f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if outcome["reserved"][0] or outcome["reserved"][1]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
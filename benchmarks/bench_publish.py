@@ -0,0 +1,77 @@
+"""Publish-to-ready latency with and without the warm runner pool.
+
+Publishes N tutors one after another through deployer.start_student_app (which
+waits on the health probe) and reports latency percentiles for a cold launch
+(pool size 0) and a warm pool of K workers.
+
+Usage: python benchmarks/bench_publish.py --tutors 10 --pool-size 4
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import deployer
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(label, pool_size, n, pause):
+    deployer.set_warm_pool_size(pool_size)
+    # Let the pool finish warming up before the class starts publishing
+    deadline = time.time() + 60
+    while deployer.runner_pool.idle_count() < pool_size and time.time() < deadline:
+        time.sleep(0.1)
+    time.sleep(2 if pool_size else 0)
+
+    latencies = []
+    students = []
+    try:
+        for i in range(n):
+            username = f"pub_{label}_{i}"
+            database.create_user(username, "pw", "student", username)
+            s = database.get_user_by_username(username)
+            students.append(s)
+            start = time.perf_counter()
+            deployer.start_student_app(s['id'], s['username'])
+            latencies.append(time.perf_counter() - start)
+            time.sleep(pause)
+    finally:
+        for s in students:
+            deployer.stop_student_app(s['id'])
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tutors", type=int, default=6)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds between publishes (gives the pool time to refill)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    os.chdir(workdir)
+    database.init_db()
+    try:
+        print(f"{'pool':<12}{'n':>4}{'p50 s':>8}{'p90 s':>8}{'p99 s':>8}{'max s':>8}")
+        for label, size in (("cold", 0), (f"warm(K={args.pool_size})", args.pool_size)):
+            lat = run(label.split("(")[0], size, args.tutors, args.pause)
+            print(f"{label:<12}{len(lat):>4}{percentile(lat, 50):>8.2f}{percentile(lat, 90):>8.2f}{percentile(lat, 99):>8.2f}{max(lat):>8.2f}")
+    finally:
+        deployer.runner_pool.shutdown()
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Practice questions from the precomputed question bank versus generating them on every click.
+
+Seeds a notebook with --entries entries spread over --topics topics (added as
+the summary job adds them, so each one is queued for questions), then:
+
+  - "on demand": one LLM call per "Generate Questions" click for a selection of
+    --select entries (what the Practice tab did before the bank);
+  - "bank": runs the bank jobs (tutor_jobs.build_bank) that fill the bank
+    in the background, counting LLM calls against entries to show the
+    batching, then times serving a selection from the bank;
+  - invalidation: edits and deletes a few entries and checks that exactly
+    their questions are dropped and only the edited ones are regenerated.
+
+The stub backend answers after --latency seconds.
+
+Usage: python benchmarks/bench_question_bank.py --entries 60 --topics 8 --clicks 20 --latency 0.5
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import job_queue
+import tutor_jobs
+from llm_client import call_anythingllm_chat
+from notebook_store import (add_to_notebook, delete_notebook_entry, list_entries, list_questions, pending_questions,
+                            update_notebook_entry_title)
+from stub_backend import StubBackend
+
+TOPICS = [
+    "quadratic equations discriminant roots", "logarithm laws change of base", "probability conditional independent events",
+    "trigonometry sine cosine identities", "differentiation chain rule product", "integration substitution area",
+    "vectors dot product angle", "binomial expansion coefficients", "arithmetic geometric sequences sum", "circle equation tangent",
+]
+TUTOR = "bank_student"
+
+
+def drain(timeout=600):
+    """Run queued jobs in this process until none is left (the tutor's workers would do this)."""
+    deadline = time.time() + timeout
+    while job_queue.active_count(TUTOR) and time.time() < deadline:
+        if not job_queue.run_one():
+            time.sleep(0.05)
+
+
+def build(stub):
+    calls = len(stub.prompt_chars)
+    start = time.perf_counter()
+    tutor_jobs.fill_bank(TUTOR, delay=0)
+    drain()
+    return len(stub.prompt_chars) - calls, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=60)
+    parser.add_argument("--topics", type=int, default=8)
+    parser.add_argument("--select", type=int, default=3, help="entries selected per practice click")
+    parser.add_argument("--clicks", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="stub seconds per answer")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="bench_bank_")
+    os.chdir(workdir)
+    job_queue.RETRY_DELAY = 0.1
+    try:
+        with StubBackend(latency=args.latency) as stub:
+            allm = (stub.anythingllm_url, "", "bench")
+            os.makedirs(os.path.join("data", TUTOR), exist_ok=True)
+            with open(os.path.join("data", TUTOR, "config.json"), "w", encoding="utf-8") as f:
+                json.dump({"url": allm[0], "api_key": allm[1], "slug": allm[2]}, f) # Read by the bank jobs
+            for i in range(args.entries):
+                topic = TOPICS[i % min(args.topics, len(TOPICS))]
+                add_to_notebook(TUTOR, f"Question {i} on {topic}", "Worked answer. " * 20, f"{topic.capitalize()}: check step {i % 5 + 1} carefully")
+            entries = list_entries(TUTOR)
+            selections = [rng.sample([e['id'] for e in entries], args.select) for _ in range(args.clicks)]
+            print(f"{args.entries} entries over {args.topics} topics, {args.clicks} practice clicks of {args.select} entries, {args.latency} s per LLM answer\n")
+
+            # On demand: one LLM call per click
+            times = []
+            for ids in selections:
+                start = time.perf_counter()
+                chosen = [e for e in entries if e['id'] in ids]
+                context_text = "".join(f"\n---\nTopic: {e['title']}\nMistake/Key Point: {e['summary']}\nOriginal Q: {e['question']}\n" for e in chosen)
+                call_anythingllm_chat(*allm, tutor_jobs.PRACTICE_PROMPT.format(context=context_text))
+                times.append(time.perf_counter() - start)
+            print(f"on demand: {statistics.median(times) * 1000:8.1f} ms per click, {args.clicks} LLM calls")
+
+            # Bank: filled in the background, served from SQLite
+            calls, seconds = build(stub)
+            banked = {row["entry_id"] for row in list_questions(TUTOR)}
+            print(f"bank fill: {calls} LLM calls for {len(banked)}/{args.entries} entries ({args.entries / max(calls, 1):.1f} entries per call), {seconds:.1f} s in the background")
+            times = []
+            for ids in selections:
+                start = time.perf_counter()
+                served = list_questions(TUTOR, ids)
+                times.append(time.perf_counter() - start)
+                assert {row["entry_id"] for row in served} == set(ids), "selection not fully banked"
+            print(f"bank:      {statistics.median(times) * 1000:8.2f} ms per click, 0 LLM calls")
+
+            # Invalidation
+            edited = [e['id'] for e in entries[:3]]
+            deleted = [e['id'] for e in entries[3:6]]
+            for entry_id in edited:
+                update_notebook_entry_title(TUTOR, entry_id, "Edited title")
+            for entry_id in deleted:
+                delete_notebook_entry(TUTOR, entry_id)
+            stale = list_questions(TUTOR, edited + deleted)
+            waiting = {e['id'] for e in pending_questions(TUTOR)}
+            calls, _ = build(stub)
+            regenerated = {row["entry_id"] for row in list_questions(TUTOR, edited)}
+            ok = not stale and waiting == set(edited) and regenerated == set(edited)
+            print(f"\nedit {len(edited)} + delete {len(deleted)} entries: {len(stale)} stale questions left, {len(waiting)} entries re-queued, "
+                  f"{calls} LLM calls to regenerate ({'ok' if ok else 'MISMATCH'})")
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Tutor rerun latency with and without the process-level cache (tutor_cache.py).
+
+Builds a student with a large chat history and notebook, then reruns
+runner.py in Streamlit's AppTest harness, as a click in the browser would.
+"cold" empties the cache before every rerun (what each rerun did before the
+cache); "cached" keeps it. Reports the per-rerun time of the data loads alone
+(user, config, history list, a page of the notebook) and of the whole
+script run, plus cache misses per rerun. Then reruns each view and counts the
+widgets it builds, which stays bounded however large the notebook grows.
+
+Usage: python benchmarks/bench_rerun.py --sessions 500 --entries 300 --reruns 20
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import tutor_cache
+from history_store import count_sessions, list_sessions, save_session
+from notebook_store import add_to_notebook, list_entries
+
+RUNNER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "runner.py")
+HISTORY_PAGE_SIZE = 30
+NOTEBOOK_PAGE_SIZE = 20
+
+
+def seed(username, sessions, entries):
+    os.makedirs(os.path.join("data", username), exist_ok=True)
+    with open(os.path.join("data", username, "config.json"), "w", encoding="utf-8") as f:
+        json.dump({"app_title": "Maths Tutor", "url": "http://127.0.0.1:9/api/v1", "ollama_url": "http://127.0.0.1:9"}, f)
+    for i in range(sessions):
+        messages = [
+            {"role": "user", "content": f"Question {i} about quadratic equations and the discriminant"},
+            {"role": "assistant", "content": "A worked answer. " * 40},
+        ]
+        save_session(username, f"session-{i:05d}", messages)
+    for i in range(entries):
+        add_to_notebook(username, f"Question {i}: solve x^2 - {i}x + 6 = 0", "Worked answer. " * 30, f"Key point {i}: check the discriminant first")
+
+
+def data_loads(user_id, username):
+    # What every rerun of runner.py reads before drawing anything
+    user = tutor_cache.cached("user", "id", lambda: database.get_user_by_id(user_id), ttl=10, args=(str(user_id),))
+    config_file = os.path.join("data", username, "config.json")
+    tutor_cache.cached("config", username, lambda: json.load(open(config_file, encoding="utf-8")), paths=(config_file,))
+    sessions = list_sessions(user["username"], limit=HISTORY_PAGE_SIZE)
+    if len(sessions) == HISTORY_PAGE_SIZE:
+        count_sessions(username)
+    list_entries(username, limit=NOTEBOOK_PAGE_SIZE) # Notebook view
+
+
+def time_loads(user_id, username, reruns, cold):
+    times = []
+    for _ in range(reruns):
+        if cold:
+            tutor_cache.invalidate()
+        start = time.perf_counter()
+        data_loads(user_id, username)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def app_test(user_id):
+    from streamlit.testing.v1 import AppTest
+    sys.argv = [RUNNER, f"user_id={user_id}"]
+    at = AppTest.from_file(RUNNER, default_timeout=120)
+    at.run()
+    return at
+
+
+def count_widgets(at):
+    return sum(len(getattr(at, kind)) for kind in ("button", "text_input", "multiselect", "radio", "chat_input", "selectbox"))
+
+
+def time_views(user_id, reruns):
+    at = app_test(user_id)
+    results = []
+    for view in at.radio(key="view").options:
+        at.radio(key="view").set_value(view).run()
+        times = []
+        for _ in range(reruns):
+            start = time.perf_counter()
+            at.run()
+            times.append(time.perf_counter() - start)
+            assert not at.exception, at.exception
+        results.append((view, statistics.median(times), count_widgets(at)))
+    return results
+
+
+def time_reruns(user_id, reruns, cold):
+    at = app_test(user_id)
+    times = []
+    before = tutor_cache.stats()["misses"]
+    for _ in range(reruns):
+        if cold:
+            tutor_cache.invalidate()
+        start = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - start)
+        assert not at.exception, at.exception
+    return times, (tutor_cache.stats()["misses"] - before) / reruns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--entries", type=int, default=300)
+    parser.add_argument("--reruns", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    os.chdir(workdir)
+    database.init_db()
+    try:
+        database.create_user("rerun_student", "pw", "student", "Rerun Student")
+        user = database.get_user_by_username("rerun_student")
+        seed(user['username'], args.sessions, args.entries)
+        print(f"{args.sessions} chat sessions, {args.entries} notebook entries, {args.reruns} reruns")
+        print(f"{'':<8}{'data loads ms':>15}{'full rerun ms':>15}{'cache misses/rerun':>20}")
+        for label, cold in (("cold", True), ("cached", False)):
+            loads = time_loads(user['id'], user['username'], args.reruns, cold)
+            reruns, misses = time_reruns(user['id'], args.reruns, cold)
+            print(f"{label:<8}{statistics.median(loads) * 1000:>15.2f}{statistics.median(reruns) * 1000:>15.1f}{misses:>20.1f}")
+        print(f"\n{'view':<14}{'rerun ms':>10}{'widgets':>9}")
+        for view, seconds, widgets in time_views(user['id'], args.reruns):
+            print(f"{view:<14}{seconds * 1000:>10.1f}{widgets:>9}")
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
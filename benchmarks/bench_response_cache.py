@@ -0,0 +1,98 @@
+"""Answer cache on a replayed class question log: hit rate and backend time saved.
+
+Generates a deterministic log of a class asking questions of one workspace:
+a pool of common questions asked with Zipf-like popularity, often with
+different capitalisation, spacing or punctuation. Each student is replayed as
+if in their own runner process (the in-memory LRU is cleared between
+students), so repeats are served from the shared SQLite store. Halfway through,
+a document is added to the workspace, which must invalidate cached answers.
+
+Usage: python benchmarks/bench_response_cache.py --students 30 --questions 10 --latency 0.3
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import response_cache
+from stub_backend import StubBackend
+
+TOPICS = [
+    "quadratic equations", "the discriminant", "completing the square", "logarithms", "exponential growth",
+    "arithmetic sequences", "geometric sequences", "sine rule", "cosine rule", "radian measure",
+    "probability trees", "conditional probability", "standard deviation", "the median", "linear programming",
+    "equations of circles", "loci", "polynomials", "the remainder theorem", "inequalities",
+]
+TEMPLATES = ["What is {}?", "Can you explain {}?", "How do I use {} in an exam question?"]
+
+
+def build_log(students, questions, seed):
+    rng = random.Random(seed)
+    pool = [t.format(topic) for topic in TOPICS for t in TEMPLATES]
+    weights = [1 / (rank + 1) for rank in range(len(pool))]
+    log = []
+    for student in range(students):
+        for _ in range(questions):
+            q = rng.choices(pool, weights)[0]
+            variant = rng.random()
+            if variant < 0.2:
+                q = q.lower()
+            elif variant < 0.3:
+                q = q.rstrip("?") + " ??"
+            elif variant < 0.4:
+                q = "  " + q.replace(" ", "  ")
+            log.append((student, q))
+    return log
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub seconds to first token")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    os.chdir(workdir)
+    response_cache.DOCUMENT_CHECK_INTERVAL = 0
+    log = build_log(args.students, args.questions, args.seed)
+    hit_ms, miss_ms = [], []
+    try:
+        with StubBackend(latency=args.latency, token_delay=0.0) as stub:
+            url = stub.anythingllm_url
+            current = None
+            for i, (student, question) in enumerate(log):
+                if student != current:
+                    response_cache.clear_memory() # A new runner process starts with a cold LRU
+                    current = student
+                if i == len(log) // 2:
+                    stub.documents.append({"docpath": "custom-documents/new-notes.json", "lastUpdatedAt": "now"})
+                before = stub.requests
+                start = time.perf_counter()
+                response_cache.cached_chat(url, "key", "maths", question)
+                elapsed = (time.perf_counter() - start) * 1000
+                (miss_ms if stub.requests > before else hit_ms).append(elapsed)
+            backend_calls = stub.requests
+
+        stats = response_cache.stats()
+        total = len(hit_ms) + len(miss_ms)
+        saved = len(hit_ms) * (statistics.mean(miss_ms) - statistics.mean(hit_ms)) / 1000 if hit_ms else 0
+        print(f"{total} questions from {args.students} students, {len(set(q for _, q in log))} distinct strings")
+        print(f"hit rate:        {len(hit_ms) / total:.1%}  (cache counters: {stats['hit_rate']:.1%})")
+        print(f"backend calls:   {backend_calls} instead of {total}")
+        print(f"latency miss:    p50 {statistics.median(miss_ms):7.1f} ms")
+        print(f"latency hit:     p50 {statistics.median(hit_ms) if hit_ms else float('nan'):7.1f} ms")
+        print(f"backend time saved: {saved:.1f} s")
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Compare the per-process and shared-hub serving modes.
+
+Publishes N tutors in a scratch directory with each mode and reports the total
+RSS of the serving processes and the time until each tutor's URL first answers.
+
+Usage: python benchmarks/bench_serving.py --tutors 10
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import psutil
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import deployer
+
+
+def wait_for(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def total_rss(pids):
+    rss = 0
+    for pid in set(pids):
+        try:
+            proc = psutil.Process(pid)
+            rss += proc.memory_info().rss
+            rss += sum(child.memory_info().rss for child in proc.children(recursive=True))
+        except psutil.NoSuchProcess:
+            pass
+    return rss
+
+
+def run_mode(mode, n):
+    students = []
+    for i in range(n):
+        username = f"bench_{mode}_{i}"
+        database.create_user(username, "pw", "student", f"Bench {i}")
+        students.append(database.get_user_by_username(username))
+
+    latencies = []
+    pids = []
+    try:
+        for s in students:
+            start = time.perf_counter()
+            deployer.start_student_app(s['id'], s['username'], mode=mode)
+            dep = database.get_deployment(s['id'])
+            url = f"http://127.0.0.1:{dep['port']}{deployer.get_app_path(dep)}"
+            ok = wait_for(f"http://127.0.0.1:{dep['port']}/_stcore/health") and wait_for(url)
+            latencies.append(time.perf_counter() - start if ok else float("nan"))
+            pids.append(dep['pid'])
+        time.sleep(1) # let imports settle before sampling memory
+        rss = total_rss(pids)
+    finally:
+        for s in students:
+            deployer.stop_student_app(s['id'])
+    return rss, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tutors", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=deployer.SERVING_MODES, choices=deployer.SERVING_MODES)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dse_bench_")
+    os.chdir(workdir)
+    database.init_db()
+    try:
+        print(f"{'mode':<10}{'tutors':>8}{'total RSS MB':>15}{'MB/tutor':>10}{'first resp s (mean)':>21}{'max':>8}")
+        for mode in args.modes:
+            rss, lat = run_mode(mode, args.tutors)
+            mb = rss / 1024 / 1024
+            print(f"{mode:<10}{args.tutors:>8}{mb:>15.1f}{mb / args.tutors:>10.1f}{sum(lat) / len(lat):>21.2f}{max(lat):>8.2f}")
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
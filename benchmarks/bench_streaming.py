@@ -0,0 +1,64 @@
+"""Time-to-first-token for streaming vs blocking tutor replies.
+
+Runs against the local stub backend with a realistic prefill latency and
+per-token delay, and compares when the student first sees text.
+
+Usage: python benchmarks/bench_streaming.py --turns 10 --latency 0.3 --token-delay 0.02
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import llm_client
+from stub_backend import StubBackend
+
+
+def time_blocking(fn, *args):
+    start = time.perf_counter()
+    text = fn(*args)
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed, text
+
+
+def time_stream(gen):
+    start = time.perf_counter()
+    first = None
+    parts = []
+    for chunk in gen:
+        if first is None:
+            first = time.perf_counter() - start
+        parts.append(chunk)
+    return first, time.perf_counter() - start, "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--answer-tokens", type=int, default=100)
+    args = parser.parse_args()
+
+    with StubBackend(latency=args.latency, token_delay=args.token_delay, answer_tokens=args.answer_tokens) as stub:
+        cases = {
+            "chat blocking": lambda i: time_blocking(llm_client.call_anythingllm_chat, stub.anythingllm_url, "x", "default", f"q{i}"),
+            "chat stream": lambda i: time_stream(llm_client.stream_anythingllm_chat(stub.anythingllm_url, "x", "default", f"q{i}")),
+            "vision blocking": lambda i: time_blocking(llm_client.call_ollama_vision, stub.ollama_url, "m", b"img", f"q{i}"),
+            "vision stream": lambda i: time_stream(llm_client.stream_ollama_generate(stub.ollama_url, "m", f"q{i}", b"img")),
+        }
+        print(f"{'mode':<18}{'first text ms':>15}{'complete ms':>13}")
+        for label, run in cases.items():
+            firsts, totals = [], []
+            for i in range(args.turns):
+                first, total, text = run(i)
+                assert "Error" not in text, text
+                firsts.append(first * 1000)
+                totals.append(total * 1000)
+            print(f"{label:<18}{statistics.median(firsts):>15.0f}{statistics.median(totals):>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
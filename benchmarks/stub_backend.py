@@ -0,0 +1,252 @@
+"""Local stand-in for the Ollama and AnythingLLM HTTP APIs.
+
+Serves the endpoints the platform calls with a configurable artificial latency,
+so benchmarks and load tests can run without a GPU box:
+
+    GET  /api/tags                       (Ollama model list)
+    POST /api/generate                   (Ollama generate, NDJSON stream unless "stream": false)
+    GET  /api/v1/workspaces              (AnythingLLM workspace list)
+    GET  /api/v1/workspace/<slug>        (AnythingLLM workspace, with its documents)
+    POST /api/v1/workspace/<slug>/chat   (AnythingLLM chat)
+    POST /api/v1/workspace/<slug>/stream-chat   (AnythingLLM SSE stream)
+    POST /api/v1/workspace/<slug>/vector-search (AnythingLLM retrieval)
+
+Latency models a real LLM: `latency` seconds before the first token, then
+`token_delay` seconds per token. Blocking calls answer after the last token.
+Set `megapixel_delay` to also charge generate requests with images for the
+pixels the vision model would have to process, and `contention` to make
+concurrent generate requests share one GPU (each runs N times slower while N
+are in progress).
+
+Ollama is reachable at http://host:port and AnythingLLM at http://host:port/api/v1.
+
+Usage: python benchmarks/stub_backend.py --port 11434 --latency 0.5 --token-delay 0.02
+"""
+import argparse
+import base64
+import io
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real backends
+    disable_nagle_algorithm = True # headers and body go out in separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b""
+        return json.loads(raw) if raw else {}
+
+    def _should_fail(self):
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests += 1
+            if stub.fail_next > 0:
+                stub.fail_next -= 1
+                return True
+        return False
+
+    def do_GET(self):
+        stub = self.server.stub
+        if self.path in ("/api/tags", "/api/v1/workspaces"):
+            with stub.lock:
+                stub.catalog_requests += 1
+            time.sleep(stub.catalog_latency)
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "qwen3-vl:8b"}, {"name": "llava:7b"}]})
+        elif self.path == "/api/v1/workspaces":
+            self._send_json(200, {"workspaces": [{"slug": "default", "name": "Default"}, {"slug": "maths", "name": "Maths"}]})
+        elif self.path.startswith("/api/v1/workspace/"):
+            slug = self.path.rsplit("/", 1)[-1]
+            self._send_json(200, {"workspace": [{"slug": slug, "name": slug, "documents": list(self.server.stub.documents)}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        payload = self._read_json()
+        if self._should_fail():
+            self._send_json(503, {"error": "stub failure"})
+            return
+        stub = self.server.stub
+        if self.path == "/api/generate":
+            with stub.lock:
+                stub.generate_requests += 1
+                stub.generate_active += 1
+                stub.generate_peak = max(stub.generate_peak, stub.generate_active)
+            try:
+                tokens = stub.tokens(payload.get("prompt", ""))
+                latency = stub.latency + stub.megapixel_delay * stub.megapixels(payload.get("images", []))
+                if payload.get("stream", True):
+                    self._start_stream("application/x-ndjson")
+                    stub.gpu_sleep(latency)
+                    for token in tokens:
+                        self._write_chunk(json.dumps({"response": token, "done": False}) + "\n")
+                        stub.gpu_sleep(stub.token_delay)
+                    self._write_chunk(json.dumps({"response": "", "done": True}) + "\n")
+                    self._end_stream()
+                else:
+                    stub.gpu_sleep(latency + stub.token_delay * len(tokens))
+                    self._send_json(200, {"model": payload.get("model"), "response": "".join(tokens), "done": True})
+            finally:
+                with stub.lock:
+                    stub.generate_active -= 1
+        elif self.path.startswith("/api/v1/workspace/") and self.path.endswith("/stream-chat"):
+            tokens = stub.tokens(payload.get("message", ""))
+            self._start_stream("text/event-stream")
+            time.sleep(stub.latency + stub.prefill(payload.get("message", "")))
+            for token in tokens:
+                chunk = {"type": "textResponseChunk", "textResponse": token, "close": False, "error": False}
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                time.sleep(stub.token_delay)
+            self._write_chunk(f"data: {json.dumps({'type': 'textResponseChunk', 'textResponse': '', 'close': True, 'error': False})}\n\n")
+            self._end_stream()
+        elif self.path.startswith("/api/v1/workspace/") and self.path.endswith("/vector-search"):
+            time.sleep(stub.search_latency)
+            results = [{"text": f"Course note {i} about {payload.get('query', '')[:30]}", "score": 0.9 - i / 10} for i in range(payload.get("topN", 4))]
+            self._send_json(200, {"results": results})
+        elif self.path.startswith("/api/v1/workspace/") and self.path.endswith("/chat"):
+            tokens = stub.tokens(payload.get("message", ""))
+            time.sleep(stub.latency + stub.prefill(payload.get("message", "")) + stub.token_delay * len(tokens))
+            self._send_json(200, {"type": "textResponse", "textResponse": "".join(tokens), "close": True})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+
+class StubServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return # A client gave up or was killed mid-answer (load tests do this on purpose)
+        super().handle_error(request, client_address)
+
+
+class StubBackend:
+    """Run the stub in a background thread. Use as a context manager."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_delay=0.0, answer_tokens=40):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.answer_tokens = answer_tokens
+        self.search_latency = 0.05
+        self.megapixel_delay = 0.0 # extra seconds per image megapixel on /api/generate
+        self.prefill_delay = 0.0 # extra seconds per 1000 prompt characters on the chat endpoints
+        self.prompt_chars = [] # length of every chat prompt received
+        self.fail_next = 0 # answer the next N POSTs with 503
+        self.documents = [] # returned by GET /workspace/<slug>; change it to simulate an upload
+        self.requests = 0
+        self.generate_requests = 0 # Ollama (vision) calls only
+        self.generate_active = 0
+        self.generate_peak = 0 # most generate requests in progress at once
+        self.contention = False
+        self.catalog_latency = 0.0 # seconds for the model and workspace lists
+        self.catalog_requests = 0
+        self.lock = threading.Lock()
+        self.server = StubServer((host, port), StubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.thread = None
+
+    @property
+    def ollama_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def anythingllm_url(self):
+        return f"{self.ollama_url}/api/v1"
+
+    def tokens(self, prompt):
+        return [f"Stub answer to: {prompt[:40]}"] + [f" word{i}" for i in range(self.answer_tokens)]
+
+    def prefill(self, message):
+        with self.lock:
+            self.prompt_chars.append(len(message))
+        return self.prefill_delay * len(message) / 1000
+
+    def gpu_sleep(self, seconds):
+        if not self.contention:
+            time.sleep(seconds)
+            return
+        while seconds > 0:
+            step = min(0.05, seconds)
+            time.sleep(step * max(1, self.generate_active))
+            seconds -= step
+
+    def megapixels(self, images_b64):
+        if not self.megapixel_delay:
+            return 0.0
+        total = 0.0
+        for image_b64 in images_b64:
+            try:
+                with Image.open(io.BytesIO(base64.b64decode(image_b64))) as img:
+                    total += img.width * img.height / 1e6
+            except Exception:
+                pass
+        return total
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds per generated token")
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    args = parser.parse_args()
+
+    stub = StubBackend(args.host, args.port, args.latency, args.token_delay, args.answer_tokens)
+    print(f"Ollama stub: {stub.ollama_url}  AnythingLLM stub: {stub.anythingllm_url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
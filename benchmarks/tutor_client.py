@@ -0,0 +1,190 @@
+"""Minimal Streamlit client that drives a published tutor like a browser tab.
+
+Speaks the same websocket protocol as the Streamlit frontend
+(/_stcore/stream, protobuf BackMsg/ForwardMsg): it asks for script runs with
+widget values, reads back the rendered elements and uploads files through
+/_stcore/upload_file. Load tests use it to run scripted chat, image and
+notebook sessions against real runner processes.
+
+    with TutorSession(url) as tab:
+        tab.chat("What is the discriminant?")
+        tab.attach("worksheet.png", png_bytes)
+        tab.chat("Explain question 2")
+        tab.click("📝 Add Last Q&A to Notebook")
+        tab.select("View", "📓 Notebook")
+
+Each action returns its wall time in seconds; the time until the tutor's answer
+first appeared is kept in `first_text`.
+"""
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import requests
+from websockets.sync.client import connect
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ClientState_pb2 import ClientState
+from streamlit.proto.Common_pb2 import FileURLsRequest, FileUploaderState, UploadedFileInfo
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState, WidgetStates
+
+FINISHED = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_WITH_COMPILE_ERROR)
+
+
+class TutorError(Exception):
+    pass
+
+
+class TutorSession:
+    """One browser tab on a tutor at `url` (http://host:port/path?query)."""
+
+    def __init__(self, url, timeout=300):
+        parts = urlsplit(url)
+        self.base = f"{parts.scheme}://{parts.netloc}{parts.path.rstrip('/')}"
+        self.query = parts.query
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.ws = None
+        self.session_id = None
+        self.page_script_hash = ""
+        self.elements = {} # delta path -> Element from the latest run
+        self.values = {} # widget id -> WidgetState kept across runs (like the frontend)
+        self.first_text = None # seconds until the answer marker appeared in the last action
+        self.exception = None
+
+    # --- Connection ---
+
+    def open(self):
+        self.http.get(f"{self.base}/", timeout=30) # Sets the XSRF cookie uploads need
+        ws_base = self.base.replace("http", "ws", 1)
+        self.ws = connect(f"{ws_base}/_stcore/stream", subprotocols=["streamlit"], open_timeout=30, max_size=None)
+        return self.rerun()
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
+        self.http.close()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _send(self, back_msg):
+        self.ws.send(back_msg.SerializeToString())
+
+    def _receive(self, deadline):
+        msg = ForwardMsg()
+        msg.ParseFromString(self.ws.recv(timeout=max(0.1, deadline - time.time())))
+        return msg
+
+    # --- Script runs ---
+
+    def rerun(self, triggers=(), marker=None):
+        """Run the script with the kept widget values plus one-off triggers; wait for it (and any st.rerun) to finish."""
+        states = WidgetStates()
+        states.widgets.extend(self.values.values())
+        states.widgets.extend(triggers)
+        back_msg = BackMsg()
+        back_msg.rerun_script.CopyFrom(ClientState(
+            query_string=self.query, widget_states=states, page_script_hash=self.page_script_hash
+        ))
+        start = time.perf_counter()
+        deadline = time.time() + self.timeout
+        self.first_text = None
+        self.exception = None
+        self._send(back_msg)
+        while True:
+            msg = self._receive(deadline)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.elements = {}
+                self.page_script_hash = msg.new_session.page_script_hash
+                if msg.new_session.HasField("initialize"):
+                    self.session_id = msg.new_session.initialize.session_id
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                element = msg.delta.new_element
+                self.elements[tuple(msg.metadata.delta_path)] = element
+                if element.WhichOneof("type") == "exception":
+                    self.exception = element.exception.message
+                elif marker and self.first_text is None and element.WhichOneof("type") == "markdown" and marker in element.markdown.body:
+                    self.first_text = time.perf_counter() - start
+            elif kind == "script_finished" and msg.script_finished in FINISHED:
+                break
+        if self.exception:
+            raise TutorError(self.exception)
+        return time.perf_counter() - start
+
+    def widget(self, kind, label=None):
+        """The latest run's element proto for a widget of this kind (and label)."""
+        for element in self.elements.values():
+            if element.WhichOneof("type") == kind:
+                proto = getattr(element, kind)
+                if label is None or proto.label == label:
+                    return proto
+        raise TutorError(f"no {kind} widget {label or ''} on the page")
+
+    def texts(self):
+        return [e.markdown.body for e in self.elements.values() if e.WhichOneof("type") == "markdown"]
+
+    # --- Actions ---
+
+    def chat(self, text, marker="Stub answer"):
+        """Send a chat message and wait for the answer (and the run that saves it)."""
+        widget = self.widget("chat_input")
+        trigger = WidgetState(id=widget.id)
+        trigger.chat_input_value.data = text
+        return self.rerun([trigger], marker=marker)
+
+    def click(self, label):
+        return self.rerun([WidgetState(id=self.widget("button", label).id, trigger_value=True)])
+
+    def type(self, label, text):
+        return self.rerun([self.keep(WidgetState(id=self.widget("text_input", label).id, string_value=text))])
+
+    def select(self, label, option):
+        """Pick an option of a radio (e.g. the tutor's view switcher)."""
+        widget = self.widget("radio", label)
+        if option not in widget.options:
+            raise TutorError(f"{label} has no option {option}")
+        return self.rerun([self.keep(WidgetState(id=widget.id, string_value=option))])
+
+    def keep(self, state):
+        self.values[state.id] = state
+        return state
+
+    def attach(self, name, data, mime="image/png"):
+        """Upload a file to the page's file uploader (kept attached, like in the browser)."""
+        start = time.perf_counter()
+        widget = self.widget("file_uploader")
+        back_msg = BackMsg()
+        back_msg.file_urls_request.CopyFrom(FileURLsRequest(request_id=uuid.uuid4().hex, file_names=[name], session_id=self.session_id))
+        self._send(back_msg)
+        deadline = time.time() + self.timeout
+        while True:
+            msg = self._receive(deadline)
+            if msg.WhichOneof("type") == "file_urls_response":
+                urls = msg.file_urls_response.file_urls[0]
+                break
+        upload_url = urls.upload_url if urls.upload_url.startswith("http") else f"{self.base}{urls.upload_url}"
+        response = self.http.put(
+            upload_url, files={"file": (name, data, mime)},
+            headers={"X-Xsrftoken": self.http.cookies.get("_streamlit_xsrf", "")}, timeout=60
+        )
+        response.raise_for_status()
+        info = UploadedFileInfo(file_id=urls.file_id, name=name, size=len(data))
+        info.file_urls.CopyFrom(urls)
+        state = WidgetState(id=widget.id)
+        state.file_uploader_state_value.CopyFrom(FileUploaderState(uploaded_file_info=[info]))
+        self.keep(state)
+        self.rerun()
+        return time.perf_counter() - start
+
+    def detach(self):
+        widget = self.widget("file_uploader")
+        self.keep(WidgetState(id=widget.id, file_uploader_state_value=FileUploaderState()))
+        return self.rerun()
@@ -0,0 +1,184 @@
+"""Bounded conversation context for the tutor's prompts.
+
+AnythingLLM gets one message per turn, so whatever the tutor should remember of
+the conversation has to be in that message. Sending only the latest question
+loses the thread ("and the second one?"); sending the whole history makes
+every turn slower than the last and eventually overflows the model's context.
+Each prompt is built from:
+
+  - a window of the most recent messages, as many as fit in the tutor's
+    `context_budget` tokens (older messages are dropped whole);
+  - a rolling summary of everything before the window, at most
+    `summary_budget` tokens. It is brought up to date incrementally on a
+    background thread, by asking the model to fold the messages that left the
+    window into the previous summary, once they add up to FOLD_AFTER of the
+    window. No turn waits for it: until a fold lands, the messages it covers
+    are carried as short extracts in what the summary budget leaves over.
+
+So the prompt is capped at about context_budget + summary_budget tokens plus
+the question, however long the session. Token counts come from
+estimate_tokens(), a local approximation: no tokenizer to download, well under
+a microsecond per message.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from llm_client import call_anythingllm_chat
+
+DEFAULT_CONTEXT_BUDGET = 1500 # tokens of recent messages; 0 sends the question alone
+DEFAULT_SUMMARY_BUDGET = 300 # tokens of summary (and extracts) of older messages; 0 keeps only the window
+FOLD_AFTER = 0.5 # fold once the unsummarized messages reach this share of the window
+EXTRACT_TOKENS = 40 # tokens kept of each message waiting for a fold
+MESSAGE_OVERHEAD = 4 # role label and separators
+
+ROLES = {"user": "Student", "assistant": "Tutor"}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="context-summary")
+
+
+def estimate_tokens(text):
+    """Approximate model tokens: ~4 characters per token for ASCII, one per other character (CJK and the like)."""
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (ascii_chars + 3) // 4 + len(text) - ascii_chars
+
+def truncate_tokens(text, budget):
+    """Cut text to about `budget` tokens, at a word boundary where there is one."""
+    if estimate_tokens(text) <= budget:
+        return text
+    # Estimate is at most one token per character: narrow down from budget*4 characters
+    cut = budget * 4
+    while cut > 0 and estimate_tokens(text[:cut]) > budget:
+        cut = cut * 3 // 4
+    space = text.rfind(" ", 0, cut)
+    return text[:space if space > cut // 2 else cut].rstrip() + "…"
+
+def budgets(config):
+    return (int(config.get("context_budget", DEFAULT_CONTEXT_BUDGET)),
+            int(config.get("summary_budget", DEFAULT_SUMMARY_BUDGET)))
+
+def _line(msg, text=None):
+    text = msg["content"] if text is None else text
+    if msg.get("image_path") or msg.get("has_image"):
+        text = f"[with an image] {text}"
+    return f"{ROLES.get(msg['role'], msg['role'])}: {text}"
+
+
+class ConversationContext:
+    """Window and rolling summary of one chat session. Keep one per session (e.g. in st.session_state)."""
+
+    def __init__(self, session_id, allm_args, context_budget=DEFAULT_CONTEXT_BUDGET, summary_budget=DEFAULT_SUMMARY_BUDGET, tutor=""):
+        self.session_id = session_id
+        self.allm_args = allm_args # (url, api_key, slug) the summaries are asked from
+        self.context_budget = context_budget
+        self.summary_budget = summary_budget
+        self.tutor = tutor
+        self.summary = ""
+        self.covered = 0 # messages[:covered] are folded into the summary
+        self.folds = 0
+        self._sizes = [] # estimated tokens per message, filled as messages arrive
+        self._pending = None # Future of the fold in progress
+        self._lock = threading.Lock()
+
+    def _size(self, messages, i):
+        while len(self._sizes) < len(messages):
+            self._sizes.append(estimate_tokens(messages[len(self._sizes)]["content"]) + MESSAGE_OVERHEAD)
+        return self._sizes[i]
+
+    def window_start(self, messages):
+        """Index of the oldest message that fits in the window (walking back from the newest)."""
+        used = 0
+        start = len(messages)
+        while start > 0:
+            used += self._size(messages, start - 1)
+            if used > self.context_budget:
+                break
+            start -= 1
+        return start
+
+    def build_prompt(self, history, question):
+        """The prompt for `question`, given the messages before it (a list that only ever grows)."""
+        if self.context_budget <= 0 or not history:
+            return question
+        start = self.window_start(history)
+        earlier = []
+        if self.summary_budget > 0:
+            with self._lock:
+                summary, covered = self.summary, self.covered
+            if summary:
+                earlier.append(summary)
+            # Messages out of the window but not folded in yet: newest extracts first, in what the summary leaves
+            room = self.summary_budget - estimate_tokens(summary)
+            extracts = []
+            for msg in reversed(history[covered:start]):
+                line = _line(msg, truncate_tokens(msg["content"], EXTRACT_TOKENS))
+                room -= estimate_tokens(line)
+                if room < 0:
+                    break
+                extracts.append(line)
+            earlier.extend(reversed(extracts))
+            self._maybe_fold(history, start)
+
+        sections = []
+        if earlier:
+            sections.append("Summary of the earlier conversation:\n" + "\n".join(earlier))
+        if start < len(history):
+            sections.append("Recent conversation:\n" + "\n".join(_line(msg) for msg in history[start:]))
+        sections.append(f"Student's new message:\n{question}")
+        return "\n\n".join(sections)
+
+    def _maybe_fold(self, history, start):
+        if self.summary_budget <= 0:
+            return # No summary wanted: don't spend model calls on one
+        with self._lock:
+            if self._pending is not None or start <= self.covered:
+                return
+            waiting = sum(self._size(history, i) for i in range(self.covered, start))
+            if waiting < self.context_budget * FOLD_AFTER:
+                return
+            # Fold a copy, in chunks of at most a window each (a reopened long chat has many messages waiting)
+            chunks, chunk, used = [], [], 0
+            for i in range(self.covered, start):
+                if chunk and used + self._size(history, i) > self.context_budget:
+                    chunks.append((chunk, i))
+                    chunk, used = [], 0
+                chunk.append(dict(history[i]))
+                used += self._size(history, i)
+            chunks.append((chunk, start))
+            self._pending = _executor.submit(self._fold_all, chunks)
+
+    def _fold_all(self, chunks):
+        try:
+            for batch, upto in chunks:
+                if not self._fold(self.summary, batch, upto):
+                    break # The rest stay as extracts; the next turn retries
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _fold(self, summary, batch, upto):
+        words = max(20, self.summary_budget * 3 // 5) # ~0.75 words per token, with headroom
+        lines = "\n".join(_line(msg, truncate_tokens(msg["content"], self.context_budget // 2)) for msg in batch)
+        prompt = (
+            f"Update the summary of a tutoring conversation with the messages below. Keep what the student is working on, "
+            f"what has been explained, and any mistakes or open questions. Reply with the summary only, in at most {words} words."
+            f"\n\nCurrent summary:\n{summary or '(none yet)'}\n\nNew messages:\n{lines}"
+        )
+        with metrics.timer("context_summary", self.tutor) as t:
+            text = call_anythingllm_chat(*self.allm_args, prompt)
+            t.error = text.startswith("[RAG Error]") or not text.strip()
+        if t.error:
+            return False
+        with self._lock:
+            self.summary = truncate_tokens(text.strip(), self.summary_budget)
+            self.covered = upto
+            self.folds += 1
+        return True
+
+    def wait(self, timeout=None):
+        """Block until the fold in progress (if any) has landed. For tests and benchmarks."""
+        pending = self._pending
+        if pending is not None:
+            pending.result(timeout)
@@ -1,12 +1,96 @@
 import sqlite3
+import functools
 import hashlib
 import os
+import threading
 from datetime import datetime
 
 DB_FILE = "dse_ai.db"
 
+# Ports handed out to runner processes (inclusive). Override with DSE_PORT_RANGE_START / DSE_PORT_RANGE_END.
+PORT_RANGE_START = int(os.environ.get("DSE_PORT_RANGE_START", 8502))
+PORT_RANGE_END = int(os.environ.get("DSE_PORT_RANGE_END", 8999))
+PORT_LEASE_GRACE = 60 # seconds a reservation may exist before its deployment record is written
+
+# Written by the supervisor (supervisor.py) for every running deployment and server.
+# pid_started is the process create time, so a reused PID is never mistaken for our runner.
+SUPERVISOR_COLUMNS = [
+    ("pid_started", "REAL"),
+    ("health", "TEXT"),
+    ("cpu_percent", "REAL"),
+    ("rss_bytes", "INTEGER"),
+    ("restarts", "INTEGER DEFAULT 0"),
+    ("checked_at", "TEXT"),
+]
+
+# Deployments fronted by the wake-on-demand proxy (front_proxy.py). port is the public port
+# the proxy listens on; backend_port is where the runner itself listens while awake.
+HIBERNATION_COLUMNS = [
+    ("backend_port", "INTEGER"),
+    ("last_active", "TEXT"),
+    ("hibernated_rss", "INTEGER"),
+    ("last_wake_ms", "REAL"),
+]
+
+# --- Connection Management ---
+# Each thread keeps one open connection per database file instead of reconnecting
+# on every call. WAL lets the dashboard write while runner processes read, the busy
+# timeout makes writers wait for a lock instead of failing, and the per-connection
+# statement cache reuses prepared statements across calls.
+# Because the connection is shared, every function that writes is wrapped in
+# @_transaction: its changes are committed before it returns, or rolled back if
+# it raises, so no transaction outlives the call that opened it.
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+
+def get_connection():
+    """Return this thread's connection to DB_FILE, opening it on first use."""
+    if getattr(_local, "pid", None) != os.getpid():
+        # Never share connections with a forked parent
+        _local.pid = os.getpid()
+        _local.connections = {}
+    path = os.path.abspath(DB_FILE)
+    conn = _local.connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.connections[path] = conn
+    return conn
+
+def _transaction(func):
+    """Run a writing function in its own transaction on this thread's connection."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        conn = get_connection()
+        if conn.in_transaction:
+            # Uncommitted writes of a caller on this thread: rolling them back or committing them
+            # here would both be wrong, so refuse instead of guessing
+            raise RuntimeError(f"database.{func.__name__}() called with a transaction open on this thread's connection")
+        try:
+            result = func(*args, **kwargs)
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        if conn.in_transaction:
+            conn.commit()
+        return result
+    return wrapper
+
+def close_connections():
+    """Close this thread's connections (e.g. before a worker thread exits)."""
+    for conn in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = {}
+
+@_transaction
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     c = conn.cursor()
     
     # Users Table
@@ -22,17 +106,46 @@ def init_db():
     ''')
     
     # Deployments Table (for tracking ports and PIDs)
+    # mode is 'process' (dedicated runner) or 'shared' (served by the tutor hub),
+    # so several shared deployments can report the same port.
     c.execute('''
         CREATE TABLE IF NOT EXISTS deployments (
             user_id INTEGER PRIMARY KEY,
-            port INTEGER UNIQUE NOT NULL,
+            port INTEGER NOT NULL,
             pid INTEGER,
             status TEXT,
             updated_at TEXT,
+            mode TEXT DEFAULT 'process',
             FOREIGN KEY(user_id) REFERENCES users(id)
         )
     ''')
     
+    # Servers Table (long-lived shared processes, e.g. the multi-tenant tutor hub)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS servers (
+            name TEXT PRIMARY KEY,
+            port INTEGER NOT NULL,
+            pid INTEGER,
+            status TEXT,
+            updated_at TEXT
+        )
+    ''')
+    
+    # Ports Table (one row per port in the runner range; owner is NULL while the port is free)
+    # owner is 'user:<id>' for a dedicated runner, 'server:<name>' for a shared server,
+    # or 'blocked' for a port some other program on the machine was found holding.
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ports (
+            port INTEGER PRIMARY KEY,
+            owner TEXT,
+            reserved_at TEXT
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ports_free ON ports(port) WHERE owner IS NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_ports_owner ON ports(owner)")
+    sync_port_range(c)
+    conn.commit() # create_user below runs in a transaction of its own
+    
     # Seed Teacher Account if not exists
     c.execute("SELECT * FROM users WHERE role='teacher'")
     if not c.fetchone():
@@ -43,16 +156,61 @@ def init_db():
         c.execute("SELECT account_status FROM users LIMIT 1")
     except sqlite3.OperationalError:
         c.execute("ALTER TABLE users ADD COLUMN account_status TEXT DEFAULT 'active'")
+    
+    # Check for deployments.mode column (Migration)
+    # Older databases declare port UNIQUE, which rules out the shared hub, so rebuild the table.
+    c.execute("PRAGMA table_info(deployments)")
+    if "mode" not in [row[1] for row in c.fetchall()]:
+        c.execute('''
+            CREATE TABLE deployments_new (
+                user_id INTEGER PRIMARY KEY,
+                port INTEGER NOT NULL,
+                pid INTEGER,
+                status TEXT,
+                updated_at TEXT,
+                mode TEXT DEFAULT 'process',
+                FOREIGN KEY(user_id) REFERENCES users(id)
+            )
+        ''')
+        c.execute("INSERT INTO deployments_new (user_id, port, pid, status, updated_at) SELECT user_id, port, pid, status, updated_at FROM deployments")
+        c.execute("DROP TABLE deployments")
+        c.execute("ALTER TABLE deployments_new RENAME TO deployments")
         
+    # Adopt ports of runners started before the ports table existed
+    now = datetime.now().isoformat()
+    c.execute('''
+        UPDATE ports SET owner = (SELECT 'user:' || d.user_id FROM deployments d
+                                  WHERE d.port = ports.port AND d.status = 'running' AND d.mode = 'process'),
+                         reserved_at = ?
+        WHERE owner IS NULL AND port IN (SELECT port FROM deployments WHERE status = 'running' AND mode = 'process')
+    ''', (now,))
+    c.execute('''
+        UPDATE ports SET owner = (SELECT 'server:' || s.name FROM servers s WHERE s.port = ports.port AND s.status = 'running'),
+                         reserved_at = ?
+        WHERE owner IS NULL AND port IN (SELECT port FROM servers WHERE status = 'running')
+    ''', (now,))
+    
+    # Supervisor columns (Migration): process identity, health and resource usage per runner
+    for table in ("deployments", "servers"):
+        c.execute(f"PRAGMA table_info({table})")
+        existing = [row[1] for row in c.fetchall()]
+        for column, decl in SUPERVISOR_COLUMNS + (HIBERNATION_COLUMNS if table == "deployments" else []):
+            if column not in existing:
+                c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    
+    # Indexes for the teacher dashboard's student/deployment listing
+    c.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users(role, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_deployments_status ON deployments(status)")
+    
     conn.commit()
-    conn.close()
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
+@_transaction
 def create_user(username, password, role, name):
     try:
-        conn = sqlite3.connect(DB_FILE)
+        conn = get_connection()
         c = conn.cursor()
         # Check for case-insensitive username existence
         c.execute("SELECT id FROM users WHERE LOWER(username) = ?", (username.lower(),))
@@ -64,30 +222,33 @@ def create_user(username, password, role, name):
         conn.commit()
         return True
     except sqlite3.IntegrityError:
+        conn.rollback()
         return False
-    finally:
-        conn.close()
 
 def verify_user(username, password):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     c = conn.cursor()
     c.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, hash_password(password)))
     user = c.fetchone()
-    conn.close()
     return dict(user) if user else None
 
 def get_user_by_id(user_id):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     c = conn.cursor()
     c.execute("SELECT * FROM users WHERE id = ?", (user_id,))
     user = c.fetchone()
-    conn.close()
     return dict(user) if user else None
 
+def get_user_by_username(username):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT * FROM users WHERE LOWER(username) = ?", (username.lower(),))
+    user = c.fetchone()
+    return dict(user) if user else None
+
+@_transaction
 def update_user_profile(user_id, new_username=None, new_password=None, new_name=None):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     c = conn.cursor()
     try:
         if new_username:
@@ -99,21 +260,22 @@ def update_user_profile(user_id, new_username=None, new_password=None, new_name=
         conn.commit()
         return True, "Update successful"
     except sqlite3.IntegrityError:
+        conn.rollback()
         return False, "Username already taken"
     except Exception as e:
+        conn.rollback()
         return False, str(e)
-    finally:
-        conn.close()
 
+@_transaction
 def update_user_status(user_id, status):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     c = conn.cursor()
     c.execute("UPDATE users SET account_status = ? WHERE id = ?", (status, user_id))
     conn.commit()
-    conn.close()
 
+@_transaction
 def admin_update_user(user_id, name, username, password=None):
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     c = conn.cursor()
     try:
         c.execute("UPDATE users SET name = ?, username = ? WHERE id = ?", (name, username, user_id))
@@ -122,20 +284,72 @@ def admin_update_user(user_id, name, username, password=None):
         conn.commit()
         return True, "Update successful"
     except sqlite3.IntegrityError:
+        conn.rollback()
         return False, "Username already taken"
-    finally:
-        conn.close()
 
 def get_all_students():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     c = conn.cursor()
     # Ensure account_status is returned even if defaulting
     c.execute("SELECT id, username, name, created_at, account_status FROM users WHERE role = 'student'")
     students = [dict(row) for row in c.fetchall()]
-    conn.close()
     return students
 
+# Sort keys accepted by get_students_with_deployments
+STUDENT_SORT_COLUMNS = {
+    "id": "u.id",
+    "name": "u.name COLLATE NOCASE",
+    "username": "u.username COLLATE NOCASE",
+    "created_at": "u.created_at",
+    "app_status": "COALESCE(d.status, 'stopped')",
+}
+
+def _student_filters(status=None, search=None):
+    clauses = ["u.role = 'student'"]
+    params = []
+    if status == "running":
+        clauses.append("d.status IN ('running', 'hibernated')")
+    elif status == "stopped":
+        clauses.append("(d.status IS NULL OR d.status NOT IN ('running', 'hibernated'))")
+    elif status in ("active", "banned"):
+        clauses.append("COALESCE(u.account_status, 'active') = ?")
+        params.append(status)
+    if search:
+        clauses.append("(u.name LIKE ? OR u.username LIKE ?)")
+        params.extend([f"%{search}%"] * 2)
+    return " AND ".join(clauses), params
+
+def get_students_with_deployments(limit=50, offset=0, sort_by="id", descending=False, status=None, search=None):
+    """One page of students joined with their deployment row (dep_* keys are None if never published).
+
+    status filters on app status ('running'/'stopped') or account status ('active'/'banned').
+    """
+    where, params = _student_filters(status, search)
+    order = STUDENT_SORT_COLUMNS.get(sort_by, "u.id") + (" DESC" if descending else "")
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT u.id, u.username, u.name, u.created_at, u.account_status,
+               d.port AS dep_port, d.pid AS dep_pid, d.status AS dep_status, d.mode AS dep_mode,
+               CASE WHEN d.mode = 'shared' THEN h.health ELSE d.health END AS dep_health,
+               d.cpu_percent AS dep_cpu_percent, d.rss_bytes AS dep_rss_bytes, d.restarts AS dep_restarts
+        FROM users u
+        LEFT JOIN deployments d ON d.user_id = u.id
+        LEFT JOIN servers h ON h.name = 'hub'
+        WHERE {where}
+        ORDER BY {order}, u.id
+        LIMIT ? OFFSET ?
+    ''', params + [limit, offset])
+    return [dict(row) for row in c.fetchall()]
+
+def count_students(status=None, search=None):
+    where, params = _student_filters(status, search)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f"SELECT COUNT(*) FROM users u LEFT JOIN deployments d ON d.user_id = u.id WHERE {where}", params)
+    return c.fetchone()[0]
+
+@_transaction
 def delete_user(user_id):
     # Get username before deletion for folder cleanup
     user = get_user_by_id(user_id)
@@ -151,68 +365,324 @@ def delete_user(user_id):
             except OSError:
                 pass # Fallback or log error
 
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     c = conn.cursor()
     c.execute("DELETE FROM users WHERE id = ?", (user_id,))
     c.execute("DELETE FROM deployments WHERE user_id = ?", (user_id,))
+    c.execute("UPDATE ports SET owner = NULL, reserved_at = NULL WHERE owner IN (?, ?)", (f"user:{user_id}", f"runner:{user_id}"))
     conn.commit()
-    conn.close()
 
 # --- Deployment Management ---
 
 def get_deployment(user_id):
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection()
     c = conn.cursor()
     c.execute("SELECT * FROM deployments WHERE user_id = ?", (user_id,))
     dep = c.fetchone()
-    conn.close()
     return dict(dep) if dep else None
 
-def update_deployment(user_id, port, pid, status="running"):
-    conn = sqlite3.connect(DB_FILE)
+@_transaction
+def update_deployment(user_id, port, pid, status="running", mode="process", pid_started=None, backend_port=None):
+    conn = get_connection()
     c = conn.cursor()
+    now = datetime.now().isoformat()
     c.execute('''
-        INSERT INTO deployments (user_id, port, pid, status, updated_at)
-        VALUES (?, ?, ?, ?, ?)
+        INSERT INTO deployments (user_id, port, pid, status, updated_at, mode, pid_started, health, backend_port, last_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 'starting', ?, ?)
         ON CONFLICT(user_id) DO UPDATE SET
             port=excluded.port,
             pid=excluded.pid,
             status=excluded.status,
-            updated_at=excluded.updated_at
-    ''', (user_id, port, pid, status, datetime.now().isoformat()))
+            updated_at=excluded.updated_at,
+            mode=excluded.mode,
+            pid_started=excluded.pid_started,
+            health=excluded.health,
+            cpu_percent=NULL,
+            rss_bytes=NULL,
+            backend_port=excluded.backend_port,
+            last_active=excluded.last_active
+    ''', (user_id, port, pid, status, now, mode, pid_started, backend_port, now))
+    conn.commit()
+
+@_transaction
+def stop_deployment_record(user_id):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        UPDATE deployments SET status = 'stopped', pid = NULL, cpu_percent = NULL, rss_bytes = NULL,
+                               backend_port = NULL, hibernated_rss = NULL
+        WHERE user_id = ?
+    ''', (user_id,))
+    c.execute("UPDATE ports SET owner = NULL, reserved_at = NULL WHERE owner IN (?, ?)", (f"user:{user_id}", f"runner:{user_id}"))
     conn.commit()
-    conn.close()
+
+def count_shared_deployments():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM deployments WHERE status = 'running' AND mode = 'shared'")
+    count = c.fetchone()[0]
+    return count
+
+# --- Port Allocation ---
+
+def sync_port_range(c, start=None, end=None):
+    """Make the ports table cover exactly [start, end], keeping ports that are still in use."""
+    start = PORT_RANGE_START if start is None else start
+    end = PORT_RANGE_END if end is None else end
+    c.executemany("INSERT OR IGNORE INTO ports (port) VALUES (?)", [(p,) for p in range(start, end + 1)])
+    c.execute("DELETE FROM ports WHERE (port < ? OR port > ?) AND (owner IS NULL OR owner = 'blocked')", (start, end))
+
+@_transaction
+def reserve_port(owner):
+    """Atomically take the lowest free port for owner ('user:<id>', 'runner:<id>' or 'server:<name>').
+
+    Returns the port owner already holds if it has one, or None if the range is exhausted.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    # IMMEDIATE takes the write lock up front, so two publishers can never read the same free port
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        c.execute("SELECT port FROM ports WHERE owner = ?", (owner,))
+        row = c.fetchone()
+        if row is None:
+            c.execute("SELECT port FROM ports WHERE owner IS NULL ORDER BY port LIMIT 1")
+            row = c.fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        c.execute("UPDATE ports SET owner = ?, reserved_at = ? WHERE port = ?", (owner, datetime.now().isoformat(), row[0]))
+        conn.commit()
+        return row[0]
+    except Exception:
+        conn.rollback()
+        raise
+
+@_transaction
+def block_port(port):
+    """Mark a port as held by a program outside the platform; reclaim_ports retries it later."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE ports SET owner = 'blocked', reserved_at = ? WHERE port = ?", (datetime.now().isoformat(), port))
+    conn.commit()
+
+@_transaction
+def release_port(owner):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE ports SET owner = NULL, reserved_at = NULL WHERE owner = ?", (owner,))
+    conn.commit()
+
+@_transaction
+def reclaim_ports():
+    """Free reservations whose deployment or server is no longer running, and unblock ports.
+
+    Reservations younger than PORT_LEASE_GRACE are left alone: their launch may still be in progress.
+    """
+    cutoff = datetime.fromtimestamp(datetime.now().timestamp() - PORT_LEASE_GRACE).isoformat()
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        UPDATE ports SET owner = NULL, reserved_at = NULL
+        WHERE owner IS NOT NULL AND reserved_at < ? AND (
+            owner = 'blocked'
+            OR (owner LIKE 'user:%' AND NOT EXISTS (
+                SELECT 1 FROM deployments d
+                WHERE 'user:' || d.user_id = ports.owner AND d.status IN ('running', 'hibernated') AND d.mode = 'process'))
+            OR (owner LIKE 'runner:%' AND NOT EXISTS (
+                SELECT 1 FROM deployments d
+                WHERE 'runner:' || d.user_id = ports.owner AND d.status = 'running'))
+            OR (owner LIKE 'server:%' AND NOT EXISTS (
+                SELECT 1 FROM servers s
+                WHERE 'server:' || s.name = ports.owner AND s.status = 'running'))
+        )
+    ''', (cutoff,))
+    reclaimed = c.rowcount
+    conn.commit()
+    return reclaimed
 
 def get_all_active_ports():
-    conn = sqlite3.connect(DB_FILE)
+    """Ports of running deployments and servers, and every port currently reserved for one."""
+    conn = get_connection()
     c = conn.cursor()
-    c.execute("SELECT port FROM deployments WHERE status = 'running'")
+    c.execute('''
+        SELECT port FROM deployments WHERE status = 'running'
+        UNION
+        SELECT backend_port FROM deployments WHERE status = 'running' AND backend_port IS NOT NULL
+        UNION
+        SELECT port FROM servers WHERE status = 'running'
+        UNION
+        SELECT port FROM ports WHERE owner IS NOT NULL AND owner != 'blocked'
+    ''')
     ports = [row[0] for row in c.fetchall()]
-    conn.close()
     return ports
 
-def stop_deployment_record(user_id):
-    conn = sqlite3.connect(DB_FILE)
+def cleanup_zombies():
+    """Mark running deployments and servers whose process has exited as stopped, then reclaim_ports().
+
+    The supervisor does this (and restarts them) on every sweep; this is the one-off version.
+    """
+    for runner in get_supervised_runners():
+        if not runner['pid']:
+            continue
+        try:
+            os.kill(runner['pid'], 0)
+        except OSError:
+            # Process is dead
+            if runner['kind'] == 'server':
+                stop_server_record(runner['name'])
+            else:
+                stop_deployment_record(int(runner['name']))
+    return reclaim_ports()
+
+# --- Hibernation ---
+
+def get_proxy_routes():
+    """{public port: deployment} for every proxied tutor that is running or hibernated."""
+    conn = get_connection()
     c = conn.cursor()
-    c.execute("UPDATE deployments SET status = 'stopped', pid = NULL WHERE user_id = ?", (user_id,))
+    c.execute('''
+        SELECT user_id, port, backend_port, status FROM deployments
+        WHERE backend_port IS NOT NULL AND status IN ('running', 'hibernated')
+    ''')
+    return {row['port']: dict(row) for row in c.fetchall()}
+
+@_transaction
+def touch_deployments(user_ids):
+    """Record that these tutors had open sessions just now."""
+    conn = get_connection()
+    c = conn.cursor()
+    now = datetime.now().isoformat()
+    c.executemany("UPDATE deployments SET last_active = ? WHERE user_id = ?", [(now, uid) for uid in user_ids])
     conn.commit()
-    conn.close()
 
-def cleanup_zombies():
-    """Check all running deployments and verify if process exists."""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
+def get_idle_deployments(idle_seconds):
+    """Running proxied tutors with no session activity in the last idle_seconds."""
+    cutoff = datetime.fromtimestamp(datetime.now().timestamp() - idle_seconds).isoformat()
+    conn = get_connection()
     c = conn.cursor()
-    c.execute("SELECT user_id, pid FROM deployments WHERE status = 'running'")
-    rows = c.fetchall()
-    conn.close()
+    c.execute('''
+        SELECT * FROM deployments
+        WHERE status = 'running' AND backend_port IS NOT NULL AND COALESCE(last_active, updated_at) < ?
+    ''', (cutoff,))
+    return [dict(row) for row in c.fetchall()]
 
-    for row in rows:
-        pid = row['pid']
-        if pid:
-            try:
-                os.kill(pid, 0)
-            except OSError:
-                # Process is dead
-                stop_deployment_record(row['user_id'])
+@_transaction
+def hibernate_deployment_record(user_id, rss_bytes=None):
+    """Mark a tutor hibernated: its public port stays reserved, its runner port is released."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        UPDATE deployments SET status = 'hibernated', pid = NULL, pid_started = NULL, health = NULL,
+                               cpu_percent = NULL, rss_bytes = NULL, hibernated_rss = ?, updated_at = ?
+        WHERE user_id = ?
+    ''', (rss_bytes, datetime.now().isoformat(), user_id))
+    c.execute("UPDATE ports SET owner = NULL, reserved_at = NULL WHERE owner = ?", (f"runner:{user_id}",))
+    conn.commit()
+
+@_transaction
+def record_wake(user_id, wake_ms):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE deployments SET last_wake_ms = ?, hibernated_rss = NULL WHERE user_id = ?", (wake_ms, user_id))
+    conn.commit()
+
+def get_hibernation_stats():
+    """Counts of proxied tutors awake/asleep, memory reclaimed by the sleeping ones and recent wake times."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT SUM(status = 'running') AS awake,
+               SUM(status = 'hibernated') AS hibernated,
+               COALESCE(SUM(CASE WHEN status = 'hibernated' THEN hibernated_rss END), 0) AS reclaimed_bytes,
+               AVG(last_wake_ms) AS avg_wake_ms,
+               MAX(last_wake_ms) AS max_wake_ms
+        FROM deployments WHERE backend_port IS NOT NULL AND status IN ('running', 'hibernated')
+    ''')
+    stats = dict(c.fetchone())
+    stats['awake'] = stats['awake'] or 0
+    stats['hibernated'] = stats['hibernated'] or 0
+    return stats
+
+# --- Shared Servers ---
+
+def get_server(name):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT * FROM servers WHERE name = ?", (name,))
+    server = c.fetchone()
+    return dict(server) if server else None
+
+@_transaction
+def update_server(name, port, pid, status="running", pid_started=None):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        INSERT INTO servers (name, port, pid, status, updated_at, pid_started, health)
+        VALUES (?, ?, ?, ?, ?, ?, 'starting')
+        ON CONFLICT(name) DO UPDATE SET
+            port=excluded.port,
+            pid=excluded.pid,
+            status=excluded.status,
+            updated_at=excluded.updated_at,
+            pid_started=excluded.pid_started,
+            health=excluded.health,
+            cpu_percent=NULL,
+            rss_bytes=NULL
+    ''', (name, port, pid, status, datetime.now().isoformat(), pid_started))
+    conn.commit()
+
+@_transaction
+def repoint_shared_deployments(port, pid, pid_started=None):
+    """Move every running shared deployment onto a (re)started hub."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(
+        "UPDATE deployments SET port = ?, pid = ?, pid_started = ?, updated_at = ? WHERE mode = 'shared' AND status = 'running'",
+        (port, pid, pid_started, datetime.now().isoformat())
+    )
+    conn.commit()
+
+@_transaction
+def stop_server_record(name):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE servers SET status = 'stopped', pid = NULL, cpu_percent = NULL, rss_bytes = NULL WHERE name = ?", (name,))
+    c.execute("UPDATE ports SET owner = NULL, reserved_at = NULL WHERE owner = ?", (f"server:{name}",))
+    # Tutors served by a stopped server are no longer reachable
+    if name == "hub":
+        c.execute("UPDATE deployments SET status = 'stopped', pid = NULL WHERE mode = 'shared'")
+    conn.commit()
+
+# --- Supervisor State ---
+
+def get_supervised_runners():
+    """Every running dedicated runner and shared server, as dicts with kind 'deployment' or 'server'.
+
+    port is where the process itself listens (the backend port for proxied tutors).
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT 'deployment' AS kind, CAST(d.user_id AS TEXT) AS name, COALESCE(d.backend_port, d.port) AS port,
+               d.pid, d.pid_started, d.restarts, d.updated_at, u.username, u.account_status
+        FROM deployments d JOIN users u ON u.id = d.user_id
+        WHERE d.status = 'running' AND d.mode = 'process'
+        UNION ALL
+        SELECT 'server', s.name, s.port, s.pid, s.pid_started, s.restarts, s.updated_at, NULL, NULL
+        FROM servers s WHERE s.status = 'running'
+    ''')
+    return [dict(row) for row in c.fetchall()]
+
+@_transaction
+def record_runner_health(kind, name, health, cpu_percent=None, rss_bytes=None, restarted=False):
+    """Store the supervisor's latest observation of a runner."""
+    table, key = ("servers", "name") if kind == "server" else ("deployments", "user_id")
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(
+        f"UPDATE {table} SET health = ?, cpu_percent = ?, rss_bytes = ?, checked_at = ?, "
+        f"restarts = COALESCE(restarts, 0) + ? WHERE {key} = ?",
+        (health, cpu_percent, rss_bytes, datetime.now().isoformat(), 1 if restarted else 0, name)
+    )
+    conn.commit()
@@ -0,0 +1,327 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+import psutil
+import requests
+import database
+import llm_gateway
+from runner_pool import RunnerPool
+
+# --- Constants ---
+RUNNER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runner.py")
+HUB_NAME = "hub"
+PROXY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "front_proxy.py")
+PROXY_NAME = "proxy"
+GATEWAY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_gateway.py")
+GATEWAY_NAME = llm_gateway.GATEWAY_NAME
+
+# Serving modes
+#   process: one Streamlit process per published tutor (original behaviour)
+#   shared:  one long-lived hub process serves every tutor, routed by ?user_id=
+SERVING_MODES = ["process", "shared"]
+
+READY_TIMEOUT = 30 # seconds to wait for a launched runner to pass its health probe
+FAILED = "failed" # health recorded for a runner that never answered (supervisor.FAILED, "❌ Failed" on the dashboard)
+
+# Warm workers shared by every launch from this process
+runner_pool = RunnerPool(size=2)
+
+# Ollama requests the LLM gateway lets through per backend at once (kept for restarts)
+gateway_concurrency = llm_gateway.DEFAULT_CONCURRENCY
+
+class LaunchError(RuntimeError):
+    """A launched runner or server did not pass its health probe; it has been stopped and its port released."""
+
+
+# --- Process Helpers ---
+
+def process_started(pid):
+    """Create time of pid (identifies the process even if the PID is later reused), or None."""
+    try:
+        return psutil.Process(pid).create_time()
+    except (psutil.Error, TypeError, ValueError):
+        return None
+
+def is_runner_alive(pid, pid_started=None):
+    """True if pid is running and, when pid_started is known, is the same process we launched."""
+    if not pid:
+        return False
+    try:
+        proc = psutil.Process(pid)
+        if proc.status() == psutil.STATUS_ZOMBIE:
+            return False
+        return pid_started is None or abs(proc.create_time() - pid_started) < 0.01
+    except psutil.Error:
+        return False
+
+def kill_runner(pid, pid_started=None, timeout=5):
+    """SIGTERM our runner (never a process that merely reused its PID), SIGKILL if it hangs."""
+    if not is_runner_alive(pid, pid_started):
+        return
+    try:
+        proc = psutil.Process(pid)
+        proc.terminate()
+        try:
+            proc.wait(timeout) # Also reaps it if it is our child
+        except psutil.TimeoutExpired:
+            proc.kill()
+    except psutil.Error:
+        pass
+
+def is_port_bindable(port):
+    """True if a server could listen on port right now (what the runner itself will do)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Match Tornado, which sets SO_REUSEADDR, so ports in TIME_WAIT from a stopped runner count as free
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        sock.bind(("0.0.0.0", port))
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+def allocate_port(owner):
+    """Reserve a port from the configured range for owner ('user:<id>' or 'server:<name>')."""
+    while True:
+        port = database.reserve_port(owner)
+        if port is None:
+            raise RuntimeError(f"No free ports left in {database.PORT_RANGE_START}-{database.PORT_RANGE_END}")
+        if is_port_bindable(port):
+            return port
+        # Something outside the platform is listening there; skip it until the next cleanup
+        database.block_port(port)
+
+def set_warm_pool_size(size):
+    """Resize the warm pool (also tops it up if workers were used or died)."""
+    runner_pool.resize(size)
+
+def wait_until_ready(port, timeout=READY_TIMEOUT):
+    """Poll the Streamlit health endpoint until the runner answers."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/_stcore/health", timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    return False
+
+def _await_ready(port, pid, pid_started, what, cleanup):
+    """Wait for a launched process; if it never answers, stop it, run cleanup() to fix its records, and raise LaunchError."""
+    if wait_until_ready(port):
+        return
+    kill_runner(pid, pid_started)
+    cleanup()
+    raise LaunchError(f"{what} did not start within {READY_TIMEOUT} seconds.")
+
+def _server_failed(name):
+    database.stop_server_record(name)
+    database.record_runner_health("server", name, FAILED)
+
+# --- Shared Tutor Hub ---
+
+def ensure_hub():
+    """Start the shared tutor hub if it is not running. Returns (port, pid)."""
+    server = database.get_server(HUB_NAME)
+    if server and server['status'] == 'running' and is_runner_alive(server['pid'], server.get('pid_started')):
+        return server['port'], server['pid']
+
+    port = allocate_port(f"server:{HUB_NAME}")
+    process = runner_pool.launch(port, ["mode=shared"], RUNNER_SCRIPT)
+    started = process_started(process.pid)
+    database.update_server(HUB_NAME, port, process.pid, pid_started=started)
+    # Tutors already on the hub follow it to its new process
+    database.repoint_shared_deployments(port, process.pid, started)
+
+    _await_ready(port, process.pid, started, "The tutor hub", lambda: _server_failed(HUB_NAME))
+    return port, process.pid
+
+def stop_hub():
+    server = database.get_server(HUB_NAME)
+    if server and server['pid']:
+        kill_runner(server['pid'], server.get('pid_started'))
+    database.stop_server_record(HUB_NAME)
+
+# --- Wake-on-demand Proxy ---
+
+def ensure_proxy():
+    """Start the front proxy that owns the public ports of hibernatable tutors. Returns its control port."""
+    server = database.get_server(PROXY_NAME)
+    if server and server['status'] == 'running' and is_runner_alive(server['pid'], server.get('pid_started')):
+        return server['port']
+
+    port = allocate_port(f"server:{PROXY_NAME}")
+    process = subprocess.Popen(
+        [sys.executable, PROXY_SCRIPT, "--control-port", str(port), "--db", os.path.abspath(database.DB_FILE)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    started = process_started(process.pid)
+    database.update_server(PROXY_NAME, port, process.pid, pid_started=started)
+    _await_ready(port, process.pid, started, "The wake-on-demand proxy", lambda: _server_failed(PROXY_NAME))
+    return port
+
+def stop_proxy():
+    server = database.get_server(PROXY_NAME)
+    if server and server['pid']:
+        kill_runner(server['pid'], server.get('pid_started'))
+    database.stop_server_record(PROXY_NAME)
+
+# --- LLM Gateway ---
+
+def ensure_gateway(concurrency=None):
+    """Start the gateway that queues Ollama requests from every runner. Returns its port."""
+    global gateway_concurrency
+    if concurrency is not None:
+        gateway_concurrency = concurrency
+    server = database.get_server(GATEWAY_NAME)
+    if server and server['status'] == 'running' and is_runner_alive(server['pid'], server.get('pid_started')):
+        return server['port']
+
+    port = allocate_port(f"server:{GATEWAY_NAME}")
+    process = subprocess.Popen(
+        [sys.executable, GATEWAY_SCRIPT, "--port", str(port), "--concurrency", str(gateway_concurrency)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    started = process_started(process.pid)
+    database.update_server(GATEWAY_NAME, port, process.pid, pid_started=started)
+    _await_ready(port, process.pid, started, "The LLM gateway", lambda: _server_failed(GATEWAY_NAME))
+    return port
+
+def stop_gateway():
+    server = database.get_server(GATEWAY_NAME)
+    if server and server['pid']:
+        kill_runner(server['pid'], server.get('pid_started'))
+    database.stop_server_record(GATEWAY_NAME)
+
+def stop_server(name):
+    """Stop the hub, proxy or gateway by its servers-table name."""
+    {PROXY_NAME: stop_proxy, GATEWAY_NAME: stop_gateway}.get(name, stop_hub)()
+
+# --- Tutor Lifecycle ---
+
+def start_student_app(user_id, username, mode="process", hibernate=False):
+    """Launch the tutor for a user. Returns the port it is served on.
+
+    Raises LaunchError if the tutor does not come up; it is then left stopped
+    with health FAILED and its ports released.
+
+    With hibernate=True (process mode only) the tutor is served through the front
+    proxy, so the supervisor can stop it when idle and the next visitor wakes it.
+    """
+    # Check if already running in the requested mode
+    dep = database.get_deployment(user_id)
+    if dep and dep['status'] == 'hibernated' and mode == "process":
+        ensure_proxy()
+        wake_student_app(user_id)
+        return dep['port']
+    if dep and dep['status'] == 'running' and dep.get('mode', 'process') == mode:
+        # Check if process is actually alive
+        if is_runner_alive(dep['pid'], dep.get('pid_started')):
+            return dep['port'] # Still running
+    elif dep and dep['status'] == 'running':
+        # Switching serving mode: release the old deployment first
+        stop_student_app(user_id)
+
+    if mode == "shared":
+        port, pid = ensure_hub()
+        database.update_deployment(user_id, port, pid, mode="shared", pid_started=database.get_server(HUB_NAME)['pid_started'])
+        return port
+
+    port = allocate_port(f"user:{user_id}")
+    backend_port = None
+    if hibernate:
+        # The proxy takes the public port; the runner listens on a private one behind it
+        ensure_proxy()
+        backend_port = allocate_port(f"runner:{user_id}")
+
+    # Start process (on a pre-imported worker when one is warm)
+    process = runner_pool.launch(backend_port or port, [f"user_id={user_id}"], RUNNER_SCRIPT)
+
+    # Update DB
+    started = process_started(process.pid)
+    database.update_deployment(user_id, port, process.pid, pid_started=started, backend_port=backend_port)
+
+    def failed():
+        database.stop_deployment_record(user_id) # Also releases its public and runner ports
+        database.record_runner_health("deployment", user_id, FAILED)
+    _await_ready(backend_port or port, process.pid, started, "The tutor", failed)
+    return port
+
+def hibernate_student_app(user_id):
+    """Stop an idle proxied tutor but keep its public port, so the next visitor wakes it."""
+    dep = database.get_deployment(user_id)
+    if not dep or dep['status'] != 'running' or not dep.get('backend_port'):
+        return 0
+    rss = 0
+    if is_runner_alive(dep['pid'], dep.get('pid_started')):
+        try:
+            rss = psutil.Process(dep['pid']).memory_info().rss
+        except psutil.Error:
+            pass
+        kill_runner(dep['pid'], dep.get('pid_started'))
+    database.hibernate_deployment_record(user_id, rss)
+    return rss
+
+def wake_student_app(user_id):
+    """Relaunch a hibernated tutor behind the proxy and wait until it answers. Returns its backend port.
+
+    Raises LaunchError if it does not answer; it is then hibernated again (runner
+    port released), so the proxy never routes to it and the next visitor retries.
+    """
+    dep = database.get_deployment(user_id)
+    if not dep:
+        return None
+    if dep['status'] == 'running' and is_runner_alive(dep['pid'], dep.get('pid_started')):
+        return dep['backend_port']
+    backend_port = allocate_port(f"runner:{user_id}")
+    process = runner_pool.launch(backend_port, [f"user_id={user_id}"], RUNNER_SCRIPT)
+    started = process_started(process.pid)
+    database.update_deployment(user_id, dep['port'], process.pid, pid_started=started, backend_port=backend_port)
+    _await_ready(backend_port, process.pid, started, "The tutor", lambda: database.hibernate_deployment_record(user_id))
+    return backend_port
+
+def stop_student_app(user_id):
+    dep = database.get_deployment(user_id)
+    if not dep or (not dep['pid'] and dep['status'] != 'hibernated'):
+        return
+    if dep.get('mode') == 'shared':
+        # The hub keeps serving other tutors; only retire it once nobody is left
+        database.stop_deployment_record(user_id)
+        if database.count_shared_deployments() == 0:
+            stop_hub()
+        return
+    kill_runner(dep['pid'], dep.get('pid_started'))
+    database.stop_deployment_record(user_id)
+
+def restart_runner(kind, name):
+    """Replace a crashed or hung runner, keeping its port. kind is 'deployment' (name = user id) or 'server'."""
+    if kind == "server":
+        server = database.get_server(name)
+        if server and server['pid']:
+            kill_runner(server['pid'], server.get('pid_started'))
+        if name == PROXY_NAME:
+            return ensure_proxy()
+        if name == GATEWAY_NAME:
+            return ensure_gateway()
+        return ensure_hub()[0]
+    user_id = int(name)
+    dep = database.get_deployment(user_id)
+    if dep and dep['pid']:
+        kill_runner(dep['pid'], dep.get('pid_started'))
+    if dep and dep.get('backend_port'):
+        return wake_student_app(user_id)
+    user = database.get_user_by_id(user_id)
+    # The port lease is still ours, so the tutor comes back on the same URL
+    return start_student_app(user_id, user['username'], mode="process")
+
+def get_app_path(dep):
+    """Path (with query string) a deployment is reachable on, relative to its port."""
+    if dep.get('mode') == 'shared':
+        return f"/?user_id={dep['user_id']}"
+    return ""
@@ -0,0 +1,102 @@
+"""Shared, TTL-cached catalogs of Ollama models and AnythingLLM workspaces.
+
+The App Designer used to call the backends on every "Load" button press and
+keep the result in that one session, so every student re-fetched the same
+lists. Catalogs are now cached in the teacher app process per backend URL
+(and API key, for workspaces) and shared by every session:
+
+  - younger than FRESH_FOR seconds: served as is;
+  - older, up to STALE_FOR seconds: served instantly while one background
+    refresh runs (stale-while-revalidate);
+  - never fetched or older than that: fetched before returning, with
+    concurrent callers waiting on the same fetch.
+
+A failed refresh keeps the last good list and records the error; it is
+retried after ERROR_RETRY seconds. refresh=True (the Load buttons) waits for
+a new fetch; wait=False never blocks (a first fetch runs in the background
+and the caller gets an empty catalog until it lands).
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_client
+import metrics
+
+FRESH_FOR = 60
+STALE_FOR = 24 * 3600
+ERROR_RETRY = 10
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="discovery")
+_catalogs = {} # key -> Catalog
+_lock = threading.Lock()
+
+
+class Catalog:
+    def __init__(self):
+        self.items = None # None until the first successful fetch
+        self.fetched_at = 0.0 # time of the last fetch attempt
+        self.error = None
+        self.pending = None # Future of the refresh in progress
+
+    def age(self):
+        return time.time() - self.fetched_at
+
+
+def _fetch_models(ollama_url):
+    response = llm_client.get(f"{ollama_url}/api/tags", read_timeout=llm_client.DISCOVERY_TIMEOUT)
+    response.raise_for_status()
+    return [m['name'] for m in response.json().get('models', [])]
+
+def _fetch_workspaces(allm_url, api_key):
+    headers = {"Authorization": f"Bearer {api_key}", "accept": "application/json"}
+    response = llm_client.get(f"{allm_url}/workspaces", read_timeout=llm_client.DISCOVERY_TIMEOUT, headers=headers)
+    response.raise_for_status()
+    # Expecting {"workspaces": [{"slug": "...", "name": "..."}, ...]}
+    return {w['slug']: w['name'] for w in response.json().get('workspaces', [])}
+
+def _refresh(catalog, op, fetch, args):
+    with metrics.timer(op) as t:
+        try:
+            items, error = fetch(*args), None
+        except Exception as e:
+            items, error = None, str(e)
+        t.error = error is not None
+    with _lock:
+        if items is not None:
+            catalog.items = items
+        catalog.error = error
+        catalog.fetched_at = time.time()
+        catalog.pending = None
+
+def _get(key, fetch, args, refresh, wait):
+    with _lock:
+        catalog = _catalogs.setdefault(key, Catalog())
+        age = catalog.age()
+        expired = catalog.fetched_at == 0 or age >= STALE_FOR
+        due = age >= (ERROR_RETRY if catalog.error else FRESH_FOR)
+        if (refresh or due) and catalog.pending is None:
+            catalog.pending = _executor.submit(_refresh, catalog, f"discovery_{key[0]}", fetch, args)
+        pending = catalog.pending
+    if pending is not None and (refresh or (expired and wait)):
+        try:
+            pending.result(timeout=llm_client.DISCOVERY_TIMEOUT + llm_client.CONNECT_TIMEOUT)
+        except Exception:
+            pass # Still running: serve what there is
+    return catalog
+
+def get_models(ollama_url, refresh=False, wait=True):
+    """Catalog of model names on an Ollama server."""
+    ollama_url = ollama_url.rstrip("/")
+    return _get(("models", ollama_url), _fetch_models, (ollama_url,), refresh, wait)
+
+def get_workspaces(allm_url, api_key, refresh=False, wait=True):
+    """Catalog of {slug: name} for an AnythingLLM server, as seen with api_key."""
+    allm_url = allm_url.rstrip("/")
+    key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+    return _get(("workspaces", allm_url, key_id), _fetch_workspaces, (allm_url, api_key), refresh, wait)
+
+def clear():
+    with _lock:
+        _catalogs.clear()
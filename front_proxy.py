@@ -0,0 +1,195 @@
+"""Wake-on-demand front proxy for hibernatable tutors.
+
+Tutors published with idle hibernation on are never reached directly: this
+process listens on each tutor's public port and pipes TCP traffic (HTTP and
+the Streamlit websocket alike) to the runner's private backend port. Because
+every session passes through here, the proxy knows which tutors are in use and
+records it as deployments.last_active, which the supervisor's idle reaper reads.
+
+When a connection arrives for a hibernated tutor, the proxy relaunches its
+runner and holds the connection open until the runner passes its health check,
+then forwards it as usual. Wake latency is recorded per tutor.
+
+A small HTTP endpoint on the control port answers /_stcore/health (so the
+supervisor can watch the proxy like any runner) and /stats.
+
+Started by deployer.ensure_proxy(); run directly with
+python front_proxy.py --control-port 8600.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+import database
+import deployer
+
+logger = logging.getLogger("dse.proxy")
+
+SYNC_INTERVAL = 1.0 # seconds between route table refreshes
+ACTIVITY_FLUSH_INTERVAL = 10 # seconds between last_active writes
+BUFFER_SIZE = 64 * 1024
+
+
+class FrontProxy:
+    def __init__(self, control_port):
+        self.control_port = control_port
+        self.routes = {} # public port -> deployment row
+        self._listeners = {} # public port -> asyncio.Server
+        self._open = {} # user_id -> open client connections
+        self._touched = set() # user_ids with traffic since the last flush
+        self._wake_locks = {}
+        self.wakes = []
+
+    async def run(self):
+        control = await asyncio.start_server(self._handle_control, "0.0.0.0", self.control_port, reuse_address=True)
+        async with control:
+            await asyncio.gather(self._sync_loop(), self._flush_loop())
+
+    # --- Routes ---
+
+    async def _sync_loop(self):
+        while True:
+            try:
+                await self._sync_routes()
+            except Exception:
+                logger.exception("route sync failed")
+            await asyncio.sleep(SYNC_INTERVAL)
+
+    async def _sync_routes(self):
+        self.routes = await asyncio.to_thread(database.get_proxy_routes)
+        for port in list(self._listeners):
+            if port not in self.routes:
+                self._listeners.pop(port).close()
+        for port in self.routes:
+            if port not in self._listeners:
+                try:
+                    self._listeners[port] = await asyncio.start_server(
+                        lambda r, w, port=port: self._handle_client(port, r, w),
+                        "0.0.0.0", port, reuse_address=True
+                    )
+                except OSError as e:
+                    logger.warning("cannot listen on %s: %s", port, e)
+
+    # --- Forwarding ---
+
+    async def _handle_client(self, public_port, client_reader, client_writer):
+        route = self.routes.get(public_port)
+        if route is None:
+            client_writer.close()
+            return
+        user_id = route['user_id']
+        self._open[user_id] = self._open.get(user_id, 0) + 1
+        self._touched.add(user_id)
+        try:
+            if route['status'] != 'running':
+                await self._wake(public_port, user_id)
+            try:
+                backend_reader, backend_writer = await asyncio.open_connection("127.0.0.1", self.routes[public_port]['backend_port'])
+            except OSError:
+                # Hibernated or crashed since the last route sync: wake it and try once more
+                backend_port = await self._wake(public_port, user_id, force=True)
+                backend_reader, backend_writer = await asyncio.open_connection("127.0.0.1", backend_port)
+            await asyncio.gather(
+                self._pipe(client_reader, backend_writer, user_id),
+                self._pipe(backend_reader, client_writer, user_id),
+            )
+        except Exception as e:
+            logger.warning("tutor %s unreachable: %s", user_id, e)
+        finally:
+            self._open[user_id] -= 1
+            client_writer.close()
+
+    async def _pipe(self, reader, writer, user_id):
+        try:
+            while True:
+                data = await reader.read(BUFFER_SIZE)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+                self._touched.add(user_id)
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    async def _wake(self, public_port, user_id, force=False):
+        """Relaunch a hibernated tutor once, however many connections are waiting on it."""
+        lock = self._wake_locks.setdefault(user_id, asyncio.Lock())
+        started_waiting = time.monotonic()
+        async with lock:
+            route = self.routes.get(public_port, {})
+            if route.get('status') == 'running' and (not force or route.get('woken_at', 0) > started_waiting):
+                return route['backend_port'] # Another connection already woke it
+            start = time.perf_counter()
+            backend_port = await asyncio.to_thread(deployer.wake_student_app, user_id)
+            wake_ms = (time.perf_counter() - start) * 1000
+            await asyncio.to_thread(database.record_wake, user_id, wake_ms)
+            self.routes[public_port] = dict(route, status='running', backend_port=backend_port, woken_at=time.monotonic())
+            self.wakes.append(wake_ms)
+            logger.info("woke tutor %s in %.0f ms", user_id, wake_ms)
+            return backend_port
+
+    # --- Activity ---
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(ACTIVITY_FLUSH_INTERVAL)
+            # An open connection (e.g. the Streamlit websocket) counts as a session even when quiet
+            active = self._touched | {uid for uid, count in self._open.items() if count > 0}
+            self._touched = set()
+            if active:
+                try:
+                    await asyncio.to_thread(database.touch_deployments, sorted(active))
+                except Exception:
+                    logger.exception("activity flush failed")
+
+    # --- Control ---
+
+    async def _handle_control(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1")
+            path = request_line.split(" ")[1] if " " in request_line else "/"
+            if path == "/_stcore/health":
+                status, body = "200 OK", b"ok"
+            elif path == "/stats":
+                status, body = "200 OK", json.dumps(self.stats()).encode("utf-8")
+            else:
+                status, body = "404 Not Found", b""
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def stats(self):
+        return {
+            "routes": len(self.routes),
+            "hibernated": sum(1 for r in self.routes.values() if r['status'] == 'hibernated'),
+            "open_connections": sum(self._open.values()),
+            "wakes": len(self.wakes),
+            "avg_wake_ms": sum(self.wakes) / len(self.wakes) if self.wakes else None,
+            "max_wake_ms": max(self.wakes) if self.wakes else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wake-on-demand proxy for hibernatable tutors")
+    parser.add_argument("--control-port", type=int, required=True)
+    parser.add_argument("--db", default=database.DB_FILE, help="path to the platform database")
+    parser.add_argument("--warm-pool", type=int, default=1, help="pre-imported runners kept ready for wakes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    database.DB_FILE = os.path.abspath(args.db)
+    deployer.set_warm_pool_size(args.warm_pool)
+    try:
+        asyncio.run(FrontProxy(args.control_port).run())
+    finally:
+        deployer.runner_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""Chat history storage for tutors.
+
+Session metadata (id, title, updated_at, message count) lives in a per-user
+SQLite index (data/<username>/history/index.db), so the sidebar can list
+sessions with one indexed, paginated query. Message bodies are only read when
+a session is opened.
+
+Each session body is an append-only journal (<session_id>.jsonl), one record
+per line:
+
+    {"op": "msg", "msg": {...}}   append a message
+    {"op": "reset"}               drop everything before this line
+
+A turn appends only its new messages, so bytes written per turn stay flat as a
+conversation grows. A torn last line (process killed mid-write) is ignored on
+read and truncated before the next append. Journals that accumulate dead
+records are compacted in the background by writing a fresh file and atomically
+replacing the old one. How often appends are fsynced is set by
+DSE_HISTORY_FSYNC: "always", "interval" (default, at most every 2 s) or "never".
+
+Existing history directories (<session_id>.json files) are imported
+automatically the first time a user's index is opened, and each legacy file is
+converted to a journal the next time its session is saved. To import
+everything up front, run:
+
+    python history_store.py migrate [--data-dir data]
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import tutor_cache
+
+DATA_DIR = "data"
+INDEX_FILE = "index.db"
+
+FSYNC_POLICY = os.environ.get("DSE_HISTORY_FSYNC", "interval")
+FSYNC_INTERVAL = 2.0 # seconds, for the "interval" policy
+COMPACT_MIN_DEAD = 1 # compact once a journal holds this many superseded records
+
+_journal_locks = {}
+_journal_locks_guard = threading.Lock()
+_journal_state = {} # path -> (good_size, live_count, dead_count) as of our last read/write
+_last_fsync = {}
+_compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-compact")
+
+
+def get_history_dir(username, data_dir=None):
+    return os.path.join(data_dir or DATA_DIR, username, "history")
+
+def _session_file(history_dir, session_id):
+    return os.path.join(history_dir, f"{session_id}.json")
+
+def _journal_file(history_dir, session_id):
+    return os.path.join(history_dir, f"{session_id}.jsonl")
+
+def _connect(username, data_dir=None):
+    history_dir = get_history_dir(username, data_dir)
+    os.makedirs(history_dir, exist_ok=True)
+    index_path = os.path.join(history_dir, INDEX_FILE)
+    is_new = not os.path.exists(index_path)
+    conn = sqlite3.connect(index_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            message_count INTEGER DEFAULT 0
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at DESC)")
+    if is_new:
+        _import_sessions(conn, history_dir)
+    conn.commit()
+    return conn
+
+def _import_sessions(conn, history_dir):
+    """Index every session body (legacy .json or .jsonl journal) in history_dir. Returns the number imported."""
+    imported = 0
+    paths = glob.glob(os.path.join(history_dir, "*.json")) + glob.glob(os.path.join(history_dir, "*.jsonl"))
+    for fpath in paths:
+        sid = os.path.splitext(os.path.basename(fpath))[0]
+        if fpath.endswith(".jsonl"):
+            if os.path.exists(_session_file(history_dir, sid)):
+                continue # The legacy file is still authoritative until it is converted
+            messages = _read_journal(fpath)[0]
+            data = {"title": make_title(messages), "messages": messages}
+        else:
+            try:
+                with open(fpath, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {"title": "Corrupted"}
+        title = data.get("title", "Untitled Chat")
+        count = len(data.get("messages", []))
+        updated_at = data.get("updated_at") or datetime.fromtimestamp(os.path.getmtime(fpath)).isoformat()
+        conn.execute('''
+            INSERT INTO sessions (id, title, updated_at, message_count) VALUES (?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET title=excluded.title, updated_at=excluded.updated_at, message_count=excluded.message_count
+        ''', (sid, title, updated_at, count))
+        imported += 1
+    return imported
+
+def make_title(messages):
+    for msg in messages:
+        if msg["role"] == "user":
+            return msg["content"][:30] + "..." if len(msg["content"]) > 30 else msg["content"]
+    return "New Chat"
+
+# --- Journal ---
+
+def _lock_for(path):
+    with _journal_locks_guard:
+        lock = _journal_locks.get(path)
+        if lock is None:
+            lock = _journal_locks[path] = threading.Lock()
+        return lock
+
+def _read_journal(path):
+    """Replay a journal. Returns (messages, good_size, dead_count); a torn tail is excluded from good_size."""
+    messages = []
+    dead = 0
+    good_size = 0
+    try:
+        with open(path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break # Torn write: the process died mid-line
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    break
+                if record.get("op") == "reset":
+                    dead += len(messages) + 1
+                    messages = []
+                elif record.get("op") == "msg":
+                    messages.append(record["msg"])
+                good_size += len(raw)
+    except FileNotFoundError:
+        pass
+    _journal_state[path] = (good_size, len(messages), dead)
+    return messages, good_size, dead
+
+def _journal_position(path):
+    """(good_size, live_count, dead_count) for path, re-reading only if another writer changed it."""
+    state = _journal_state.get(path)
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return 0, 0, 0
+    if state and state[0] == size:
+        return state
+    _read_journal(path)
+    return _journal_state[path]
+
+def _maybe_fsync(path, f):
+    if FSYNC_POLICY == "always":
+        os.fsync(f.fileno())
+    elif FSYNC_POLICY == "interval":
+        now = time.monotonic()
+        if now - _last_fsync.get(path, 0) >= FSYNC_INTERVAL:
+            os.fsync(f.fileno())
+            _last_fsync[path] = now
+
+def _encode(record):
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+def _append_messages(path, messages):
+    """Append the messages the journal does not have yet. Returns bytes written."""
+    with _lock_for(path):
+        good_size, live, dead = _journal_position(path)
+        if len(messages) >= live:
+            new_records = [{"op": "msg", "msg": m} for m in messages[live:]]
+        else:
+            # The conversation was shortened: start over inside the same journal
+            new_records = [{"op": "reset"}] + [{"op": "msg", "msg": m} for m in messages]
+            dead += live + 1
+        if not new_records:
+            return 0
+        payload = b"".join(_encode(r) for r in new_records)
+        with open(path, "ab") as f:
+            if f.tell() != good_size:
+                f.truncate(good_size) # Drop a torn tail left by a crash
+            f.write(payload)
+            f.flush()
+            _maybe_fsync(path, f)
+        _journal_state[path] = (good_size + len(payload), len(messages), dead)
+    if dead >= COMPACT_MIN_DEAD:
+        _compactor.submit(compact_journal, path)
+    return len(payload)
+
+def _write_journal_atomic(path, messages):
+    tmp_path = f"{path}.tmp"
+    payload = b"".join(_encode({"op": "msg", "msg": m}) for m in messages)
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _journal_state[path] = (len(payload), len(messages), 0)
+
+def compact_journal(path):
+    """Rewrite a journal with only its live messages, atomically."""
+    with _lock_for(path):
+        messages, _, dead = _read_journal(path)
+        if dead:
+            _write_journal_atomic(path, messages)
+
+def _convert_legacy(history_dir, session_id):
+    """Turn a legacy <session_id>.json body into a journal. Returns its messages."""
+    legacy = _session_file(history_dir, session_id)
+    with open(legacy, "r", encoding="utf-8") as f:
+        messages = json.load(f).get("messages", [])
+    path = _journal_file(history_dir, session_id)
+    with _lock_for(path):
+        _write_journal_atomic(path, messages)
+    os.remove(legacy)
+    return messages
+
+# --- Public API ---
+
+def _index_path(username):
+    return os.path.join(get_history_dir(username), INDEX_FILE)
+
+def list_sessions(username, limit=30, offset=0):
+    """Most recently updated sessions first: [{"id", "title", "updated_at", "message_count"}, ...]."""
+    def load():
+        conn = _connect(username)
+        rows = conn.execute(
+            "SELECT id, title, updated_at, message_count FROM sessions ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+    # Served from memory until the index changes (see tutor_cache)
+    return tutor_cache.cached("sessions", username, load, paths=(_index_path(username),), args=(limit, offset))
+
+def count_sessions(username):
+    def load():
+        conn = _connect(username)
+        count = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        conn.close()
+        return count
+    return tutor_cache.cached("session_count", username, load, paths=(_index_path(username),))
+
+def _invalidate(username):
+    tutor_cache.invalidate("sessions", username)
+    tutor_cache.invalidate("session_count", username)
+
+def load_session(username, session_id):
+    history_dir = get_history_dir(username)
+    legacy = _session_file(history_dir, session_id)
+    if os.path.exists(legacy):
+        try:
+            with open(legacy, "r", encoding="utf-8") as f:
+                data = json.load(f)
+                return data.get("messages", []), data.get("title", "New Chat")
+        except:
+            return [], "New Chat"
+    path = _journal_file(history_dir, session_id)
+    with _lock_for(path):
+        messages = _read_journal(path)[0]
+    if not messages:
+        return [], "New Chat"
+    return messages, make_title(messages)
+
+def save_session(username, session_id, messages):
+    if not messages: return
+
+    title = make_title(messages)
+    history_dir = get_history_dir(username)
+    os.makedirs(history_dir, exist_ok=True)
+
+    messages_to_save = []
+    for msg in messages:
+        msg_copy = msg.copy()
+        if "image_data" in msg_copy:
+            del msg_copy["image_data"] # Don't save bytes to JSON
+        messages_to_save.append(msg_copy)
+
+    if os.path.exists(_session_file(history_dir, session_id)):
+        _convert_legacy(history_dir, session_id)
+    _append_messages(_journal_file(history_dir, session_id), messages_to_save)
+
+    conn = _connect(username)
+    conn.execute('''
+        INSERT INTO sessions (id, title, updated_at, message_count) VALUES (?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET title=excluded.title, updated_at=excluded.updated_at, message_count=excluded.message_count
+    ''', (session_id, title, datetime.now().isoformat(), len(messages_to_save)))
+    conn.commit()
+    conn.close()
+    _invalidate(username)
+
+def delete_session(username, session_id):
+    conn = _connect(username)
+    deleted = conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+    conn.commit()
+    conn.close()
+    _invalidate(username)
+    history_dir = get_history_dir(username)
+    for file_path in (_session_file(history_dir, session_id), _journal_file(history_dir, session_id)):
+        if os.path.exists(file_path):
+            with _lock_for(file_path):
+                os.remove(file_path)
+                _journal_state.pop(file_path, None)
+            deleted = True
+    return deleted
+
+def image_references(data_dir=None):
+    """Filenames of every image referenced from a live user's chat history.
+
+    Deleted users' backups (deleted_<timestamp>_<username>) do not count, so
+    image_store.prune can free the shared images only they referred to.
+    """
+    data_dir = data_dir or DATA_DIR
+    referenced = set()
+    for entry in os.listdir(data_dir) if os.path.isdir(data_dir) else ():
+        if entry == "system" or entry.startswith("deleted_"):
+            continue
+        history_dir = os.path.join(data_dir, entry, "history")
+        for path in glob.glob(os.path.join(history_dir, "*.jsonl")):
+            try:
+                with open(path, "rb") as f:
+                    for raw in f:
+                        try:
+                            msg = json.loads(raw).get("msg") or {}
+                        except ValueError:
+                            continue # Torn tail
+                        if msg.get("image_path"):
+                            referenced.add(msg["image_path"]) # Messages before a reset still count: keep rather than lose
+            except FileNotFoundError:
+                pass
+        for path in glob.glob(os.path.join(history_dir, "*.json")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    messages = json.load(f).get("messages", [])
+            except (OSError, ValueError):
+                continue
+            referenced.update(msg["image_path"] for msg in messages if msg.get("image_path"))
+    return referenced
+
+# --- Migration ---
+
+def migrate_user(username, data_dir=None):
+    """(Re)build one user's index from their history files. Returns the number of sessions indexed."""
+    conn = _connect(username, data_dir)
+    count = _import_sessions(conn, get_history_dir(username, data_dir))
+    conn.commit()
+    conn.close()
+    return count
+
+def migrate_all(data_dir=None):
+    data_dir = data_dir or DATA_DIR
+    results = {}
+    for entry in sorted(os.listdir(data_dir)):
+        if entry == "system" or entry.startswith("deleted_"):
+            continue
+        if os.path.isdir(os.path.join(data_dir, entry, "history")):
+            results[entry] = migrate_user(entry, data_dir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat history index tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="import existing JSON history into the session index")
+    migrate.add_argument("--data-dir", default=DATA_DIR)
+    migrate.add_argument("--user", help="only migrate this username")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        if args.user:
+            results = {args.user: migrate_user(args.user, args.data_dir)}
+        else:
+            results = migrate_all(args.data_dir)
+        for username, count in results.items():
+            print(f"{username}: {count} sessions indexed")
+        print(f"Done. {sum(results.values())} sessions across {len(results)} users.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Shrink uploaded photos before they are sent to the vision model.
+
+Phone photos are often 4-12 MB. Sent as-is they grow by a third when base64
+encoded into the Ollama request, and the model spends its time on pixels it
+does not need. prepare_for_vision:
+
+  - applies the EXIF orientation, so sideways worksheet photos arrive upright;
+  - downscales so the longer side is at most max_side pixels (JPEGs are
+    decoded at a reduced scale directly, which is much faster than a full
+    decode followed by a resize);
+  - optionally converts to grayscale, which suits text and maths worksheets;
+  - re-encodes as JPEG.
+
+Images that need none of this and are already smaller than the re-encoded
+version are sent unchanged. Anything Pillow cannot read is passed through
+as well, so the vision model still gets a chance at it.
+
+Runs on the image pipeline's worker thread (see pipeline.py).
+"""
+import io
+
+from PIL import Image, ImageOps
+
+DEFAULT_MAX_SIDE = 1536
+JPEG_QUALITY = 85
+ORIENTATION_TAG = 0x0112
+
+
+def settings_key(max_side=DEFAULT_MAX_SIDE, grayscale=False, quality=JPEG_QUALITY):
+    """Identifies what prepare_for_vision does with these settings (part of image_store's description cache key)."""
+    return f"max_side={int(max_side or 0)};grayscale={int(bool(grayscale))};quality={quality}"
+
+def prepare_for_vision(image_bytes, max_side=DEFAULT_MAX_SIDE, grayscale=False, quality=JPEG_QUALITY):
+    """Return the bytes to send to the vision model for an uploaded image."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as original:
+            source_format = original.format
+            if max_side and max(original.size) > max_side:
+                scale = max_side / max(original.size)
+                original.draft("L" if grayscale else "RGB", (int(original.width * scale) + 1, int(original.height * scale) + 1))
+            rotated = original.getexif().get(ORIENTATION_TAG, 1) != 1
+            img = ImageOps.exif_transpose(original)
+            if grayscale:
+                img = img.convert("L")
+            elif img.mode in ("RGBA", "LA", "P"):
+                # JPEG has no alpha: put transparent screenshots on white, not black
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", rgba.size, "white")
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            resized = bool(max_side) and max(img.size) > max_side
+            if resized:
+                img.thumbnail((max_side, max_side), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, "JPEG", quality=quality, optimize=True)
+    except Exception:
+        return image_bytes
+    prepared = out.getvalue()
+    if not (rotated or resized or grayscale) and source_format in ("JPEG", "PNG") and len(image_bytes) <= len(prepared):
+        return image_bytes
+    return prepared
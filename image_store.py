@@ -0,0 +1,247 @@
+"""Content-addressed image storage and a cache of vision model descriptions.
+
+Uploaded images are stored once, under the SHA-256 of their bytes, in
+data/system/images/<first two hex digits>/<hash>.<ext>. When the same worksheet
+photo is uploaded by a whole class (or re-uploaded by one student), every
+upload after the first only adds a row count, not a file.
+
+Descriptions from the vision model are cached under (image hash, model,
+prompt, preprocessing), so asking about an image that has already been
+described skips the vision model entirely. preprocessing is
+image_prep.settings_key() of what the model was actually shown: a tutor that
+changes its image size or grayscale setting gets fresh descriptions. Cut-short
+and failed descriptions are not cached.
+
+Chat histories written before this store existed refer to per-user
+"<uuid>.png" files; get_image_path still resolves those.
+
+Shared images are removed by prune() once no chat history refers to them
+(the teacher app runs it when a user is deleted). An image uploaded within
+PRUNE_GRACE seconds is kept even if unreferenced, since its chat turn may not
+have been saved yet.
+
+Both live in data/system/images.db alongside upload and cache counters.
+Cache hits are counted in memory and added to the store every
+HITS_FLUSH_INTERVAL seconds by a background thread (and at exit), so a
+lookup never takes the write lock.
+"""
+import atexit
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+IMAGE_DIR = os.path.join("data", "system", "images")
+IMAGE_DB = os.path.join("data", "system", "images.db")
+HITS_FLUSH_INTERVAL = 5 # seconds between writes of this process's description hits
+PRUNE_GRACE = 3600 # seconds an unreferenced upload is kept for its chat turn to be saved
+
+_local = threading.local()
+_lock = threading.Lock()
+_hits = {} # description key -> hits not yet added to the store
+_flusher = None # (pid, thread)
+_HASHED_NAME = re.compile(r"^[0-9a-f]{64}\.\w+$")
+
+
+def image_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def _extension(image_bytes):
+    if image_bytes[:3] == b"\xff\xd8\xff":
+        return "jpg"
+    return "png"
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        os.makedirs(os.path.dirname(IMAGE_DB), exist_ok=True)
+        conn = sqlite3.connect(IMAGE_DB, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS images (
+                hash TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                uploads INTEGER NOT NULL DEFAULT 1,
+                created_at REAL NOT NULL
+            );
+        ''')
+        _create_descriptions(conn)
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def _create_descriptions(conn):
+    if "preprocessing" in [row[1] for row in conn.execute("PRAGMA table_info(descriptions)")]:
+        return
+    conn.execute("BEGIN IMMEDIATE") # Every runner opens this store; only one may create or rebuild the table
+    try:
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(descriptions)")]
+        if "preprocessing" in columns:
+            conn.execute("COMMIT")
+            return
+        conn.execute('''
+            CREATE TABLE descriptions_new (
+                image_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                preprocessing TEXT NOT NULL,
+                description TEXT NOT NULL,
+                elapsed REAL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (image_hash, model, prompt, preprocessing)
+            )
+        ''')
+        if columns:
+            # Descriptions cached before the key had the preprocessing settings: kept for the
+            # stats, under a key no lookup uses, since what the model was shown is unknown
+            conn.execute('''
+                INSERT INTO descriptions_new (image_hash, model, prompt, preprocessing, description, elapsed, hits, created_at)
+                SELECT image_hash, model, prompt, '', description, elapsed, hits, created_at FROM descriptions
+            ''')
+            conn.execute("DROP TABLE descriptions")
+        conn.execute("ALTER TABLE descriptions_new RENAME TO descriptions")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+# --- Images ---
+
+def save_image(image_bytes):
+    """Store an uploaded image once per distinct content. Returns its filename."""
+    digest = image_hash(image_bytes)
+    filename = f"{digest}.{_extension(image_bytes)}"
+    file_path = get_image_path(None, filename)
+    try:
+        os.utime(file_path) # Restart its PRUNE_GRACE: this upload is not in a history yet
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(image_bytes)
+        os.replace(tmp_path, file_path) # Concurrent uploads of the same image write identical bytes
+    conn = _connect()
+    conn.execute('''
+        INSERT INTO images (hash, filename, size, created_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(hash) DO UPDATE SET uploads = uploads + 1
+    ''', (digest, filename, len(image_bytes), time.time()))
+    conn.commit()
+    return filename
+
+def get_image_path(username, filename):
+    """Path of an image referenced from a chat history (content-addressed or legacy per-user)."""
+    if _HASHED_NAME.match(filename):
+        return os.path.join(IMAGE_DIR, filename[:2], filename)
+    return os.path.join("data", username, "images", filename)
+
+def prune(referenced, grace=PRUNE_GRACE):
+    """Delete stored images (and their descriptions) whose filename is not in referenced.
+
+    referenced is normally history_store.image_references(). Returns
+    (images removed, bytes freed).
+    """
+    conn = _connect()
+    removed, freed = 0, 0
+    for digest, filename, size in conn.execute("SELECT hash, filename, size FROM images").fetchall():
+        if filename in referenced:
+            continue
+        file_path = get_image_path(None, filename)
+        try:
+            if time.time() - os.path.getmtime(file_path) < grace:
+                continue
+        except FileNotFoundError:
+            pass
+        with conn:
+            conn.execute("DELETE FROM images WHERE hash = ?", (digest,))
+            conn.execute("DELETE FROM descriptions WHERE image_hash = ?", (digest,))
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        removed += 1
+        freed += size
+    return removed, freed
+
+# --- Vision descriptions ---
+
+def get_description(digest, model, prompt, preprocessing):
+    key = (digest, model, prompt, preprocessing)
+    conn = _connect()
+    row = conn.execute(
+        "SELECT description FROM descriptions WHERE image_hash = ? AND model = ? AND prompt = ? AND preprocessing = ?", key
+    ).fetchone()
+    if row is None:
+        return None
+    with _lock:
+        _hits[key] = _hits.get(key, 0) + 1
+    _ensure_flusher()
+    return row[0]
+
+def flush():
+    """Add this process's description hits since the last flush to the store."""
+    global _hits
+    with _lock:
+        hits, _hits = _hits, {}
+    if not hits:
+        return
+    try:
+        conn = _connect()
+        with conn:
+            conn.executemany(
+                "UPDATE descriptions SET hits = hits + ? WHERE image_hash = ? AND model = ? AND prompt = ? AND preprocessing = ?",
+                [(count, *key) for key, count in hits.items()]
+            )
+    except sqlite3.Error:
+        # Keep them for the next attempt rather than losing them
+        with _lock:
+            for key, count in hits.items():
+                _hits[key] = _hits.get(key, 0) + count
+
+def _flush_loop():
+    while True:
+        time.sleep(HITS_FLUSH_INTERVAL)
+        flush()
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None or _flusher[0] != os.getpid():
+        with _lock:
+            if _flusher is None or _flusher[0] != os.getpid():
+                thread = threading.Thread(target=_flush_loop, name="image-store-flush", daemon=True)
+                thread.start()
+                _flusher = (os.getpid(), thread)
+                atexit.register(flush)
+
+def store_description(digest, model, prompt, preprocessing, description, elapsed=None):
+    if not description.strip() or description.startswith("[Vision Error]"):
+        return
+    conn = _connect()
+    conn.execute('''
+        INSERT OR REPLACE INTO descriptions (image_hash, model, prompt, preprocessing, description, elapsed, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (digest, model, prompt, preprocessing, description, elapsed, time.time()))
+    conn.commit()
+
+def stats():
+    """Disk saved by deduplication and vision calls avoided by the description cache."""
+    flush() # Include this process's latest hits
+    conn = _connect()
+    images, uploads, stored, saved = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(uploads), 0), COALESCE(SUM(size), 0), COALESCE(SUM(size * (uploads - 1)), 0) FROM images"
+    ).fetchone()
+    described, avoided, vision_saved = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(hits), 0), COALESCE(SUM(hits * COALESCE(elapsed, 0)), 0) FROM descriptions"
+    ).fetchone()
+    return {
+        "images": images,
+        "uploads": uploads,
+        "stored_bytes": stored,
+        "saved_bytes": saved,
+        "descriptions": described,
+        "vision_calls_avoided": avoided,
+        "vision_seconds_saved": vision_saved,
+    }
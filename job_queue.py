@@ -0,0 +1,272 @@
+"""Persistent background jobs for the tutors (notebook summaries, practice questions).
+
+Slow LLM calls used to run inside the Streamlit script, blocking the page for
+up to a minute, and their result was lost if the student clicked elsewhere.
+Now the page enqueues a job and polls its status; worker threads run it.
+
+Jobs live in the shared data/system/jobs.db, so they outlive the page that
+asked for them and the process that was running them:
+
+  - every runner process (and the hub) runs WORKERS worker threads, started by
+    start_workers(), that claim jobs of the kinds registered in that process;
+  - a claim is a lease of LEASE seconds. A job whose runner died (or was
+    stopped while hibernating) is claimed again by any worker once its lease
+    has run out, or right away if its process is gone;
+  - a handler that raises is retried after RETRY_DELAY * 2**(attempt - 1)
+    seconds, up to the job's max_attempts, then the job is "failed";
+  - cancel() drops a queued job at once. A running one is flagged: the handler
+    can check job.cancelled() before storing anything, and its result is
+    discarded either way.
+
+Finished jobs are kept KEEP_FINISHED seconds for the page to show, then pruned.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+
+JOBS_DB = os.path.join("data", "system", "jobs.db")
+WORKERS = int(os.environ.get("DSE_JOB_WORKERS", 2))
+POLL_INTERVAL = 2 # seconds an idle worker waits before looking for work again
+LEASE = 300 # seconds a claim is held; more than any one LLM call may take
+RETRY_DELAY = 5
+MAX_ATTEMPTS = 3
+KEEP_FINISHED = 7 * 24 * 3600
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+ACTIVE = (QUEUED, RUNNING)
+
+_handlers = {} # kind -> handler(job)
+_wakeup = threading.Event()
+_workers = None # (pid, threads)
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class JobError(Exception):
+    """Raised by a handler for a failure worth retrying (e.g. the backend answered with an error)."""
+
+
+class Job:
+    def __init__(self, row):
+        self.id = row["id"]
+        self.kind = row["kind"]
+        self.tutor = row["tutor"]
+        self.label = row["label"]
+        self.payload = json.loads(row["payload"])
+        self.attempts = row["attempts"]
+        self.max_attempts = row["max_attempts"]
+
+    def cancelled(self):
+        row = _connect().execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)).fetchone()
+        return row is None or bool(row[0])
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        os.makedirs(os.path.dirname(JOBS_DB), exist_ok=True)
+        conn = sqlite3.connect(JOBS_DB, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                tutor TEXT NOT NULL,
+                label TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                result TEXT,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                worker_pid INTEGER,
+                lease_until REAL,
+                run_after REAL NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, run_after);
+            CREATE INDEX IF NOT EXISTS idx_jobs_tutor ON jobs(tutor, kind, created_at);
+        ''')
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+# --- Queue API ---
+
+def register(kind, handler):
+    """Run jobs of this kind in this process: handler(job) returns the result text or raises."""
+    _handlers[kind] = handler
+
+def enqueue(kind, tutor, payload, label="", max_attempts=MAX_ATTEMPTS, delay=0, unique=False):
+    """Queue a job to start in `delay` seconds. With unique=True, a job of this kind already
+    queued (not yet started) for the tutor is reused instead (starting no later than this
+    one would have), and its id returned."""
+    now = time.time()
+    job_id = str(uuid.uuid4())
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if unique:
+            row = conn.execute("SELECT id FROM jobs WHERE tutor = ? AND kind = ? AND status = ? LIMIT 1", (tutor, kind, QUEUED)).fetchone()
+            if row:
+                conn.execute("UPDATE jobs SET run_after = MIN(run_after, ?) WHERE id = ?", (now + delay, row["id"]))
+                conn.execute("COMMIT")
+                if not delay:
+                    _wakeup.set()
+                return row["id"]
+        conn.execute(
+            "INSERT INTO jobs (id, kind, tutor, label, payload, status, max_attempts, run_after, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, tutor, label, json.dumps(payload, ensure_ascii=False), QUEUED, max_attempts, now + delay, now, now)
+        )
+        conn.execute("DELETE FROM jobs WHERE status NOT IN (?, ?) AND updated_at < ?", (*ACTIVE, now - KEEP_FINISHED))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    _wakeup.set()
+    return job_id
+
+def get(job_id):
+    row = _connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+def list_jobs(tutor, kind=None, limit=10):
+    """A tutor's jobs, newest first: the active ones and the most recent finished ones."""
+    sql = "SELECT id, kind, label, status, attempts, max_attempts, result, error, created_at, updated_at FROM jobs WHERE tutor = ?"
+    params = [tutor]
+    if kind:
+        sql += " AND kind = ?"
+        params.append(kind)
+    sql += " ORDER BY created_at DESC LIMIT ?"
+    params.append(limit)
+    return [dict(row) for row in _connect().execute(sql, params).fetchall()]
+
+def active_count(tutor, kind=None):
+    sql = "SELECT COUNT(*) FROM jobs WHERE tutor = ? AND status IN (?, ?)"
+    params = [tutor, *ACTIVE]
+    if kind:
+        sql += " AND kind = ?"
+        params.append(kind)
+    return _connect().execute(sql, params).fetchone()[0]
+
+def cancel(job_id):
+    now = time.time()
+    conn = _connect()
+    conn.execute("UPDATE jobs SET status = ?, cancel_requested = 1, updated_at = ? WHERE id = ? AND status = ?", (CANCELLED, now, job_id, QUEUED))
+    conn.execute("UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status = ?", (now, job_id, RUNNING))
+
+def retry(job_id):
+    """Queue a failed or cancelled job again, with a fresh set of attempts."""
+    now = time.time()
+    _connect().execute(
+        "UPDATE jobs SET status = ?, attempts = 0, cancel_requested = 0, error = NULL, run_after = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+        (QUEUED, now, now, job_id, FAILED, CANCELLED)
+    )
+    _wakeup.set()
+
+# --- Workers ---
+
+def _claim():
+    if not _handlers:
+        return None
+    kinds = list(_handlers)
+    placeholders = ", ".join("?" for _ in kinds)
+    claimable = f"kind IN ({placeholders}) AND ((status = ? AND run_after <= ?) OR (status = ? AND lease_until < ?))"
+    now = time.time()
+    conn = _connect()
+    # Look before taking the write lock: idle workers in every runner poll this
+    orphaned = [row["id"] for row in conn.execute("SELECT id, worker_pid FROM jobs WHERE status = ? AND lease_until >= ?", (RUNNING, now))
+                if row["worker_pid"] != os.getpid() and not _pid_alive(row["worker_pid"])]
+    if not orphaned and conn.execute(f"SELECT 1 FROM jobs WHERE {claimable} LIMIT 1", (*kinds, QUEUED, now, RUNNING, now)).fetchone() is None:
+        return None
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Jobs left "running" by a process that is gone are up for grabs without waiting out the lease
+        conn.executemany("UPDATE jobs SET lease_until = 0 WHERE id = ? AND status = ?", [(job_id, RUNNING) for job_id in orphaned])
+        row = conn.execute(f"SELECT * FROM jobs WHERE {claimable} ORDER BY created_at LIMIT 1", (*kinds, QUEUED, now, RUNNING, now)).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        if row["cancel_requested"] or row["attempts"] >= row["max_attempts"]:
+            # Cancelled, or out of attempts, while its last runner was gone
+            status, error = (CANCELLED, row["error"]) if row["cancel_requested"] else (FAILED, "The tutor stopped while running this job.")
+            conn.execute("UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?", (status, error, now, row["id"]))
+            conn.execute("COMMIT")
+            return _claim()
+        conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, worker_pid = ?, lease_until = ?, updated_at = ? WHERE id = ?",
+            (RUNNING, os.getpid(), now + LEASE, now, row["id"])
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    job = Job(row)
+    job.attempts += 1
+    metrics.observe("job_wait", max(0.0, now - row["created_at"]), job.tutor)
+    return job
+
+def _finish(job, status, result=None, error=None, run_after=None):
+    now = time.time()
+    conn = _connect()
+    # Only the current holder of the claim may finish it (a job whose lease ran out may have been claimed again)
+    conn.execute(
+        "UPDATE jobs SET status = CASE WHEN cancel_requested THEN ? ELSE ? END, result = ?, error = ?, run_after = COALESCE(?, run_after), "
+        "lease_until = NULL, updated_at = ? WHERE id = ? AND status = ? AND worker_pid = ? AND attempts = ?",
+        (CANCELLED, status, result, error, run_after, now, job.id, RUNNING, os.getpid(), job.attempts)
+    )
+
+def run_one():
+    """Claim and run one job. Returns False when there was nothing to do."""
+    job = _claim()
+    if job is None:
+        return False
+    try:
+        with metrics.timer(f"job_{job.kind}", job.tutor):
+            result = _handlers[job.kind](job)
+    except Exception as e:
+        if job.attempts < job.max_attempts:
+            _finish(job, QUEUED, error=str(e), run_after=time.time() + RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            _finish(job, FAILED, error=str(e))
+        return True
+    _finish(job, DONE, result=result)
+    return True
+
+def _work():
+    while True:
+        try:
+            if run_one():
+                continue
+        except sqlite3.Error:
+            pass # Store busy or briefly unavailable: try again after the pause
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+def start_workers(count=WORKERS):
+    """Start this process's worker threads (once per process)."""
+    global _workers
+    if _workers is None or _workers[0] != os.getpid():
+        with _lock:
+            if _workers is None or _workers[0] != os.getpid():
+                threads = [threading.Thread(target=_work, name=f"jobs-{i}", daemon=True) for i in range(count)]
+                for thread in threads:
+                    thread.start()
+                _workers = (os.getpid(), threads)
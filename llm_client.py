@@ -0,0 +1,232 @@
+"""Shared HTTP client for the AnythingLLM and Ollama backends.
+
+Every backend call goes through a pooled, keep-alive requests.Session per base
+URL, so a tutor turn reuses an open TCP connection instead of reconnecting.
+Pool size, retries and timeouts can be tuned with environment variables:
+
+    DSE_HTTP_POOL_SIZE        connections kept per backend (default 10)
+    DSE_HTTP_RETRIES          retries on 5xx / dropped connections (default 2)
+    DSE_HTTP_BACKOFF          backoff factor in seconds (default 0.5)
+    DSE_HTTP_CONNECT_TIMEOUT  connect timeout in seconds (default 3.05)
+
+Ollama generate calls can be sent through the local LLM gateway
+(llm_gateway.py), which queues them fairly and limits how many reach the
+backend at once. Pass gateway=<gateway URL>; if the gateway cannot be reached
+the call goes straight to the backend.
+"""
+import base64
+import json
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
+# --- Settings ---
+POOL_SIZE = int(os.environ.get("DSE_HTTP_POOL_SIZE", 10))
+MAX_RETRIES = int(os.environ.get("DSE_HTTP_RETRIES", 2))
+BACKOFF_FACTOR = float(os.environ.get("DSE_HTTP_BACKOFF", 0.5))
+CONNECT_TIMEOUT = float(os.environ.get("DSE_HTTP_CONNECT_TIMEOUT", 3.05))
+
+# Read timeouts per call type (seconds)
+VISION_TIMEOUT = 180
+CHAT_TIMEOUT = 60
+DISCOVERY_TIMEOUT = 5
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# Tell the gateway which backend a request is for and whose it is (for fair queuing)
+GATEWAY_BACKEND_HEADER = "X-DSE-Backend"
+GATEWAY_CLIENT_HEADER = "X-DSE-Client"
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class BackendRetry(Retry):
+    """Retry 5xx and dropped connections, but never re-send a request that simply timed out."""
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if isinstance(error, ReadTimeoutError):
+            # A slow model will be just as slow the second time
+            raise error
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+# --- Sessions ---
+
+def _backend_key(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+def _new_session():
+    retry = BackendRetry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "POST"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def get_session(url):
+    """Return the pooled session for the backend serving url (one per scheme://host:port)."""
+    key = _backend_key(url)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _new_session()
+                _sessions[key] = session
+    return session
+
+def configure(pool_size=None, max_retries=None, backoff_factor=None, connect_timeout=None):
+    """Override settings at runtime. Existing sessions are dropped and rebuilt lazily."""
+    global POOL_SIZE, MAX_RETRIES, BACKOFF_FACTOR, CONNECT_TIMEOUT
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    if max_retries is not None:
+        MAX_RETRIES = max_retries
+    if backoff_factor is not None:
+        BACKOFF_FACTOR = backoff_factor
+    if connect_timeout is not None:
+        CONNECT_TIMEOUT = connect_timeout
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+def get(url, read_timeout=DISCOVERY_TIMEOUT, **kwargs):
+    return get_session(url).get(url, timeout=(CONNECT_TIMEOUT, read_timeout), **kwargs)
+
+def post(url, read_timeout=CHAT_TIMEOUT, **kwargs):
+    return get_session(url).post(url, timeout=(CONNECT_TIMEOUT, read_timeout), **kwargs)
+
+# --- Backend Calls ---
+
+def encode_image(image_bytes):
+    return base64.b64encode(image_bytes).decode('utf-8')
+
+def _post_generate(base_url, payload, read_timeout, gateway=None, client_id=None, stream=False):
+    """POST an Ollama generate request, through the gateway when one is given and reachable."""
+    if gateway:
+        headers = {GATEWAY_BACKEND_HEADER: base_url, GATEWAY_CLIENT_HEADER: client_id or ""}
+        try:
+            return post(f"{gateway}/api/generate", read_timeout=read_timeout, json=payload, headers=headers, stream=stream)
+        except requests.ConnectionError:
+            pass # Gateway down (e.g. being restarted): go direct rather than fail the turn
+    return post(f"{base_url}/api/generate", read_timeout=read_timeout, json=payload, stream=stream)
+
+def call_ollama_vision(base_url, model_name, image_bytes, prompt, gateway=None, client_id=None):
+    img_b64 = encode_image(image_bytes)
+    payload = {
+        "model": model_name,
+        "prompt": prompt,
+        "images": [img_b64],
+        "stream": False
+    }
+    try:
+        response = _post_generate(base_url, payload, VISION_TIMEOUT, gateway, client_id)
+        response.raise_for_status()
+        return response.json().get("response", "")
+    except Exception as e:
+        return f"[Vision Error]: {str(e)}"
+
+def call_anythingllm_chat(base_url, api_key, slug, message, mode="chat", read_timeout=CHAT_TIMEOUT):
+    url = f"{base_url}/workspace/{slug}/chat"
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    payload = {"message": message, "mode": mode}
+    try:
+        response = post(url, read_timeout=read_timeout, json=payload, headers=headers)
+        response.raise_for_status()
+        data = response.json()
+        return data.get("textResponse", data.get("response", "No response text found."))
+    except Exception as e:
+        return f"[RAG Error]: {str(e)}"
+
+def search_anythingllm_workspace(base_url, api_key, slug, query, top_n=4, read_timeout=DISCOVERY_TIMEOUT):
+    """Text of the workspace chunks closest to query (empty if the server has no vector-search API)."""
+    url = f"{base_url}/workspace/{slug}/vector-search"
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    try:
+        response = post(url, read_timeout=read_timeout, json={"query": query, "topN": top_n}, headers=headers)
+        response.raise_for_status()
+        return [r.get("text", "") for r in response.json().get("results", []) if r.get("text")]
+    except Exception:
+        return []
+
+# --- Streaming Calls ---
+# Generators yielding text chunks as the backend produces them (for st.write_stream).
+# Errors are yielded as text in the same "[... Error]" form as the blocking calls,
+# as a StreamError so consumers can tell them from model output.
+
+class StreamError(str):
+    """A streamed chunk reporting a failure instead of model output."""
+
+def _iter_json_lines(response, prefix=""):
+    # Streams often omit a charset, which requests would otherwise decode as latin-1
+    response.encoding = "utf-8"
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith(prefix):
+            continue
+        try:
+            yield json.loads(line[len(prefix):].strip())
+        except ValueError:
+            continue
+
+def stream_ollama_generate(base_url, model_name, prompt, image_bytes=None, image_b64=None, read_timeout=VISION_TIMEOUT,
+                           gateway=None, client_id=None, on_queue=None):
+    """Stream an Ollama /api/generate completion (NDJSON, one object per line).
+
+    Through the gateway, on_queue(position) is called while the request waits
+    for a backend slot (position 1 is next), and with 0 once it starts.
+    """
+    payload = {"model": model_name, "prompt": prompt, "stream": True}
+    if image_bytes is not None:
+        image_b64 = encode_image(image_bytes)
+    if image_b64 is not None:
+        payload["images"] = [image_b64]
+    try:
+        with _post_generate(base_url, payload, read_timeout, gateway, client_id, stream=True) as response:
+            response.raise_for_status()
+            for data in _iter_json_lines(response):
+                if "queue_position" in data:
+                    if on_queue:
+                        on_queue(data["queue_position"])
+                    continue
+                if data.get("error"):
+                    yield StreamError(f"[Vision Error]: {data['error']}")
+                    return
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    return
+    except Exception as e:
+        yield StreamError(f"[Vision Error]: {str(e)}")
+
+def stream_anythingllm_chat(base_url, api_key, slug, message, mode="chat", read_timeout=CHAT_TIMEOUT):
+    """Stream an AnythingLLM workspace reply from the stream-chat SSE endpoint."""
+    url = f"{base_url}/workspace/{slug}/stream-chat"
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json", "Accept": "text/event-stream"}
+    payload = {"message": message, "mode": mode}
+    try:
+        with post(url, read_timeout=read_timeout, json=payload, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            for data in _iter_json_lines(response, prefix="data:"):
+                if data.get("type") == "abort" or data.get("error"):
+                    yield StreamError(f"[RAG Error]: {data.get('error') or 'stream aborted'}")
+                    return
+                if data.get("textResponse"):
+                    yield data["textResponse"]
+                if data.get("close"):
+                    return
+    except Exception as e:
+        yield StreamError(f"[RAG Error]: {str(e)}")
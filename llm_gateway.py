@@ -0,0 +1,430 @@
+"""Local gateway that queues Ollama requests from every tutor runner.
+
+All runners in a class share one Ollama host, so 30 students uploading images
+at once would otherwise send it 30 simultaneous vision requests, and they would
+all time out together. With the gateway enabled, runners send their generate
+requests here instead (llm_client adds the real backend URL and the student in
+headers), and the gateway:
+
+  - lets at most `concurrency` requests reach each backend at a time;
+  - queues the rest fairly: round robin across students, so one student
+    asking five questions does not push everyone else back five places;
+  - coalesces identical requests: while a request is queued or running, the
+    same request (same backend and body, e.g. the same worksheet photo from
+    two students) waits on it instead of being sent again;
+  - rejects new requests with 503 once a backend has `max_queue` waiting.
+
+While a streaming request waits, the gateway sends {"queue_position": n}
+lines (n = 1 is next) so the runner can show the student where they are in
+the queue; {"queue_position": 0} means the request has started. The lines
+also keep the connection alive while queued.
+
+GET /_stcore/health answers the supervisor's probe and GET /stats reports
+queue lengths and counters.
+
+The gateway listens on 127.0.0.1 only, and forwards only to the Ollama
+backends the tutors are configured with (an ollama_url in some
+data/<user>/config.json, or the runners' default on this server). Any other
+X-DSE-Backend is answered with 403, so the gateway cannot be used to reach
+arbitrary hosts.
+
+Started by deployer.ensure_gateway(); run directly with
+python llm_gateway.py --port 8610 --concurrency 2.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import database
+import llm_client
+
+logger = logging.getLogger("dse.gateway")
+
+GATEWAY_NAME = "gateway"
+DEFAULT_CONCURRENCY = 2 # requests per backend at once
+DEFAULT_MAX_QUEUE = 100 # waiting requests per backend before new ones are rejected
+POSITION_INTERVAL = 1.0 # seconds between queue position lines
+DATA_DIR = "data"
+DEFAULT_OLLAMA_PORT = 11434 # runners use http://<server ip>:11434 when a tutor sets no ollama_url
+BACKENDS_TTL = 30 # seconds the configured backends are cached before config.json files are read again
+
+
+def gateway_url():
+    """URL of the local gateway if it is running, else None (runners then call Ollama directly)."""
+    server = database.get_server(GATEWAY_NAME)
+    if server and server['status'] == 'running':
+        return f"http://127.0.0.1:{server['port']}"
+    return None
+
+
+def normalize_backend(url):
+    """scheme://host[:port] of an http(s) URL, dropping any path and query; None for anything else."""
+    try:
+        parts = urlsplit((url or "").strip())
+    except ValueError:
+        return None
+    if parts.scheme not in ("http", "https") or not parts.netloc or "@" in parts.netloc:
+        return None
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+def _local_ip():
+    # Same address runner.py puts in its default Ollama URL
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except Exception:
+        return "127.0.0.1"
+
+def configured_backends():
+    """The Ollama backends the tutors use: every ollama_url in data/*/config.json plus the runners' default."""
+    backends = {normalize_backend(f"http://{host}:{DEFAULT_OLLAMA_PORT}") for host in {_local_ip(), "127.0.0.1", "localhost"}}
+    for config_file in glob.glob(os.path.join(DATA_DIR, "*", "config.json")):
+        try:
+            with open(config_file, "r", encoding="utf-8") as f:
+                backends.add(normalize_backend(json.load(f).get("ollama_url")))
+        except (OSError, ValueError, AttributeError):
+            continue
+    backends.discard(None)
+    return backends
+
+
+class Flight:
+    """One upstream request, shared by every identical request made while it is queued or running."""
+
+    def __init__(self, key, backend, client, body):
+        self.key = key
+        self.backend = backend
+        self.client = client
+        self.body = body
+        self.subscribers = 1
+        self.queued_at = time.monotonic()
+        self.started = False
+        self.cancelled = False
+        self.status = 200
+        self.chunks = []
+        self.done = False
+        self.cond = threading.Condition()
+
+    def append(self, chunk):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def finish(self):
+        with self.cond:
+            self.done = True
+            self.cond.notify_all()
+
+
+class BackendQueue:
+    """Waiting flights for one backend, served round robin across clients."""
+
+    def __init__(self):
+        self.pending = OrderedDict() # client -> deque of flights, in turn order
+        self.active = 0
+
+    def __len__(self):
+        return sum(len(flights) for flights in self.pending.values())
+
+    def push(self, flight):
+        self.pending.setdefault(flight.client, deque()).append(flight)
+
+    def pop_next(self):
+        if not self.pending:
+            return None
+        client, flights = next(iter(self.pending.items()))
+        flight = flights.popleft()
+        del self.pending[client]
+        if flights:
+            self.pending[client] = flights # Back of the line until every other client had a turn
+        return flight
+
+    def remove(self, flight):
+        flights = self.pending.get(flight.client)
+        if flights and flight in flights:
+            flights.remove(flight)
+            if not flights:
+                del self.pending[flight.client]
+
+    def position(self, flight):
+        """1-based place in the serving order, or None if not waiting."""
+        lines = [list(flights) for flights in self.pending.values()]
+        place = 0
+        for turn in range(max((len(line) for line in lines), default=0)):
+            for line in lines:
+                if turn < len(line):
+                    place += 1
+                    if line[turn] is flight:
+                        return place
+        return None
+
+
+class Gateway:
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, max_queue=DEFAULT_MAX_QUEUE, backends=None):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.allowed = {normalize_backend(b) for b in backends} if backends is not None else None # None: the tutors' configs
+        self._configured = (0.0, set()) # (read at, backends) when self.allowed is None
+        self.lock = threading.Lock()
+        self.backends = {} # backend URL -> BackendQueue
+        self.flights = {} # request key -> Flight (queued or running)
+        self.counters = {"requests": 0, "coalesced": 0, "rejected": 0, "started": 0, "completed": 0, "queued_seconds": 0.0}
+
+    def backend(self, url):
+        """The normalized backend for an X-DSE-Backend value, or None if the gateway may not forward to it."""
+        backend = normalize_backend(url)
+        if backend is None:
+            return None
+        if self.allowed is not None:
+            return backend if backend in self.allowed else None
+        read_at, configured = self._configured
+        if backend not in configured or time.monotonic() - read_at > BACKENDS_TTL:
+            # Re-read on a miss too (rate limited), so a URL the teacher just saved works at once
+            if time.monotonic() - read_at > 1:
+                configured = configured_backends()
+                self._configured = (time.monotonic(), configured)
+        return backend if backend in configured else None
+
+    def submit(self, backend, client, body):
+        """The Flight serving this request (joining an identical one if possible), or None if the queue is full."""
+        key = hashlib.sha256(backend.encode("utf-8") + b"\0" + body).hexdigest()
+        with self.lock:
+            self.counters["requests"] += 1
+            flight = self.flights.get(key)
+            if flight:
+                flight.subscribers += 1
+                self.counters["coalesced"] += 1
+                return flight
+            queue = self.backends.setdefault(backend, BackendQueue())
+            if len(queue) >= self.max_queue:
+                self.counters["rejected"] += 1
+                return None
+            flight = Flight(key, backend, client, body)
+            self.flights[key] = flight
+            queue.push(flight)
+            self._dispatch(queue)
+        return flight
+
+    def leave(self, flight):
+        """A requester is gone; drop the flight if nobody else is waiting on it."""
+        with self.lock:
+            flight.subscribers -= 1
+            if flight.subscribers > 0 or flight.done:
+                return
+            if flight.started:
+                flight.cancelled = True # The upstream loop closes the connection
+            else:
+                self.backends[flight.backend].remove(flight)
+            if self.flights.get(flight.key) is flight:
+                del self.flights[flight.key] # A later identical request starts afresh
+
+    def position(self, flight):
+        with self.lock:
+            return self.backends[flight.backend].position(flight)
+
+    def _dispatch(self, queue):
+        # Called with self.lock held
+        while queue.active < self.concurrency:
+            flight = queue.pop_next()
+            if flight is None:
+                break
+            queue.active += 1
+            flight.started = True
+            self.counters["started"] += 1
+            self.counters["queued_seconds"] += time.monotonic() - flight.queued_at
+            threading.Thread(target=self._run, args=(queue, flight), name="gateway-upstream", daemon=True).start()
+
+    def _run(self, queue, flight):
+        try:
+            with llm_client.post(
+                f"{flight.backend}/api/generate", read_timeout=llm_client.VISION_TIMEOUT,
+                data=flight.body, headers={"Content-Type": "application/json"}, stream=True
+            ) as response:
+                flight.status = response.status_code
+                for line in response.iter_lines():
+                    if flight.cancelled:
+                        break
+                    if line:
+                        flight.append(line + b"\n")
+        except Exception as e:
+            flight.status = 502
+            flight.append(json.dumps({"error": f"gateway: {e}"}).encode("utf-8") + b"\n")
+        finally:
+            flight.finish()
+            with self.lock:
+                if self.flights.get(flight.key) is flight:
+                    del self.flights[flight.key]
+                queue.active -= 1
+                self.counters["completed"] += 1
+                self._dispatch(queue)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, backends={
+                backend: {"active": queue.active, "queued": len(queue)} for backend, queue in self.backends.items()
+            })
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode("utf-8"))
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/_stcore/health":
+            self._send(200, b"ok", "text/plain")
+        elif self.path == "/stats":
+            self._send_json(200, self.server.gateway.stats())
+        elif self.path == "/api/tags" and self.headers.get(llm_client.GATEWAY_BACKEND_HEADER):
+            backend = self.server.gateway.backend(self.headers[llm_client.GATEWAY_BACKEND_HEADER])
+            if backend is None:
+                self._send_json(403, {"error": "gateway: backend not allowed"})
+                return
+            try:
+                response = llm_client.get(f"{backend}/api/tags")
+                self._send(response.status_code, response.content)
+            except Exception as e:
+                self._send_json(502, {"error": f"gateway: {e}"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        backend = self.headers.get(llm_client.GATEWAY_BACKEND_HEADER)
+        if self.path != "/api/generate" or not backend:
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(body)
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            self._send_json(400, {"error": "invalid JSON body"})
+            return
+        stream = request.get("stream", True)
+        gateway = self.server.gateway
+        backend = gateway.backend(backend)
+        if backend is None:
+            self._send_json(403, {"error": "gateway: backend not allowed"})
+            return
+        client = self.headers.get(llm_client.GATEWAY_CLIENT_HEADER) or self.client_address[0]
+        flight = gateway.submit(backend, client, body)
+        if flight is None:
+            self._send_json(503, {"error": "The vision model is busy, please try again in a minute."})
+            return
+        try:
+            if stream:
+                self._stream(gateway, flight)
+            else:
+                with flight.cond:
+                    while not flight.done:
+                        flight.cond.wait()
+                self._send(flight.status, b"".join(flight.chunks))
+        except OSError:
+            pass # The runner gave up (deadline or closed tab)
+        finally:
+            gateway.leave(flight)
+
+    def _stream(self, gateway, flight):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sent = 0
+        last_position, last_report = None, 0.0
+        while True:
+            with flight.cond:
+                if sent == len(flight.chunks) and not flight.done:
+                    flight.cond.wait(POSITION_INTERVAL)
+                chunks, done = flight.chunks[sent:], flight.done
+            if last_position != 0:
+                position = gateway.position(flight) if not flight.started else 0
+                now = time.monotonic()
+                if position is not None and (position != last_position or now - last_report >= POSITION_INTERVAL):
+                    self._write_chunk(json.dumps({"queue_position": position}).encode("utf-8") + b"\n")
+                    last_position, last_report = position, now
+            for chunk in chunks:
+                self._write_chunk(chunk)
+            sent += len(chunks)
+            if done and sent == len(flight.chunks):
+                break
+        self._write_chunk(b"")
+
+
+class GatewayServer:
+    """Run a gateway on a background thread (used by main() and the benchmarks)."""
+
+    def __init__(self, port=0, concurrency=DEFAULT_CONCURRENCY, max_queue=DEFAULT_MAX_QUEUE, host="127.0.0.1", backends=None):
+        self.gateway = Gateway(concurrency, max_queue, backends)
+        self.server = ThreadingHTTPServer((host, port), GatewayHandler)
+        self.server.daemon_threads = True
+        self.server.gateway = self.gateway
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="gateway", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue and rate-limit Ollama requests from tutor runners")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="requests per backend at once")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help="waiting requests per backend before rejecting")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (runners connect to 127.0.0.1)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    server = GatewayServer(args.port, args.concurrency, args.max_queue, host=args.host)
+    logger.info("gateway on port %s, %s concurrent requests per backend", args.port, args.concurrency)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
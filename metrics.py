@@ -0,0 +1,340 @@
+"""Latency, error, payload and token metrics for tutor turns.
+
+Code on the hot path times itself with
+
+    with metrics.timer("chat", tutor=username) as t:
+        reply = call_anythingllm_chat(...)
+        t.size = len(reply)
+
+or records a finished measurement with metrics.observe(). Each process keeps
+its numbers in memory (a dict update under a lock, a few microseconds) and a
+background thread adds them to the shared data/system/metrics.db every
+FLUSH_INTERVAL seconds, so the runner processes, the hub and the teacher app
+all end up in one place.
+
+Per operation and tutor the store keeps a call count, total seconds, an error
+count, total payload bytes and a latency histogram (BUCKETS, in seconds).
+Plain counters (e.g. tokens streamed) are kept per name and tutor.
+
+render_prometheus() formats everything in the Prometheus text format. The
+teacher app serves it on http://127.0.0.1:<metrics_port>/metrics (System
+setting, default 9464; see serve()), and summarize() feeds the Performance tab.
+"""
+import argparse
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import llm_client
+
+METRICS_DB = os.path.join("data", "system", "metrics.db")
+FLUSH_INTERVAL = 5
+DEFAULT_PORT = 9464
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180, float("inf"))
+
+_lock = threading.Lock()
+_timings = {} # (op, tutor) -> [count, seconds, errors, bytes, bucket counts]
+_counters = {} # (name, tutor) -> value
+_flusher = None
+_local = threading.local()
+
+
+# --- Recording ---
+
+def observe(op, seconds, tutor="", error=False, size=None):
+    """Record one finished operation."""
+    bucket = next(i for i, le in enumerate(BUCKETS) if seconds <= le)
+    with _lock:
+        entry = _timings.get((op, tutor))
+        if entry is None:
+            entry = _timings[(op, tutor)] = [0, 0.0, 0, 0, [0] * len(BUCKETS)]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += bool(error)
+        entry[3] += size or 0
+        entry[4][bucket] += 1
+    _ensure_flusher()
+
+def count(name, value=1, tutor=""):
+    with _lock:
+        _counters[(name, tutor)] = _counters.get((name, tutor), 0) + value
+    _ensure_flusher()
+
+
+class timer:
+    """Context manager timing a block. Set .size for the payload and .error for a failure
+    that did not raise; an exception counts as an error automatically."""
+
+    def __init__(self, op, tutor="", size=None):
+        self.op = op
+        self.tutor = tutor
+        self.size = size
+        self.error = False
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.op, time.perf_counter() - self.start, self.tutor, self.error or exc_type is not None, self.size)
+        return False
+
+
+def timed_stream(op, stream, tutor=""):
+    """Wrap a text stream: times it to the last chunk, counts chunks as tokens and bytes as payload."""
+    start = time.perf_counter()
+    chunks, size, error = 0, 0, False
+    try:
+        for chunk in stream:
+            chunks += 1
+            size += len(chunk.encode("utf-8"))
+            error = error or isinstance(chunk, llm_client.StreamError) # Reported by the producer, not guessed from the text
+            yield chunk
+    finally:
+        observe(op, time.perf_counter() - start, tutor, error, size)
+        count(f"{op}_tokens", chunks, tutor)
+
+# --- Shared store ---
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        os.makedirs(os.path.dirname(METRICS_DB), exist_ok=True)
+        conn = sqlite3.connect(METRICS_DB, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS timings (
+                op TEXT NOT NULL,
+                tutor TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                seconds REAL NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (op, tutor)
+            );
+            CREATE TABLE IF NOT EXISTS timing_buckets (
+                op TEXT NOT NULL,
+                tutor TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (op, tutor, bucket)
+            );
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT NOT NULL,
+                tutor TEXT NOT NULL,
+                value REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (name, tutor)
+            );
+        ''')
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def flush():
+    """Add this process's numbers since the last flush to the shared store."""
+    global _timings, _counters
+    with _lock:
+        timings, counters = _timings, _counters
+        _timings, _counters = {}, {}
+    if not timings and not counters:
+        return
+    try:
+        conn = _connect()
+        with conn:
+            conn.executemany('''
+                INSERT INTO timings (op, tutor, count, seconds, errors, bytes) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(op, tutor) DO UPDATE SET count = count + excluded.count, seconds = seconds + excluded.seconds,
+                    errors = errors + excluded.errors, bytes = bytes + excluded.bytes
+            ''', [(op, tutor, e[0], e[1], e[2], e[3]) for (op, tutor), e in timings.items()])
+            conn.executemany('''
+                INSERT INTO timing_buckets (op, tutor, bucket, count) VALUES (?, ?, ?, ?)
+                ON CONFLICT(op, tutor, bucket) DO UPDATE SET count = count + excluded.count
+            ''', [(op, tutor, i, n) for (op, tutor), e in timings.items() for i, n in enumerate(e[4]) if n])
+            conn.executemany('''
+                INSERT INTO counters (name, tutor, value) VALUES (?, ?, ?)
+                ON CONFLICT(name, tutor) DO UPDATE SET value = value + excluded.value
+            ''', [(name, tutor, value) for (name, tutor), value in counters.items()])
+    except sqlite3.Error:
+        # Keep the numbers for the next attempt rather than losing them
+        with _lock:
+            for key, e in timings.items():
+                mine = _timings.setdefault(key, [0, 0.0, 0, 0, [0] * len(BUCKETS)])
+                for i in range(4):
+                    mine[i] += e[i]
+                mine[4] = [a + b for a, b in zip(mine[4], e[4])]
+            for key, value in counters.items():
+                _counters[key] = _counters.get(key, 0) + value
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None or _flusher[0] != os.getpid():
+        with _lock:
+            if _flusher is None or _flusher[0] != os.getpid():
+                thread = threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True)
+                thread.start()
+                _flusher = (os.getpid(), thread)
+                atexit.register(flush)
+
+def reset():
+    """Drop all recorded metrics (this process and the shared store)."""
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM timings")
+        conn.execute("DELETE FROM timing_buckets")
+        conn.execute("DELETE FROM counters")
+
+# --- Reading ---
+
+def _quantile(buckets, q):
+    """Upper bound of the bucket holding quantile q (like Prometheus histogram_quantile, without interpolation)."""
+    total = sum(buckets)
+    if not total:
+        return None
+    seen = 0
+    for le, n in zip(BUCKETS, buckets):
+        seen += n
+        if seen >= q * total:
+            return le
+    return BUCKETS[-1]
+
+def summarize(tutor=None):
+    """Per-operation rows for the Performance tab: calls, error rate, avg/p50/p90/p99 seconds, avg bytes."""
+    flush()
+    conn = _connect()
+    where, params = ("WHERE tutor = ?", (tutor,)) if tutor is not None else ("", ())
+    rows = conn.execute(f"SELECT op, SUM(count), SUM(seconds), SUM(errors), SUM(bytes) FROM timings {where} GROUP BY op ORDER BY SUM(seconds) DESC", params).fetchall()
+    buckets = {}
+    for op, bucket, n in conn.execute(f"SELECT op, bucket, SUM(count) FROM timing_buckets {where} GROUP BY op, bucket", params):
+        buckets.setdefault(op, [0] * len(BUCKETS))[bucket] = n
+    summary = []
+    for op, calls, seconds, errors, size in rows:
+        b = buckets.get(op, [0] * len(BUCKETS))
+        summary.append({
+            "operation": op,
+            "calls": calls,
+            "error_rate": errors / calls if calls else 0.0,
+            "avg_s": seconds / calls if calls else 0.0,
+            "p50_s": _quantile(b, 0.5),
+            "p90_s": _quantile(b, 0.9),
+            "p99_s": _quantile(b, 0.99),
+            "total_s": seconds,
+            "avg_bytes": size / calls if calls else 0,
+        })
+    return summary
+
+def tutors():
+    flush()
+    return [row[0] for row in _connect().execute("SELECT DISTINCT tutor FROM timings WHERE tutor != '' ORDER BY tutor")]
+
+def counter_totals(tutor=None):
+    flush()
+    where, params = ("WHERE tutor = ?", (tutor,)) if tutor is not None else ("", ())
+    return dict(_connect().execute(f"SELECT name, SUM(value) FROM counters {where} GROUP BY name", params).fetchall())
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format."""
+    flush()
+    conn = _connect()
+    timings = conn.execute("SELECT op, tutor, count, seconds, errors, bytes FROM timings ORDER BY op, tutor").fetchall()
+    buckets = {}
+    for op, tutor, bucket, n in conn.execute("SELECT op, tutor, bucket, count FROM timing_buckets"):
+        buckets.setdefault((op, tutor), [0] * len(BUCKETS))[bucket] = n
+    lines = [
+        "# HELP dse_operation_seconds Time spent in tutor backend calls and storage operations.",
+        "# TYPE dse_operation_seconds histogram",
+    ]
+    for op, tutor, calls, seconds, _, _ in timings:
+        cumulative = 0
+        for le, n in zip(BUCKETS, buckets.get((op, tutor), [0] * len(BUCKETS))):
+            cumulative += n
+            lines.append(f"dse_operation_seconds_bucket{_labels(op=op, tutor=tutor, le='+Inf' if le == float('inf') else le)} {cumulative}")
+        lines.append(f"dse_operation_seconds_sum{_labels(op=op, tutor=tutor)} {seconds}")
+        lines.append(f"dse_operation_seconds_count{_labels(op=op, tutor=tutor)} {calls}")
+    lines += ["# HELP dse_operation_errors_total Operations that failed.", "# TYPE dse_operation_errors_total counter"]
+    lines += [f"dse_operation_errors_total{_labels(op=op, tutor=tutor)} {errors}" for op, tutor, _, _, errors, _ in timings]
+    lines += ["# HELP dse_operation_bytes_total Payload bytes sent or received by operations.", "# TYPE dse_operation_bytes_total counter"]
+    lines += [f"dse_operation_bytes_total{_labels(op=op, tutor=tutor)} {size}" for op, tutor, _, _, _, size in timings]
+    counters = conn.execute("SELECT name, tutor, value FROM counters ORDER BY name, tutor").fetchall()
+    for name in sorted({row[0] for row in counters}):
+        lines += [f"# TYPE dse_{name}_total counter"]
+        lines += [f"dse_{name}_total{_labels(tutor=tutor)} {value:g}" for n, tutor, value in counters if n == name]
+    return "\n".join(lines) + "\n"
+
+# --- Export endpoint ---
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+def serve(port=DEFAULT_PORT, host="127.0.0.1"):
+    """Serve /metrics on a background thread, one server per process.
+
+    Calling it again with another port moves the export there; port 0 stops
+    it. Returns False if the port is taken (the export is then off).
+    """
+    global _server
+    with _server_lock:
+        if _server is not None:
+            if port and _server.server_address[:2] == (host, port):
+                return True
+            _server.shutdown()
+            _server.server_close()
+            _server = None
+        if not port:
+            return True
+        try:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError:
+            return False # e.g. another teacher app process already exports
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-export", daemon=True).start()
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export tutor metrics in the Prometheus text format")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args()
+    if not serve(args.port, args.host):
+        parser.exit(1, f"Port {args.port} is in use\n")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
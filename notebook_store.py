@@ -0,0 +1,386 @@
+"""Notebook storage for tutors.
+
+Entries live in a per-user SQLite database (data/<username>/notebook.db) so
+that adding, retitling or deleting one entry touches one row instead of
+rewriting the whole notebook. Listing is served newest-first from an index on
+timestamp, and question, answer, summary and title are searchable through an
+FTS5 index (falling back to LIKE when SQLite was built without FTS5).
+
+An existing notebook.json is imported the first time the database is opened
+and renamed to notebook.json.migrated.
+
+The same database holds the question bank: practice questions generated in the
+background (tutor_jobs.py) and stored per entry, with the entry's topic, so
+the Practice view serves them without calling the LLM. Entries waiting for
+questions are listed in bank_requests. Triggers keep both in step with the
+notebook: a new entry is requested, editing an entry drops its questions and
+requests new ones, and deleting it drops both. A request the bank job could
+not fill (the model failed or gave no usable questions) is marked failed and
+left alone until retry_questions() is called for it.
+"""
+import json
+import os
+import sqlite3
+import uuid
+from datetime import datetime
+
+import tutor_cache
+
+DATA_DIR = "data"
+DB_NAME = "notebook.db"
+LEGACY_FILE = "notebook.json"
+
+ENTRY_COLUMNS = "id, timestamp, title, question, answer, summary"
+BANK_SCHEMA = 2 # PRAGMA user_version of a notebook.db whose question bank tables and triggers exist
+
+
+def get_notebook_db_path(username):
+    return os.path.join(DATA_DIR, username, DB_NAME)
+
+def _has_fts(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'entries_fts'").fetchone() is not None
+
+def _connect(username):
+    user_dir = os.path.join(DATA_DIR, username)
+    os.makedirs(user_dir, exist_ok=True)
+    path = get_notebook_db_path(username)
+    is_new = not os.path.exists(path)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    if is_new:
+        _create_schema(conn)
+        _import_legacy(conn, user_dir)
+        conn.commit()
+    # Recorded in the file itself, so a notebook.db deleted and created again gets the bank too.
+    # After the legacy import, so imported entries are not all queued for questions at once.
+    if conn.execute("PRAGMA user_version").fetchone()[0] < BANK_SCHEMA:
+        _create_bank_schema(conn)
+    return conn
+
+def _create_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS entries (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT UNIQUE NOT NULL,
+            timestamp TEXT NOT NULL,
+            title TEXT,
+            question TEXT,
+            answer TEXT,
+            summary TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_timestamp ON entries(timestamp DESC)")
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE entries_fts USING fts5(
+                title, question, answer, summary,
+                content='entries', content_rowid='seq'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        return # No FTS5 in this SQLite build; search falls back to LIKE
+    # Keep the full-text index in step with the entries table
+    conn.executescript('''
+        CREATE TRIGGER entries_ai AFTER INSERT ON entries BEGIN
+            INSERT INTO entries_fts(rowid, title, question, answer, summary)
+            VALUES (new.seq, new.title, new.question, new.answer, new.summary);
+        END;
+        CREATE TRIGGER entries_ad AFTER DELETE ON entries BEGIN
+            INSERT INTO entries_fts(entries_fts, rowid, title, question, answer, summary)
+            VALUES ('delete', old.seq, old.title, old.question, old.answer, old.summary);
+        END;
+        CREATE TRIGGER entries_au AFTER UPDATE ON entries BEGIN
+            INSERT INTO entries_fts(entries_fts, rowid, title, question, answer, summary)
+            VALUES ('delete', old.seq, old.title, old.question, old.answer, old.summary);
+            INSERT INTO entries_fts(rowid, title, question, answer, summary)
+            VALUES (new.seq, new.title, new.question, new.answer, new.summary);
+        END;
+    ''')
+
+def _create_bank_schema(conn):
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entry_id TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            question TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_questions_entry ON questions(entry_id);
+        CREATE INDEX IF NOT EXISTS idx_questions_topic ON questions(topic);
+        CREATE TABLE IF NOT EXISTS bank_requests (
+            entry_id TEXT PRIMARY KEY,
+            requested_at TEXT NOT NULL,
+            failures INTEGER NOT NULL DEFAULT 0,
+            failed_at TEXT
+        );
+        CREATE TRIGGER IF NOT EXISTS bank_ai AFTER INSERT ON entries BEGIN
+            INSERT OR IGNORE INTO bank_requests (entry_id, requested_at) VALUES (new.id, new.timestamp);
+        END;
+        CREATE TRIGGER IF NOT EXISTS bank_au AFTER UPDATE OF title, question, answer, summary ON entries BEGIN
+            DELETE FROM questions WHERE entry_id = old.id;
+            INSERT OR REPLACE INTO bank_requests (entry_id, requested_at) VALUES (new.id, strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'));
+        END;
+        CREATE TRIGGER IF NOT EXISTS bank_ad AFTER DELETE ON entries BEGIN
+            DELETE FROM questions WHERE entry_id = old.id;
+            DELETE FROM bank_requests WHERE entry_id = old.id;
+        END;
+    ''')
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(bank_requests)")}
+    if "failures" not in columns: # A bank from before failed requests were recorded
+        conn.execute("ALTER TABLE bank_requests ADD COLUMN failures INTEGER NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE bank_requests ADD COLUMN failed_at TEXT")
+    conn.execute(f"PRAGMA user_version = {BANK_SCHEMA}")
+
+def _import_legacy(conn, user_dir):
+    legacy = os.path.join(user_dir, LEGACY_FILE)
+    if not os.path.exists(legacy):
+        return
+    try:
+        with open(legacy, 'r', encoding='utf-8') as f:
+            notebook = json.load(f)
+    except:
+        return
+    conn.executemany(
+        f"INSERT OR IGNORE INTO entries ({ENTRY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+        [(n['id'], n['timestamp'], n.get('title'), n.get('question'), n.get('answer'), n.get('summary')) for n in notebook]
+    )
+    conn.commit()
+    os.replace(legacy, legacy + ".migrated")
+
+def _fts_query(text):
+    # Quote each word so user input can't be parsed as FTS syntax; prefix-match the words
+    words = [w.replace('"', '""') for w in text.split()]
+    return " ".join(f'"{w}"*' for w in words)
+
+# --- Public API ---
+
+def list_entries(username, limit=None, offset=0, query=None):
+    """Entries newest first, optionally filtered by a full-text query."""
+    if not (query and query.strip()):
+        # The unfiltered list is drawn on every rerun: serve it from memory until notebook.db changes
+        return tutor_cache.cached(
+            "notebook", username, lambda: _query_entries(username, limit, offset),
+            paths=(get_notebook_db_path(username),), args=(limit, offset)
+        )
+    return _query_entries(username, limit, offset, query)
+
+def _query_entries(username, limit=None, offset=0, query=None):
+    conn = _connect(username)
+    params = []
+    if query and query.strip():
+        if _has_fts(conn):
+            sql = '''
+                SELECT e.id, e.timestamp, e.title, e.question, e.answer, e.summary FROM entries e
+                JOIN entries_fts f ON f.rowid = e.seq
+                WHERE entries_fts MATCH ?
+                ORDER BY e.timestamp DESC
+            '''
+            params.append(_fts_query(query))
+        else:
+            like = f"%{query.strip()}%"
+            sql = f'''
+                SELECT {ENTRY_COLUMNS} FROM entries
+                WHERE title LIKE ? OR question LIKE ? OR answer LIKE ? OR summary LIKE ?
+                ORDER BY timestamp DESC
+            '''
+            params.extend([like] * 4)
+    else:
+        sql = f"SELECT {ENTRY_COLUMNS} FROM entries ORDER BY timestamp DESC"
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def count_entries(username, query=None):
+    if not (query and query.strip()):
+        return tutor_cache.cached(
+            "notebook_count", username, lambda: _count_entries(username),
+            paths=(get_notebook_db_path(username),)
+        )
+    return _count_entries(username, query)
+
+def _count_entries(username, query=None):
+    conn = _connect(username)
+    if query and query.strip():
+        if _has_fts(conn):
+            count = conn.execute("SELECT COUNT(*) FROM entries_fts WHERE entries_fts MATCH ?", (_fts_query(query),)).fetchone()[0]
+        else:
+            like = f"%{query.strip()}%"
+            count = conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE title LIKE ? OR question LIKE ? OR answer LIKE ? OR summary LIKE ?",
+                (like,) * 4
+            ).fetchone()[0]
+    else:
+        count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    conn.close()
+    return count
+
+def _invalidate(username):
+    tutor_cache.invalidate("notebook", username)
+    tutor_cache.invalidate("notebook_count", username)
+
+def get_entries(username, entry_ids):
+    if not entry_ids:
+        return []
+    conn = _connect(username)
+    placeholders = ", ".join("?" for _ in entry_ids)
+    rows = conn.execute(
+        f"SELECT {ENTRY_COLUMNS} FROM entries WHERE id IN ({placeholders}) ORDER BY timestamp DESC",
+        list(entry_ids)
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def load_notebook(username):
+    """Every entry, newest first."""
+    return list_entries(username)
+
+def add_to_notebook(username, question, answer, summary=None, entry_id=None):
+    """Add an entry. Adding an entry_id that is already there is a no-op (background jobs may run twice)."""
+    entry = {
+        "id": entry_id or str(uuid.uuid4()),
+        "timestamp": datetime.now().isoformat(),
+        "title": summary[:50] if summary else question[:50],
+        "question": question,
+        "answer": answer,
+        "summary": summary
+    }
+    conn = _connect(username)
+    conn.execute(
+        f"INSERT OR IGNORE INTO entries ({ENTRY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+        (entry['id'], entry['timestamp'], entry['title'], entry['question'], entry['answer'], entry['summary'])
+    )
+    conn.commit()
+    conn.close()
+    _invalidate(username)
+    return entry
+
+def delete_notebook_entry(username, entry_id):
+    conn = _connect(username)
+    conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+    conn.commit()
+    conn.close()
+    _invalidate(username)
+
+def update_notebook_entry_title(username, entry_id, new_title):
+    conn = _connect(username)
+    conn.execute("UPDATE entries SET title = ? WHERE id = ?", (new_title, entry_id))
+    conn.commit()
+    conn.close()
+    _invalidate(username)
+
+# --- Question bank ---
+
+def list_questions(username, entry_ids=None, topic=None):
+    """Banked practice questions, for some entries and/or a topic (prefix match), in the order they were generated."""
+    conn = _connect(username)
+    sql = "SELECT entry_id, topic, question FROM questions"
+    where, params = [], []
+    if entry_ids is not None:
+        where.append(f"entry_id IN ({', '.join('?' for _ in entry_ids)})")
+        params.extend(entry_ids)
+    if topic:
+        where.append("topic LIKE ?")
+        params.append(topic.strip().lower().replace("%", "") + "%")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    rows = conn.execute(sql + " ORDER BY id", params).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def request_questions(username, entry_ids):
+    """Ask for questions for entries that have none and are not already waiting. Returns how many were added."""
+    if not entry_ids:
+        return 0
+    conn = _connect(username)
+    placeholders = ", ".join("?" for _ in entry_ids)
+    known = {row[0] for row in conn.execute(
+        f"SELECT entry_id FROM bank_requests WHERE entry_id IN ({placeholders}) UNION SELECT entry_id FROM questions WHERE entry_id IN ({placeholders})",
+        list(entry_ids) * 2
+    )}
+    new = [entry_id for entry_id in entry_ids if entry_id not in known]
+    if new:
+        now = datetime.now().isoformat()
+        conn.executemany(
+            "INSERT OR IGNORE INTO bank_requests (entry_id, requested_at) SELECT id, ? FROM entries WHERE id = ?",
+            [(now, entry_id) for entry_id in new]
+        )
+        conn.commit()
+    conn.close()
+    return len(new)
+
+def pending_questions(username, limit=None):
+    """Entries waiting for questions, oldest request first. Failed requests are left out."""
+    conn = _connect(username)
+    sql = '''
+        SELECT e.id, e.timestamp, e.title, e.question, e.answer, e.summary FROM bank_requests r
+        JOIN entries e ON e.id = r.entry_id
+        WHERE r.failures = 0
+        ORDER BY r.requested_at
+    '''
+    params = []
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    rows = conn.execute(sql, params).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def add_questions(username, entry, questions):
+    """Bank questions generated from `entry` (as read by pending_questions) and clear its request.
+
+    Skipped, returning False, if the entry was edited or deleted while they were being generated.
+    """
+    conn = _connect(username)
+    conn.execute("BEGIN IMMEDIATE") # No edit can land between the check and the insert
+    row = conn.execute("SELECT title, question, answer, summary FROM entries WHERE id = ?", (entry['id'],)).fetchone()
+    stored = row is not None and tuple(row) == (entry['title'], entry['question'], entry['answer'], entry['summary'])
+    if stored:
+        now = datetime.now().isoformat()
+        topic = (entry['title'] or "").strip().lower()
+        conn.execute("DELETE FROM questions WHERE entry_id = ?", (entry['id'],))
+        conn.executemany(
+            "INSERT INTO questions (entry_id, topic, question, created_at) VALUES (?, ?, ?, ?)",
+            [(entry['id'], topic, question, now) for question in questions]
+        )
+        conn.execute("DELETE FROM bank_requests WHERE entry_id = ?", (entry['id'],))
+    conn.commit()
+    conn.close()
+    return stored
+
+def fail_questions(username, entry_ids):
+    """Mark requests the bank job could not fill, so they are not picked up again until retried."""
+    if not entry_ids:
+        return
+    conn = _connect(username)
+    now = datetime.now().isoformat()
+    conn.executemany(
+        "UPDATE bank_requests SET failures = failures + 1, failed_at = ? WHERE entry_id = ?",
+        [(now, entry_id) for entry_id in entry_ids]
+    )
+    conn.commit()
+    conn.close()
+
+def failed_questions(username, entry_ids):
+    """The ids among entry_ids whose request failed."""
+    if not entry_ids:
+        return set()
+    conn = _connect(username)
+    rows = conn.execute(
+        f"SELECT entry_id FROM bank_requests WHERE failures > 0 AND entry_id IN ({', '.join('?' for _ in entry_ids)})",
+        list(entry_ids)
+    ).fetchall()
+    conn.close()
+    return {row[0] for row in rows}
+
+def retry_questions(username, entry_ids):
+    """Put failed requests back in line for the bank job."""
+    if not entry_ids:
+        return
+    conn = _connect(username)
+    conn.executemany("UPDATE bank_requests SET failures = 0, failed_at = NULL WHERE entry_id = ?", [(entry_id,) for entry_id in entry_ids])
+    conn.commit()
+    conn.close()
@@ -0,0 +1,220 @@
+"""Concurrent vision + retrieval pipeline for image questions.
+
+When a student asks about an image, the vision model and a retrieval prefetch
+for the text question run at the same time on worker threads, instead of one
+after the other. The image is shrunk (image_prep.py) and base64-encoded on the
+vision thread while the retrieval request is already in flight. Results are merged into the prompt for
+the final AnythingLLM answer.
+
+A turn has an overall deadline. If the vision model has not finished when its
+share of the deadline runs out, the answer is built from whatever description
+arrived so far plus the retrieved context, and the turn is marked partial.
+Per-stage timings are logged for every turn under the "dse.pipeline" logger.
+
+Descriptions are cached by image content, model, prompt and preprocessing
+settings (see image_store.py): an image that has been described before is not
+sent to the vision model again.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import image_prep
+import image_store
+import llm_client
+import metrics
+
+logger = logging.getLogger("dse.pipeline")
+
+DEFAULT_TURN_DEADLINE = 150 # seconds for the whole image turn
+ANSWER_RESERVE = 30 # seconds of the deadline kept back for the final answer
+VISION_PROMPT = "Describe this image in detail. If it contains text or math, transcribe it exactly."
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tutor-pipeline")
+
+_DONE = object()
+
+
+class ImageTurn:
+    """One image question in flight. Starts the vision and retrieval stages on creation."""
+
+    def __init__(self, config, image_bytes, question, default_ollama_url, default_allm_url, gateway=None, client_id=None):
+        self.question = question
+        self.started = time.perf_counter()
+        deadline = float(config.get("turn_deadline", DEFAULT_TURN_DEADLINE))
+        self.deadline = self.started + deadline
+        self.vision_deadline = self.deadline - min(ANSWER_RESERVE, deadline / 4)
+        self.timings = {}
+        self.partial = False
+        self.description = ""
+        self.context = []
+        self.image_hash = None
+        self.vision_bytes = 0 # image payload sent to the vision model
+        self.vision_chunks = 0
+        self.queue_position = None # place in the LLM gateway's queue while waiting for the vision model
+
+        self._chunks = queue.Queue()
+        self._cancelled = threading.Event()
+        self._ollama_url = config.get("ollama_url", default_ollama_url)
+        self._ollama_model = config.get("ollama_model", "qwen3-vl:8b")
+        self._max_side = int(config.get("image_max_side", image_prep.DEFAULT_MAX_SIDE))
+        self._grayscale = config.get("image_grayscale", False)
+        self._preprocessing = image_prep.settings_key(self._max_side, self._grayscale)
+        self._gateway = (gateway, client_id)
+        self._allm = (config.get("url", default_allm_url), config.get("api_key", ""), config.get("slug", "default"))
+
+        self._vision = _executor.submit(self._run_vision, image_bytes)
+        self._retrieval = _executor.submit(self._run_retrieval)
+
+    # --- Stages (worker threads) ---
+
+    def _run_vision(self, image_bytes):
+        start = time.perf_counter()
+        self.image_hash = image_store.image_hash(image_bytes)
+        try:
+            cached = image_store.get_description(self.image_hash, self._ollama_model, VISION_PROMPT, self._preprocessing)
+        except Exception:
+            cached = None # A cache problem must not stop the turn
+        if cached is not None:
+            self.timings["vision_cached"] = time.perf_counter() - start
+            self._chunks.put(cached)
+            self._chunks.put(_DONE)
+            return
+        image_bytes = image_prep.prepare_for_vision(image_bytes, self._max_side, self._grayscale)
+        self.timings["preprocess"] = time.perf_counter() - start
+        image_b64 = llm_client.encode_image(image_bytes)
+        self.vision_bytes = len(image_b64)
+        self.timings["encode"] = time.perf_counter() - start
+        stream = llm_client.stream_ollama_generate(
+            self._ollama_url, self._ollama_model, VISION_PROMPT,
+            image_b64=image_b64, read_timeout=max(1, self.vision_deadline - time.perf_counter()),
+            gateway=self._gateway[0], client_id=self._gateway[1], on_queue=self._set_queue_position
+        )
+        parts = []
+        try:
+            for chunk in stream:
+                if self._cancelled.is_set():
+                    break # Closing the stream drops the request on the Ollama side
+                if "first_vision_token" not in self.timings:
+                    self.timings["first_vision_token"] = time.perf_counter() - start
+                parts.append(chunk)
+                self.vision_chunks += 1
+                self._chunks.put(chunk)
+            else:
+                if not any(part.startswith("[Vision Error]") for part in parts):
+                    try:
+                        image_store.store_description(
+                            self.image_hash, self._ollama_model, VISION_PROMPT, self._preprocessing, "".join(parts), time.perf_counter() - start
+                        )
+                    except Exception:
+                        logger.exception("could not cache image description")
+        finally:
+            stream.close()
+            self.timings["vision"] = time.perf_counter() - start
+            self._chunks.put(_DONE)
+
+    def _set_queue_position(self, position):
+        self.queue_position = position
+        if position == 0:
+            self.timings["queued"] = time.perf_counter() - self.started
+
+    def _run_retrieval(self):
+        start = time.perf_counter()
+        try:
+            return llm_client.search_anythingllm_workspace(*self._allm, self.question)
+        finally:
+            self.timings["retrieval"] = time.perf_counter() - start
+
+    # --- Merging (script thread) ---
+
+    def iter_vision(self, on_wait=None):
+        """Yield description chunks as they arrive, stopping at the vision deadline.
+
+        on_wait(position) is called whenever the place in the gateway queue changes.
+        """
+        parts = []
+        reported = None
+        try:
+            while True:
+                remaining = self.vision_deadline - time.perf_counter()
+                if remaining <= 0:
+                    self.partial = True
+                    self._cancelled.set()
+                    break
+                if on_wait and self.queue_position != reported:
+                    reported = self.queue_position
+                    on_wait(reported)
+                try:
+                    chunk = self._chunks.get(timeout=min(remaining, 0.5))
+                except queue.Empty:
+                    continue
+                if chunk is _DONE:
+                    break
+                parts.append(chunk)
+                yield chunk
+        finally:
+            self.description = "".join(parts)
+            if self.description.startswith("[Vision Error]"):
+                self.partial = True
+
+    def wait_vision(self, on_wait=None):
+        for _ in self.iter_vision(on_wait):
+            pass
+        return self.description
+
+    def wait_context(self):
+        remaining = max(0.1, self.vision_deadline - time.perf_counter())
+        try:
+            self.context = self._retrieval.result(timeout=remaining)
+        except Exception:
+            self.context = []
+        return self.context
+
+    def build_prompt(self):
+        self.wait_context()
+        sections = []
+        if (self.partial and not self.description.strip()) or self.description.startswith("[Vision Error]"):
+            sections.append("The user uploaded an image, but it could not be analysed. Answer from the question and the course notes, and ask the user to type out the relevant part of the image if it is needed.")
+        elif self.partial:
+            sections.append(f"The user uploaded an image. Image analysis was cut short; this is the partial description:\n{self.description}")
+        else:
+            sections.append(f"The user uploaded an image with this description:\n{self.description}")
+        if self.context:
+            notes = "\n".join(f"- {text.strip()}" for text in self.context)
+            sections.append(f"Relevant course notes:\n{notes}")
+        sections.append(f"User Question: {self.question}")
+        sections.append("Please answer the user's question based on the image description.")
+        self.timings["merge"] = time.perf_counter() - self.started
+        return "\n\n".join(sections)
+
+    def answer_timeout(self):
+        return max(5, self.deadline - time.perf_counter())
+
+    def timed_answer(self, stream):
+        """Wrap the answer stream to record time-to-first-token and total answer time."""
+        start = time.perf_counter()
+        for chunk in stream:
+            if "first_answer_token" not in self.timings:
+                self.timings["first_answer_token"] = time.perf_counter() - start
+            yield chunk
+        self.timings["answer"] = time.perf_counter() - start
+
+    def finish(self, tutor=""):
+        self._cancelled.set()
+        self.timings["total"] = time.perf_counter() - self.started
+        vision_error = self.partial or self.description.startswith("[Vision Error]")
+        if "vision_cached" in self.timings:
+            metrics.observe("vision_cached", self.timings["vision_cached"], tutor)
+        else:
+            # A cut-short stage may still be winding down; count it until the deadline
+            vision_seconds = self.timings.get("vision", self.vision_deadline - self.started)
+            metrics.observe("vision", vision_seconds, tutor, error=vision_error, size=self.vision_bytes)
+            metrics.count("vision_tokens", self.vision_chunks, tutor)
+        if "retrieval" in self.timings:
+            metrics.observe("retrieval", self.timings["retrieval"], tutor)
+        metrics.observe("image_turn", self.timings["total"], tutor, error=vision_error)
+        breakdown = " ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self.timings.items())
+        logger.info("image turn tutor=%s partial=%s %s", tutor, self.partial, breakdown)
+        return self.timings
@@ -0,0 +1,389 @@
+"""Cache of tutor answers for repeated questions.
+
+Students in one class ask the same questions of the same AnythingLLM
+workspace over and over. Answers are cached under (backend, workspace slug,
+mode, prompt) so a repeat is served without a backend round trip:
+
+  - exact key: the prompt as sent;
+  - normalized key: the prompt after Unicode normalization, case folding,
+    whitespace collapsing and trimming trailing punctuation, so
+    "What is a vector?" and "what is a  vector" share an answer.
+
+There is no semantic matching: different wording is a different question.
+
+Entries live in a per-process LRU with a TTL and, unless DSE_RESPONSE_CACHE_SHARED
+is "0", in a shared SQLite file (data/system/response_cache.db) so every runner
+process benefits from answers any other runner fetched.
+
+Each workspace has a generation number that is part of every key. Bumping it
+(invalidate_workspace) retires every cached answer for that workspace at once.
+It is bumped from the App Designer's "Clear Cached Answers" button and
+automatically when the workspace's document list changes. The list is checked
+at most every DOCUMENT_CHECK_INTERVAL seconds per workspace, on a background
+thread: the turn that triggers a check does not wait for it, and answers keep
+being served until it finds a change (stale-while-revalidate, like
+discovery.py).
+
+Nothing is written to the shared store on the lookup path. Hit/miss counters
+and the use times of served entries are kept in memory and added to it every
+STATS_FLUSH_INTERVAL seconds by a background thread (and at exit), as
+metrics.py does.
+
+Settings: DSE_RESPONSE_CACHE_TTL (seconds, default 86400),
+DSE_RESPONSE_CACHE_SIZE (entries kept in memory, default 1000).
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_client
+
+logger = logging.getLogger("dse.response_cache")
+
+TTL = float(os.environ.get("DSE_RESPONSE_CACHE_TTL", 86400))
+MAX_ENTRIES = int(os.environ.get("DSE_RESPONSE_CACHE_SIZE", 1000))
+SHARED = os.environ.get("DSE_RESPONSE_CACHE_SHARED", "1") != "0"
+CACHE_DB = os.path.join("data", "system", "response_cache.db")
+DOCUMENT_CHECK_INTERVAL = 60
+STATS_FLUSH_INTERVAL = 5 # seconds between writes of this process's counters to the shared store
+LOCK_TIMEOUT = 1 # seconds a turn waits for the shared store before going without it
+MAX_SHARED_ENTRIES = 50000
+PRUNE_EVERY = 500 # stores between sweeps of the shared store
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="response-cache")
+
+_memory = OrderedDict() # key -> (expires_at, response, elapsed_seconds)
+_memory_lock = threading.Lock()
+_generations = {} # workspace -> generation (when not shared)
+_document_checks = {} # workspace -> time the last check started
+_checking = set() # workspaces with a check in progress
+_fingerprints = {} # workspace -> document fingerprint (when not shared)
+_stores = 0
+_counters = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+_unflushed = {} # counter name -> amount not yet added to the shared store
+_used = {} # shared entry key -> when this process last served it, not yet written
+_flusher = None # (pid, thread)
+_local = threading.local()
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.,;:。？！，]+$")
+
+
+def normalize_prompt(prompt):
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = " ".join(text.split())
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+def _workspace(base_url, slug):
+    return f"{llm_client._backend_key(base_url)}|{slug}"
+
+def _key(workspace, generation, mode, prompt):
+    raw = json.dumps([workspace, generation, mode, prompt], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# --- Shared store ---
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        os.makedirs(os.path.dirname(CACHE_DB), exist_ok=True)
+        conn = sqlite3.connect(CACHE_DB, timeout=LOCK_TIMEOUT)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                workspace TEXT NOT NULL,
+                response TEXT NOT NULL,
+                elapsed REAL,
+                expires_at REAL NOT NULL,
+                used_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_responses_used ON responses(used_at);
+            CREATE TABLE IF NOT EXISTS workspaces (
+                workspace TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL DEFAULT 0,
+                fingerprint TEXT
+            );
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL DEFAULT 0
+            );
+        ''')
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+def _generation(workspace):
+    if not SHARED:
+        return _generations.get(workspace, 0)
+    row = _connect().execute("SELECT generation FROM workspaces WHERE workspace = ?", (workspace,)).fetchone()
+    return row[0] if row else 0
+
+def _count(name, amount=1):
+    with _memory_lock:
+        _counters[name] += amount
+        if SHARED:
+            _unflushed[name] = _unflushed.get(name, 0) + amount
+    if SHARED:
+        _ensure_flusher()
+
+def flush():
+    """Add this process's counters since the last flush, and the use times of the entries it served, to the shared store."""
+    global _unflushed, _used
+    with _memory_lock:
+        counts, used = _unflushed, _used
+        _unflushed, _used = {}, {}
+    if not counts and not used:
+        return
+    try:
+        conn = _connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO stats (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                list(counts.items())
+            )
+            conn.executemany("UPDATE responses SET used_at = MAX(used_at, ?) WHERE key = ?", [(at, key) for key, at in used.items()])
+    except sqlite3.Error:
+        # Keep them for the next attempt rather than losing them
+        with _memory_lock:
+            for name, amount in counts.items():
+                _unflushed[name] = _unflushed.get(name, 0) + amount
+            for key, at in used.items():
+                _used[key] = max(at, _used.get(key, 0))
+
+def _flush_loop():
+    while True:
+        time.sleep(STATS_FLUSH_INTERVAL)
+        flush()
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None or _flusher[0] != os.getpid():
+        with _memory_lock:
+            if _flusher is None or _flusher[0] != os.getpid():
+                thread = threading.Thread(target=_flush_loop, name="response-cache-flush", daemon=True)
+                thread.start()
+                _flusher = (os.getpid(), thread)
+                atexit.register(flush)
+
+# --- Public API ---
+
+def lookup(base_url, slug, prompt, mode="chat"):
+    """Cached answer for prompt, or None. Counts a hit or a miss.
+
+    The cache must never cost a turn its answer: if the shared store is locked
+    or broken, this is a miss.
+    """
+    workspace = _workspace(base_url, slug)
+    try:
+        generation = _generation(workspace)
+    except sqlite3.Error as e:
+        logger.warning("response cache unavailable, treating as a miss: %s", e)
+        _count("misses")
+        return None
+    keys = [_key(workspace, generation, mode, prompt), _key(workspace, generation, mode, "~" + normalize_prompt(prompt))]
+    now = time.time()
+    found = None
+    with _memory_lock:
+        for key in keys:
+            entry = _memory.get(key)
+            if entry and entry[0] > now:
+                _memory.move_to_end(key)
+                found = entry
+                break
+    if found is None and SHARED:
+        try:
+            conn = _connect()
+            for key in keys:
+                row = conn.execute("SELECT expires_at, response, elapsed FROM responses WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+                if row:
+                    found = tuple(row)
+                    with _memory_lock:
+                        _used[key] = now # Written by the next flush; the LRU trim in prune() can wait that long
+                    _remember(keys, found)
+                    break
+        except sqlite3.Error as e:
+            logger.warning("response cache lookup failed, treating as a miss: %s", e)
+    if found is None:
+        _count("misses")
+        return None
+    _count("hits")
+    if found[2]:
+        _count("saved_seconds", found[2])
+    return found[1]
+
+def store(base_url, slug, prompt, response, mode="chat", elapsed=None):
+    """Cache a successful answer (error responses are never cached)."""
+    if not response or response.startswith("[RAG Error]"):
+        return
+    workspace = _workspace(base_url, slug)
+    try:
+        generation = _generation(workspace)
+    except sqlite3.Error as e:
+        logger.warning("response cache unavailable, answer not cached: %s", e)
+        return
+    keys = [_key(workspace, generation, mode, prompt), _key(workspace, generation, mode, "~" + normalize_prompt(prompt))]
+    now = time.time()
+    entry = (now + TTL, response, elapsed)
+    _remember(keys, entry)
+    if SHARED:
+        global _stores
+        try:
+            conn = _connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO responses (key, workspace, response, elapsed, expires_at, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(key, workspace, response, elapsed, entry[0], now) for key in keys]
+                )
+            _stores += 1
+            if _stores % PRUNE_EVERY == 0:
+                prune()
+        except sqlite3.Error as e:
+            logger.warning("response cache store failed, answer kept in this process only: %s", e)
+
+def _remember(keys, entry):
+    with _memory_lock:
+        for key in keys:
+            _memory[key] = entry
+            _memory.move_to_end(key)
+        while len(_memory) > MAX_ENTRIES:
+            _memory.popitem(last=False)
+
+def invalidate_workspace(base_url, slug):
+    """Retire every cached answer for a workspace (e.g. after its documents changed)."""
+    workspace = _workspace(base_url, slug)
+    if SHARED:
+        conn = _connect()
+        conn.execute('''
+            INSERT INTO workspaces (workspace, generation) VALUES (?, 1)
+            ON CONFLICT(workspace) DO UPDATE SET generation = generation + 1
+        ''', (workspace,))
+        conn.execute("DELETE FROM responses WHERE workspace = ?", (workspace,))
+        conn.commit()
+    else:
+        _generations[workspace] = _generations.get(workspace, 0) + 1
+
+def check_documents(base_url, api_key, slug, wait=False):
+    """Invalidate the workspace if its document list changed since the last check.
+
+    At most one check per workspace every DOCUMENT_CHECK_INTERVAL seconds, run in
+    the background; wait=True runs it here and returns whether it invalidated.
+    """
+    workspace = _workspace(base_url, slug)
+    now = time.time()
+    with _memory_lock:
+        if workspace in _checking or now - _document_checks.get(workspace, 0) < DOCUMENT_CHECK_INTERVAL:
+            return False
+        _document_checks[workspace] = now
+        _checking.add(workspace)
+    if wait:
+        try:
+            return _check_documents(base_url, api_key, slug, workspace)
+        finally:
+            _checked(workspace)
+    _executor.submit(_check_documents, base_url, api_key, slug, workspace).add_done_callback(lambda _: _checked(workspace))
+    return False
+
+def _checked(workspace):
+    with _memory_lock:
+        _checking.discard(workspace)
+
+def _check_documents(base_url, api_key, slug, workspace):
+    try:
+        response = llm_client.get(f"{base_url}/workspace/{slug}", headers={"Authorization": f"Bearer {api_key}"})
+        response.raise_for_status()
+        data = response.json().get("workspace")
+    except Exception:
+        return False
+    if isinstance(data, list):
+        data = data[0] if data else {}
+    documents = sorted((d.get("docpath", ""), str(d.get("lastUpdatedAt", ""))) for d in (data or {}).get("documents", []))
+    fingerprint = hashlib.sha256(json.dumps(documents).encode("utf-8")).hexdigest()
+    if not SHARED:
+        previous = _fingerprints.get(workspace)
+        _fingerprints[workspace] = fingerprint
+    else:
+        conn = _connect()
+        row = conn.execute("SELECT fingerprint FROM workspaces WHERE workspace = ?", (workspace,)).fetchone()
+        previous = row[0] if row else None
+        conn.execute('''
+            INSERT INTO workspaces (workspace, fingerprint) VALUES (?, ?)
+            ON CONFLICT(workspace) DO UPDATE SET fingerprint = excluded.fingerprint
+        ''', (workspace, fingerprint))
+        conn.commit()
+    if previous is not None and previous != fingerprint:
+        invalidate_workspace(base_url, slug)
+        return True
+    return False
+
+def prune():
+    """Drop expired shared entries and trim the shared store to MAX_SHARED_ENTRIES."""
+    if not SHARED:
+        return
+    conn = _connect()
+    conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+    conn.execute('''
+        DELETE FROM responses WHERE key IN (
+            SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?
+        )
+    ''', (MAX_SHARED_ENTRIES,))
+    conn.commit()
+
+def stats(shared=True):
+    """Hit/miss counters: across all processes from the shared store, else this process only."""
+    values = None
+    if shared and SHARED:
+        flush() # Include this process's latest numbers
+        try:
+            values = dict(_connect().execute("SELECT name, value FROM stats").fetchall())
+        except sqlite3.Error as e:
+            logger.warning("response cache stats unavailable, showing this process only: %s", e)
+    if values is not None:
+        counters = {name: values.get(name, 0) for name in _counters}
+    else:
+        with _memory_lock:
+            counters = dict(_counters)
+    total = counters["hits"] + counters["misses"]
+    counters["hit_rate"] = counters["hits"] / total if total else 0.0
+    return counters
+
+def clear_memory():
+    with _memory_lock:
+        _memory.clear()
+
+# --- Cached backend calls ---
+
+def cached_chat(base_url, api_key, slug, message, mode="chat", read_timeout=llm_client.CHAT_TIMEOUT):
+    """call_anythingllm_chat, answered from the cache when possible."""
+    check_documents(base_url, api_key, slug)
+    cached = lookup(base_url, slug, message, mode)
+    if cached is not None:
+        return cached
+    start = time.perf_counter()
+    response = llm_client.call_anythingllm_chat(base_url, api_key, slug, message, mode, read_timeout=read_timeout)
+    store(base_url, slug, message, response, mode, elapsed=time.perf_counter() - start)
+    return response
+
+def cached_stream_chat(base_url, api_key, slug, message, mode="chat", read_timeout=llm_client.CHAT_TIMEOUT):
+    """stream_anythingllm_chat, replaying a cached answer in one chunk when possible."""
+    check_documents(base_url, api_key, slug)
+    cached = lookup(base_url, slug, message, mode)
+    if cached is not None:
+        yield cached
+        return
+    start = time.perf_counter()
+    chunks = []
+    for chunk in llm_client.stream_anythingllm_chat(base_url, api_key, slug, message, mode, read_timeout=read_timeout):
+        chunks.append(chunk)
+        yield chunk
+    # Only reached when the stream ran to completion (not when the reader stopped early)
+    if not any(chunk.startswith("[RAG Error]") for chunk in chunks):
+        store(base_url, slug, message, "".join(chunks), mode, elapsed=time.perf_counter() - start)
@@ -2,14 +2,46 @@ import streamlit as st
 import sys
 import os
 import json
-import requests
 import uuid
 import socket
-from datetime import datetime
+import time
+import logging
 import database
+import metrics
+import tutor_cache
+import job_queue
+import tutor_jobs
+from llm_client import CHAT_TIMEOUT, call_anythingllm_chat, stream_anythingllm_chat
+from response_cache import cached_chat, cached_stream_chat
+from pipeline import ImageTurn
+from context_window import ConversationContext, budgets, estimate_tokens
+from image_store import save_image, get_image_path
+from llm_gateway import gateway_url
+from history_store import list_sessions, count_sessions, load_session, save_session, delete_session
+from notebook_store import list_entries, count_entries, get_entries, delete_notebook_entry, update_notebook_entry_title, list_questions, request_questions, failed_questions, retry_questions
 
 # --- Constants ---
 DATA_DIR = "data"
+LOG_DIR = os.path.join(DATA_DIR, "system", "logs")
+HISTORY_PAGE_SIZE = 30
+NOTEBOOK_PAGE_SIZE = 20
+PRACTICE_CHOICES = 50 # most recent (or matching) entries offered for practice
+VIEWS = ["💬 Chat", "📝 Practice", "📓 Notebook"]
+USER_CACHE_TTL = 10 # seconds a looked-up user row is reused across reruns
+CHAT_PAGE_SIZE = 40 # messages drawn in the chat view; earlier ones behind a button
+JOB_POLL_SECONDS = 2 # how often the page checks on its background jobs while any is running
+JOB_LIST_SIZE = 5
+JOB_SHOW_FINISHED = 600 # seconds a finished notebook summary stays listed in the chat view
+JOB_ICONS = {"queued": "⏳", "running": "🧠", "done": "✅", "failed": "⚠️", "cancelled": "✖️"}
+
+# Per-turn timings from the image pipeline go to a shared log file
+tutor_logger = logging.getLogger("dse")
+if not tutor_logger.handlers:
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_handler = logging.FileHandler(os.path.join(LOG_DIR, "tutor.log"), encoding="utf-8")
+    log_handler.setFormatter(logging.Formatter("%(asctime)s [%(process)d] %(name)s %(message)s"))
+    tutor_logger.addHandler(log_handler)
+    tutor_logger.setLevel(logging.INFO)
 
 def get_local_ip():
     try:
@@ -29,8 +61,7 @@ DEFAULT_ANY_LLM_URL = f"http://{SERVER_IP}:3001/api/v1"
 def get_user_dir(username):
     return os.path.join(DATA_DIR, username)
 
-def load_config(username):
-    config_file = os.path.join(get_user_dir(username), "config.json")
+def read_config(config_file):
     if os.path.exists(config_file):
         try:
             with open(config_file, "r", encoding="utf-8") as f:
@@ -39,162 +70,120 @@ def load_config(username):
             pass
     return {}
 
-def load_session(username, session_id):
-    history_dir = os.path.join(get_user_dir(username), "history")
-    file_path = os.path.join(history_dir, f"{session_id}.json")
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data.get("messages", []), data.get("title", "New Chat")
-    except:
-        return [], "New Chat"
-
-def delete_session(username, session_id):
-    history_dir = os.path.join(get_user_dir(username), "history")
-    file_path = os.path.join(history_dir, f"{session_id}.json")
-    if os.path.exists(file_path):
-        os.remove(file_path)
-        return True
-    return False
-
-def save_image(username, image_bytes):
-    images_dir = os.path.join(get_user_dir(username), "images")
-    os.makedirs(images_dir, exist_ok=True)
-    filename = f"{uuid.uuid4()}.png"
-    file_path = os.path.join(images_dir, filename)
-    with open(file_path, "wb") as f:
-        f.write(image_bytes)
-    return filename
-
-def get_image_path(username, filename):
-    return os.path.join(get_user_dir(username), "images", filename)
-
-def save_session(username, session_id, messages):
-    if not messages: return
-    
-    title = "New Chat"
-    for msg in messages:
-        if msg["role"] == "user":
-            title = msg["content"][:30] + "..." if len(msg["content"]) > 30 else msg["content"]
-            break
-            
-    history_dir = os.path.join(get_user_dir(username), "history")
-    os.makedirs(history_dir, exist_ok=True)
-    file_path = os.path.join(history_dir, f"{session_id}.json")
-    
-    messages_to_save = []
-    for msg in messages:
-        msg_copy = msg.copy()
-        if "image_data" in msg_copy: 
-             del msg_copy["image_data"] # Don't save bytes to JSON
-        messages_to_save.append(msg_copy)
-        
-    data = {
-        "id": session_id,
-        "title": title,
-        "updated_at": datetime.now().isoformat(),
-        "messages": messages_to_save
-    }
-    
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-# --- Notebook Functions (JSON Based) ---
-def get_notebook_path(username):
-    return os.path.join(get_user_dir(username), "notebook.json")
+def load_config(username):
+    # Parsed once per process; re-read only when the teacher saves a new config.json
+    config_file = os.path.join(get_user_dir(username), "config.json")
+    return tutor_cache.cached("config", username, lambda: read_config(config_file), paths=(config_file,))
 
-def load_notebook(username):
-    path = get_notebook_path(username)
-    if os.path.exists(path):
-        try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except:
-            pass
-    return []
-
-def save_notebook(username, notebook_data):
-    path = get_notebook_path(username)
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(notebook_data, f, ensure_ascii=False, indent=2)
-
-def add_to_notebook(username, question, answer, summary=None):
-    notebook = load_notebook(username)
-    entry = {
-        "id": str(uuid.uuid4()),
-        "timestamp": datetime.now().isoformat(),
-        "title": summary[:50] if summary else question[:50],
-        "question": question,
-        "answer": answer,
-        "summary": summary
-    }
-    notebook.append(entry)
-    save_notebook(username, notebook)
-
-def delete_notebook_entry(username, entry_id):
-    notebook = load_notebook(username)
-    notebook = [n for n in notebook if n['id'] != entry_id]
-    save_notebook(username, notebook)
-
-def update_notebook_entry_title(username, entry_id, new_title):
-    notebook = load_notebook(username)
-    for n in notebook:
-        if n['id'] == entry_id:
-            n['title'] = new_title
-            break
-    save_notebook(username, notebook)
-
-def call_ollama_vision(base_url, model_name, image_bytes, prompt):
-    url = f"{base_url}/api/generate"
-    import base64
-    img_b64 = base64.b64encode(image_bytes).decode('utf-8')
-    payload = {
-        "model": model_name, 
-        "prompt": prompt,
-        "images": [img_b64],
-        "stream": False
-    }
-    try:
-        response = requests.post(url, json=payload, timeout=180)
-        response.raise_for_status()
-        return response.json().get("response", "")
-    except Exception as e:
-        return f"[Vision Error]: {str(e)}"
-
-def call_anythingllm_chat(base_url, api_key, slug, message, mode="chat"):
-    url = f"{base_url}/workspace/{slug}/chat"
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    payload = {"message": message, "mode": mode}
-    try:
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("textResponse", data.get("response", "No response text found."))
-    except Exception as e:
-        return f"[RAG Error]: {str(e)}"
+def get_user(kind, value):
+    lookup = database.get_user_by_id if kind == "id" else database.get_user_by_username
+    return tutor_cache.cached("user", kind, lambda: lookup(value), ttl=USER_CACHE_TTL, args=(str(value),))
 
 # --- Main Execution ---
 
 # Parse Command Line Arguments to get User ID
 # Usage: streamlit run runner.py -- user_id=123
+#        streamlit run runner.py -- mode=shared   (hub: tutor chosen by ?user_id=123 or ?tutor=username)
 user_id_arg = None
+serving_mode = "process"
 for arg in sys.argv:
     if arg.startswith("user_id="):
         user_id_arg = arg.split("=")[1]
-        break
-
-if not user_id_arg:
+    elif arg.startswith("mode="):
+        serving_mode = arg.split("=")[1]
+
+user = None
+if serving_mode == "shared":
+    if st.query_params.get("user_id"):
+        user = get_user("id", st.query_params.get("user_id"))
+    elif st.query_params.get("tutor"):
+        user = get_user("username", st.query_params.get("tutor"))
+    else:
+        st.error("No tutor selected. Open this app through the link on the main platform.")
+        st.stop()
+    # Only serve tutors that are currently published on the hub
+    dep = database.get_deployment(user["id"]) if user else None
+    if user and not (dep and dep['status'] == 'running' and dep.get('mode') == 'shared'):
+        st.error("This tutor is not published right now.")
+        st.stop()
+elif not user_id_arg:
     st.error("No User ID provided. This app must be launched from the main platform.")
     st.stop()
+else:
+    user = get_user("id", user_id_arg)
 
 # Load User Data
-user = database.get_user_by_id(user_id_arg)
 if not user:
     st.error("User not found.")
     st.stop()
 
+# A browser session is bound to a single tutor; drop chat state if the route changed
+if st.session_state.get("tutor_user_id") != user["id"]:
+    for key in ("messages", "session_id", "last_qa", "context"):
+        st.session_state.pop(key, None)
+    st.session_state.tutor_user_id = user["id"]
+
 username = user["username"]
 config = load_config(username)
+allm_args = (
+    config.get("url", DEFAULT_ANY_LLM_URL),
+    config.get("api_key", ""),
+    config.get("slug", "default"),
+)
+job_queue.start_workers() # Notebook summaries and practice questions run here, off the page
+
+def show_jobs(kind, show_result=False, done_text=None):
+    """This tutor's recent jobs of one kind, with Cancel/Retry. Polls while any is still running."""
+    active = job_queue.active_count(username, kind)
+
+    @st.fragment(run_every=JOB_POLL_SECONDS if active else None)
+    def job_list():
+        jobs = job_queue.list_jobs(username, kind, limit=JOB_LIST_SIZE)
+        if active and not any(job["status"] in job_queue.ACTIVE for job in jobs):
+            st.rerun() # All finished: redraw the page with the results and stop polling
+        if not show_result:
+            jobs = [job for job in jobs if job["status"] != "done" or time.time() - job["updated_at"] < JOB_SHOW_FINISHED]
+        for i, job in enumerate(jobs):
+            if job["status"] == "done" and show_result:
+                with st.expander(f"✅ {job['label']}", expanded=i == 0):
+                    st.markdown(job["result"])
+                continue
+            col1, col2 = st.columns([5, 1])
+            with col1:
+                status = {
+                    "queued": "Waiting to start" + (f" (retry {job['attempts'] + 1} of {job['max_attempts']})" if job["attempts"] else ""),
+                    "running": "Working on it..." + (f" (attempt {job['attempts']} of {job['max_attempts']})" if job["attempts"] > 1 else ""),
+                    "done": done_text or job["result"],
+                    "failed": f"Failed: {job['error']}",
+                    "cancelled": "Cancelled",
+                }[job["status"]]
+                st.caption(f"{JOB_ICONS[job['status']]} **{job['label']}** · {status}")
+            with col2:
+                if job["status"] in job_queue.ACTIVE:
+                    if st.button("Cancel", key=f"cancel_{job['id']}", use_container_width=True):
+                        job_queue.cancel(job["id"])
+                        st.rerun()
+                elif job["status"] in ("failed", "cancelled"):
+                    if st.button("Retry", key=f"retry_{job['id']}", use_container_width=True):
+                        job_queue.retry(job["id"])
+                        st.rerun()
+
+    job_list()
+
+def page_buttons(key, has_older, newer="Newer", older="Older"):
+    """Buttons stepping st.session_state[key], a page number (0 = newest), one page either way."""
+    page = st.session_state[key]
+    if not (page or has_older):
+        return
+    col1, col2 = st.columns(2)
+    with col1:
+        if page and st.button(newer, key=f"{key}_newer", use_container_width=True):
+            st.session_state[key] = page - 1
+            st.rerun()
+    with col2:
+        if has_older and st.button(older, key=f"{key}_older", use_container_width=True):
+            st.session_state[key] = page + 1
+            st.rerun()
 
 # App Config
 app_title = config.get("app_title", f"{user['name']}'s AI Tutor")
@@ -211,51 +200,64 @@ with st.sidebar:
         st.session_state.session_id = str(uuid.uuid4())
         st.rerun()
         
-    # Load History
-    import glob
-    history_dir = os.path.join(get_user_dir(username), "history")
-    if os.path.exists(history_dir):
-        files = glob.glob(os.path.join(history_dir, "*.json"))
-        files.sort(key=os.path.getmtime, reverse=True)
-        for fpath in files:
-            fname = os.path.basename(fpath)
-            sid = fname.replace(".json", "")
-            try:
-                with open(fpath, "r", encoding="utf-8") as f:
-                    meta = json.load(f)
-                    title = meta.get("title", "Untitled Chat")
-            except:
-                title = "Corrupted"
-            
-            # Using columns for Chat Title and Delete Button
-            col1, col2 = st.columns([4, 1])
-            with col1:
-                # Truncate title for button
-                btn_title = title if len(title) < 20 else title[:17] + "..."
-                if st.button(f"📄 {btn_title}", key=f"open_{sid}", use_container_width=True, help=title):
+    # Load History (metadata only; message bodies are read when a chat is opened), one page at a time
+    if "history_page" not in st.session_state:
+        st.session_state.history_page = 0
+    history_offset = st.session_state.history_page * HISTORY_PAGE_SIZE
+    with metrics.timer("history_list", username):
+        sessions = list_sessions(username, limit=HISTORY_PAGE_SIZE, offset=history_offset)
+    if not sessions and st.session_state.history_page:
+        st.session_state.history_page -= 1 # Its last chat was deleted
+        st.rerun()
+    for meta in sessions:
+        sid = meta["id"]
+        title = meta["title"]
+        
+        # Using columns for Chat Title and Delete Button
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            # Truncate title for button
+            btn_title = title if len(title) < 20 else title[:17] + "..."
+            if st.button(f"📄 {btn_title}", key=f"open_{sid}", use_container_width=True, help=title):
+                with metrics.timer("history_load", username):
                     msgs, _ = load_session(username, sid)
-                    st.session_state.messages = msgs
-                    st.session_state.session_id = sid
-                    st.rerun()
-            with col2:
-                if st.button("🗑️", key=f"del_{sid}"):
+                st.session_state.messages = msgs
+                st.session_state.session_id = sid
+                st.rerun()
+        with col2:
+            if st.button("🗑️", key=f"del_{sid}"):
+                with metrics.timer("history_delete", username):
                     delete_session(username, sid)
-                    if st.session_state.get('session_id') == sid:
-                        st.session_state.messages = []
-                        st.session_state.session_id = str(uuid.uuid4())
-                    st.rerun()
+                if st.session_state.get('session_id') == sid:
+                    st.session_state.messages = []
+                    st.session_state.session_id = str(uuid.uuid4())
+                st.rerun()
+    
+    has_older = len(sessions) == HISTORY_PAGE_SIZE and count_sessions(username) > history_offset + len(sessions)
+    page_buttons("history_page", has_older, newer="Newer chats", older="Older chats")
 
-# Tabs
-tab_chat, tab_practice, tab_notebook = st.tabs(["💬 Chat", "📝 Practice", "📓 Notebook"])
+# Views: only the selected one is built on a rerun (st.tabs would build all three every time)
+view = st.radio("View", VIEWS, horizontal=True, label_visibility="collapsed", key="view")
 
-with tab_chat:
+if view == VIEWS[0]:
     # Chat Logic
     if "session_id" not in st.session_state:
         st.session_state.session_id = str(uuid.uuid4())
     if "messages" not in st.session_state:
         st.session_state.messages = []
 
-    for msg in st.session_state.messages:
+    # Long chats: draw one page of messages on a rerun, the latest unless the student paged back
+    if st.session_state.get("chat_shown_for") != st.session_state.session_id:
+        st.session_state.chat_shown_for = st.session_state.session_id
+        st.session_state.chat_page = 0
+    chat_end = max(0, len(st.session_state.messages) - st.session_state.chat_page * CHAT_PAGE_SIZE)
+    chat_start = max(0, chat_end - CHAT_PAGE_SIZE)
+    if chat_start:
+        if st.button(f"Show earlier messages ({chat_start} more)"):
+            st.session_state.chat_page += 1
+            st.rerun()
+
+    for msg in st.session_state.messages[chat_start:chat_end]:
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
             if "image_path" in msg: # Load from persistent storage
@@ -267,6 +269,11 @@ with tab_chat:
             elif msg.get("has_image"): # Old fallback
                 st.caption("🖼️ [Image from history]")
 
+    if st.session_state.chat_page:
+        if st.button("Show later messages"):
+            st.session_state.chat_page -= 1
+            st.rerun()
+
     with st.popover("📎", help="Attach Image"):
         uploaded_file = st.file_uploader("Upload Image", type=["jpg", "png", "jpeg"], label_visibility="collapsed")
 
@@ -277,6 +284,13 @@ with tab_chat:
     user_input = st.chat_input("Ask your AI Tutor...")
 
     if user_input:
+        st.session_state.chat_page = 0 # Back to the latest messages, where this turn is drawn
+        # Image turns start the vision and retrieval stages right away, in the background
+        turn = None
+        if uploaded_file:
+            turn = ImageTurn(config, uploaded_file.getvalue(), user_input, DEFAULT_OLLAMA_URL, DEFAULT_ANY_LLM_URL,
+                             gateway=gateway_url(), client_id=username)
+        
         # User Message
         with st.chat_message("user"):
             st.markdown(user_input)
@@ -287,7 +301,8 @@ with tab_chat:
         if uploaded_file:
             # Save image to disk and add to message
             image_bytes = uploaded_file.getvalue()
-            filename = save_image(username, image_bytes)
+            with metrics.timer("image_save", username, size=len(image_bytes)):
+                filename = save_image(image_bytes) # Content-addressed: shared with identical uploads
             msg_data["image_path"] = filename
             # We don't store "image" bytes in session state logic to avoid issues, we just reload path
             
@@ -295,42 +310,68 @@ with tab_chat:
         
         # AI Response
         response_text = ""
+        stream_responses = config.get("stream_responses", True)
+        prompt_text = user_input
+        read_timeout = CHAT_TIMEOUT
+        use_cache = config.get("response_cache", True)
         
-        if uploaded_file:
-            # VLM + RAG Logic
-            with st.spinner("👀 Analyzing Image (Ollama)..."):
-                image_bytes = uploaded_file.getvalue()
-                desc_prompt = "Describe this image in detail. If it contains text or math, transcribe it exactly."
-                img_desc = call_ollama_vision(
-                    config.get("ollama_url", DEFAULT_OLLAMA_URL),
-                    config.get("ollama_model", "qwen3-vl:8b"),
-                    image_bytes,
-                    desc_prompt
-                )
-            
-            with st.spinner("🧠 Thinking (AnythingLLM)..."):
-                rag_prompt = f"The user uploaded an image with this description:\n{img_desc}\n\nUser Question: {user_input}\n\nPlease answer the user's question based on the image description."
-                response_text = call_anythingllm_chat(
-                    config.get("url", DEFAULT_ANY_LLM_URL),
-                    config.get("api_key", ""),
-                    config.get("slug", "default"),
-                    rag_prompt
-                )
-        else:
-            # Text Only
-             with st.spinner("🧠 Thinking (AnythingLLM)..."):
-                response_text = call_anythingllm_chat(
-                    config.get("url", DEFAULT_ANY_LLM_URL),
-                    config.get("api_key", ""),
-                    config.get("slug", "default"),
-                    user_input
-                )
+        if turn:
+            # VLM + RAG Logic (vision and retrieval were started above and ran while the image was saved)
+            with st.status("👀 Analyzing Image (Ollama)...", expanded=stream_responses) as vision_status:
+                def show_queue(position):
+                    # Live place in the shared vision queue (only reported when the LLM gateway is on)
+                    if position:
+                        vision_status.update(label=f"⏳ Waiting for the vision model: number {position} in the queue...")
+                    elif position == 0:
+                        vision_status.update(label="👀 Analyzing Image (Ollama)...")
+                if stream_responses:
+                    st.write_stream(turn.iter_vision(on_wait=show_queue))
+                else:
+                    turn.wait_vision(on_wait=show_queue)
+                vision_status.update(label="👀 Image analyzed", state="complete", expanded=False)
+            prompt_text = turn.build_prompt()
+            read_timeout = turn.answer_timeout()
+            if turn.partial:
+                st.warning("⏱️ The image took too long to analyse, so this answer may be incomplete.")
+                use_cache = False # Don't reuse an answer built from a cut-short description
+        
+        # Recent turns and a rolling summary of older ones go in front of the question
+        context = st.session_state.get("context")
+        if context is None or context.session_id != st.session_state.session_id:
+            context = ConversationContext(st.session_state.session_id, allm_args, tutor=username)
+            st.session_state.context = context
+        context.allm_args = allm_args
+        context.context_budget, context.summary_budget = budgets(config) # The teacher may change them mid-session
+        history = st.session_state.messages[:-1]
+        if history and context.context_budget > 0:
+            prompt_text = context.build_prompt(history, prompt_text)
+            use_cache = False # The answer depends on this conversation, not just the question
+        metrics.count("prompt_tokens", estimate_tokens(prompt_text), username)
         
         with st.chat_message("assistant"):
-            st.markdown(response_text)
+            if stream_responses:
+                # Tokens render as they arrive; write_stream returns the full text for saving
+                chat_stream = cached_stream_chat if use_cache else stream_anythingllm_chat
+                stream = metrics.timed_stream("answer", chat_stream(*allm_args, prompt_text, read_timeout=read_timeout), username)
+                response_text = st.write_stream(turn.timed_answer(stream) if turn else stream)
+            else:
+                with st.spinner("🧠 Thinking (AnythingLLM)..."):
+                    answer_start = time.perf_counter()
+                    chat = cached_chat if use_cache else call_anythingllm_chat
+                    with metrics.timer("answer", username) as t:
+                        response_text = chat(*allm_args, prompt_text, read_timeout=read_timeout)
+                        t.size = len(response_text.encode("utf-8"))
+                        t.error = response_text.startswith("[RAG Error]")
+                    if turn:
+                        turn.timings["answer"] = time.perf_counter() - answer_start
+                st.markdown(response_text)
+        
+        if turn:
+            turn.finish(username)
         
         st.session_state.messages.append({"role": "assistant", "content": response_text})
-        save_session(username, st.session_state.session_id, st.session_state.messages)
+        with metrics.timer("history_save", username):
+            save_session(username, st.session_state.session_id, st.session_state.messages)
         
         # Store last Q&A for Notebook
         st.session_state.last_qa = (user_input, response_text)
@@ -340,68 +381,99 @@ with tab_chat:
     if "last_qa" in st.session_state:
         q, a = st.session_state.last_qa
         if st.button("📝 Add Last Q&A to Notebook"):
-            with st.spinner("🧠 Analyzing mistake and summarizing..."):
-                summary_prompt = f"Analyze this student's question and the answer. Summarize the key mistake the student might have made or the key concept they need to remember. Be concise.\n\nQuestion: {q}\nAnswer: {a}"
-                summary = call_anythingllm_chat(
-                    config.get("url", DEFAULT_ANY_LLM_URL),
-                    config.get("api_key", ""),
-                    config.get("slug", "default"),
-                    summary_prompt
-                )
-                add_to_notebook(username, q, a, summary)
-            st.success("Added to Notebook with AI Summary!")
+            # Summarized in the background: the page stays usable and the entry is saved even if the student moves on
+            tutor_jobs.add_qa(username, q, a)
             del st.session_state.last_qa # Clear after adding
+            st.rerun()
+    show_jobs(tutor_jobs.NOTEBOOK_SUMMARY, done_text="Added to your notebook")
 
-with tab_practice:
-    st.header("📝 Generate Practice Questions")
-    st.write("Select topics from your notebook to generate questions.")
+elif view == VIEWS[1]:
+    st.header("📝 Practice Questions")
+    st.write("Select topics from your notebook to practice.")
     
-    notebook = load_notebook(username)
+    topic_filter = st.text_input("🔍 Find topics", placeholder="Search your notebook", key="practice_filter")
+    with metrics.timer("notebook_search" if topic_filter else "notebook_list", username):
+        # Newest first, ordered by the timestamp index; only the first PRACTICE_CHOICES are offered
+        notebook = list_entries(username, limit=PRACTICE_CHOICES, query=topic_filter)
     if not notebook:
-        st.info("Your notebook is empty. Add some entries first!")
+        st.info("No matching entries." if topic_filter else "Your notebook is empty. Add some entries first!")
     else:
-        # Sort by timestamp desc
-        notebook.sort(key=lambda x: x['timestamp'], reverse=True)
-        
+        if len(notebook) == PRACTICE_CHOICES:
+            st.caption(f"Showing the {PRACTICE_CHOICES} most recent {'matching ' if topic_filter else ''}entries. Search to find older ones.")
         # Selection UI
         options = {entry['id']: f"{entry['title']} ({entry['timestamp'][:10]})" for entry in notebook}
         selected_ids = st.multiselect("Select Mistake Entries to Practice:", options.keys(), format_func=lambda x: options[x])
         
-        if st.button("Generate Questions"):
+        if selected_ids:
+            # Served from the question bank, which is filled in the background as entries are added
+            with metrics.timer("question_bank_read", username):
+                banked = {}
+                for row in list_questions(username, selected_ids):
+                    banked.setdefault(row["entry_id"], []).append(row["question"])
+            for entry_id in selected_ids:
+                if entry_id in banked:
+                    st.markdown(f"**{options[entry_id]}**")
+                    st.markdown("\n".join(f"{i}. {question}" for i, question in enumerate(banked[entry_id], 1)))
+            missing = [entry_id for entry_id in selected_ids if entry_id not in banked]
+            if missing:
+                # Entries from before the bank, or whose questions are still being prepared. Only new requests
+                # start a bank job: reruns must not queue one again for entries a job could not fill.
+                if request_questions(username, missing):
+                    tutor_jobs.fill_bank(username, delay=0)
+                stuck = failed_questions(username, missing)
+                if not job_queue.active_count(username, tutor_jobs.QUESTION_BANK):
+                    stuck = set(missing) # Waiting, but no bank job left to fill them (it was cancelled or failed)
+                preparing = len(missing) - len(stuck)
+                if preparing:
+                    st.info(f"Practice questions for {preparing} of the selected topics are being prepared and will appear here shortly.")
+                if stuck:
+                    st.warning(f"Practice questions for {len(stuck)} of the selected topics could not be prepared.")
+                    if st.button("🔄 Retry", key="bank_retry"):
+                        retry_questions(username, list(stuck))
+                        tutor_jobs.fill_bank(username, delay=0)
+                        st.rerun()
+        
+        if st.button("✨ Generate New Questions", help="Ask the tutor for a fresh set of questions mixing the selected topics."):
             if not selected_ids:
                 st.warning("Please select at least one topic.")
             else:
-                selected_entries = [n for n in notebook if n['id'] in selected_ids]
-                # Construct context
-                context_text = ""
-                for entry in selected_entries:
-                    context_text += f"\n---\nTopic: {entry['title']}\nMistake/Key Point: {entry['summary']}\nOriginal Q: {entry['question']}\n"
-                
-                with st.spinner("Generating targeted practice questions..."):
-                    prompt = f"Based on these specific mistake entries from a student's notebook, generate 3 practice questions to test their understanding and help them avoid similar mistakes:\n{context_text}"
-                    questions = call_anythingllm_chat(
-                        config.get("url", DEFAULT_ANY_LLM_URL),
-                        config.get("api_key", ""),
-                        config.get("slug", "default"),
-                        prompt
-                    )
-                    st.markdown(questions)
-
-with tab_notebook:
+                selected_entries = get_entries(username, selected_ids)
+                tutor_jobs.practice(username, selected_entries)
+                st.rerun()
+    
+    show_jobs(tutor_jobs.QUESTION_BANK)
+    # Fresh practice sets are generated in the background and kept, newest first
+    show_jobs(tutor_jobs.PRACTICE, show_result=True)
+
+elif view == VIEWS[2]:
+    def rename_entry(entry_id):
+        update_notebook_entry_title(username, entry_id, st.session_state[f"title_{entry_id}"])
+        tutor_jobs.fill_bank(username) # Editing an entry retires its banked questions; prepare new ones
+
     st.header("📓 Your Notebook")
+    show_jobs(tutor_jobs.NOTEBOOK_SUMMARY, done_text="Added to your notebook") # Entries still being summarized
     
-    notebook = load_notebook(username)
+    search = st.text_input("🔍 Search notebook", placeholder="Search questions, answers and summaries")
+    # One page of entries at a time (the search runs in SQLite); a new search starts from the first page
+    if st.session_state.get("notebook_query") != search:
+        st.session_state.notebook_query = search
+        st.session_state.notebook_page = 0
+    notebook_offset = st.session_state.notebook_page * NOTEBOOK_PAGE_SIZE
+    with metrics.timer("notebook_search" if search else "notebook_list", username):
+        notebook = list_entries(username, limit=NOTEBOOK_PAGE_SIZE, offset=notebook_offset, query=search)
+    if not notebook and st.session_state.notebook_page:
+        st.session_state.notebook_page -= 1 # Its last entry was deleted
+        st.rerun()
     if not notebook:
-        st.info("No entries yet.")
+        st.info("No matching entries." if search else "No entries yet.")
     else:
-        notebook.sort(key=lambda x: x['timestamp'], reverse=True)
         for entry in notebook:
             with st.expander(f"📌 {entry['title']} - {entry['timestamp'][:16]}"):
-                # Edit Title
-                new_title = st.text_input("Title", value=entry['title'], key=f"title_{entry['id']}")
-                if new_title != entry['title']:
-                    update_notebook_entry_title(username, entry['id'], new_title)
-                    st.rerun()
+                # Edit Title (saved only when the field actually changes)
+                st.text_input(
+                    "Title", value=entry['title'], key=f"title_{entry['id']}",
+                    on_change=rename_entry, args=(entry['id'],)
+                )
                 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -415,8 +487,14 @@ with tab_notebook:
                 st.warning(entry['summary'])
                 
                 if st.button("🗑️ Delete Entry", key=f"del_note_{entry['id']}"):
-                    delete_notebook_entry(username, entry['id'])
+                    with metrics.timer("notebook_delete", username):
+                        delete_notebook_entry(username, entry['id'])
                     st.rerun()
+        
+        if notebook_offset or len(notebook) == NOTEBOOK_PAGE_SIZE:
+            total = count_entries(username, query=search)
+            st.caption(f"Showing {notebook_offset + 1}-{notebook_offset + len(notebook)} of {total} entries")
+            page_buttons("notebook_page", total > notebook_offset + len(notebook), newer="Newer entries", older="Older entries")
 
     if st.button("Refresh Notebook"):
         st.rerun()
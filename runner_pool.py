@@ -0,0 +1,123 @@
+"""Pool of pre-imported runner workers for fast tutor launches.
+
+A worker is a Python process that has already imported streamlit, requests,
+database and llm_client, then blocks reading a single JSON assignment from stdin:
+
+    {"port": 8502, "args": ["user_id=3"]}
+
+On assignment it starts the Streamlit server for runner.py in-process, skipping
+the cold import cost. Run directly (python runner_pool.py) to start a worker.
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+
+WORKER_SCRIPT = os.path.abspath(__file__)
+
+
+def spawn_worker():
+    return subprocess.Popen(
+        [sys.executable, WORKER_SCRIPT],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+class RunnerPool:
+    """Keeps `size` idle workers warm and hands one out per launch."""
+
+    def __init__(self, size=2):
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def resize(self, size):
+        with self._lock:
+            self.size = size
+            surplus = self._idle[size:]
+            self._idle = self._idle[:size]
+        for worker in surplus:
+            worker.kill()
+        self.refill()
+
+    def idle_count(self):
+        with self._lock:
+            self._idle = [w for w in self._idle if w.poll() is None]
+            return len(self._idle)
+
+    def launch(self, port, runner_args, runner_script):
+        """Start runner_script on port using a warm worker (cold spawn if none). Returns the Popen."""
+        worker = None
+        with self._lock:
+            while self._idle and worker is None:
+                candidate = self._idle.pop(0)
+                if candidate.poll() is None:
+                    worker = candidate
+        if worker is None:
+            worker = spawn_worker()
+
+        assignment = {"port": port, "script": runner_script, "args": list(runner_args)}
+        worker.stdin.write((json.dumps(assignment) + "\n").encode("utf-8"))
+        worker.stdin.close()
+        self.refill()
+        return worker
+
+    def refill(self):
+        """Top the pool back up in the background, one worker at a time."""
+        with self._lock:
+            self._idle = [w for w in self._idle if w.poll() is None]
+            if self._refilling or len(self._idle) >= self.size:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill_loop, daemon=True).start()
+
+    def _refill_loop(self):
+        try:
+            while True:
+                with self._lock:
+                    self._idle = [w for w in self._idle if w.poll() is None]
+                    if len(self._idle) >= self.size:
+                        return
+                worker = spawn_worker()
+                with self._lock:
+                    self._idle.append(worker)
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.kill()
+
+
+def _worker_main():
+    # Pay the import cost up front, before any tutor is assigned
+    import requests  # noqa: F401
+    import streamlit  # noqa: F401
+    from streamlit.web import cli
+    import database  # noqa: F401
+    import llm_client  # noqa: F401
+
+    line = sys.stdin.readline()
+    if not line:
+        return # Pool shut down before we were used
+    assignment = json.loads(line)
+    sys.argv = [
+        "streamlit", "run", assignment["script"],
+        "--server.port", str(assignment["port"]),
+        "--server.headless", "true",
+        "--server.address", "0.0.0.0",
+        "--server.fileWatcherType", "none",
+        "--", *assignment["args"]
+    ]
+    cli.main()
+
+
+if __name__ == "__main__":
+    _worker_main()
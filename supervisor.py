@@ -0,0 +1,319 @@
+"""Supervisor for published tutor runners.
+
+A background thread that watches every running dedicated runner and the
+shared servers (tutor hub, front proxy, LLM gateway). On each sweep it:
+
+  - confirms the process is still the one that was launched (PID plus create
+    time, so a reused PID is never mistaken for a live tutor),
+  - polls the runner's /_stcore/health endpoint,
+  - samples CPU and resident memory with psutil,
+  - and writes the result to the deployments / servers table, which is what
+    the Teacher Dashboard displays.
+
+Crashed runners, runners that fail several health checks in a row and runners
+over the memory ceiling are restarted on the same port, with exponential
+backoff. After MAX_RESTARTS attempts without a stable run the tutor is stopped
+and marked failed.
+
+When an idle timeout is set, tutors served through the front proxy that have
+had no sessions for that long are hibernated: the runner is stopped and its
+memory released, and the proxy wakes it on the next visit (see front_proxy.py).
+
+The teacher app starts the supervisor automatically. It can also run on its
+own (python supervisor.py); a lock file keeps a second instance on the same
+machine from supervising the same runners.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import psutil
+import requests
+
+import database
+import deployer
+
+try:
+    import fcntl
+except ImportError: # Windows: no cross-process guard
+    fcntl = None
+
+logger = logging.getLogger("dse.supervisor")
+
+CHECK_INTERVAL = 5 # seconds between sweeps
+HEALTH_TIMEOUT = 2 # seconds for one health probe
+MAX_HEALTH_FAILURES = 3 # consecutive failed probes before a live runner counts as hung
+BACKOFF_BASE = 2 # seconds before the first restart; doubles per attempt
+BACKOFF_MAX = 120
+MAX_RESTARTS = 5 # attempts before giving up on a runner
+STABLE_AFTER = 300 # seconds of good health that reset the attempt count
+LOCK_FILE = "data/system/supervisor.lock"
+
+# Health values written to the database
+HEALTHY = "healthy"
+STARTING = "starting"
+DEGRADED = "degraded" # missed a health check, not yet considered hung
+UNRESPONSIVE = "unresponsive"
+OVER_MEMORY = "over_memory"
+CRASHED = "crashed"
+RESTARTING = "restarting"
+FAILED = "failed"
+HIBERNATED = "hibernated"
+
+
+def _seconds_since(timestamp):
+    try:
+        return time.time() - datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+class RunnerState:
+    """What the supervisor remembers about one runner between sweeps."""
+
+    def __init__(self):
+        self.proc = None # psutil.Process, kept so cpu_percent measures the interval between sweeps
+        self.health_failures = 0
+        self.attempts = 0
+        self.next_restart = 0.0
+        self.healthy_since = None
+
+
+class Supervisor:
+    def __init__(self, interval=CHECK_INTERVAL, memory_limit_mb=0, idle_timeout=0):
+        self.interval = interval
+        self.memory_limit_mb = memory_limit_mb
+        self.idle_timeout = idle_timeout # seconds without sessions before hibernating (0 = never)
+        self._states = {}
+        self._restarting = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock_handle = None
+        self._restarter = ThreadPoolExecutor(max_workers=4, thread_name_prefix="supervisor-restart")
+
+    def configure(self, interval=None, memory_limit_mb=None, idle_timeout=None):
+        if interval is not None:
+            self.interval = interval
+        if memory_limit_mb is not None:
+            self.memory_limit_mb = memory_limit_mb
+        if idle_timeout is not None:
+            self.idle_timeout = idle_timeout
+
+    def start(self):
+        """Start the sweep thread (no-op if running here or in another process on this machine)."""
+        if self._thread and self._thread.is_alive():
+            return True
+        if not self._acquire_lock():
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="supervisor", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self._lock_handle:
+            self._lock_handle.close()
+            self._lock_handle = None
+
+    def _acquire_lock(self):
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(LOCK_FILE), exist_ok=True)
+        handle = open(LOCK_FILE, "w")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._lock_handle = handle
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.check_once()
+            except Exception:
+                logger.exception("supervisor sweep failed")
+            self._stop.wait(self.interval)
+
+    # --- Sweep ---
+
+    def check_once(self):
+        """Check every running runner once. Returns {(kind, name): health}."""
+        results = {}
+        if self.idle_timeout:
+            results.update(self.reap_idle())
+        runners = database.get_supervised_runners()
+        seen = set()
+        for runner in runners:
+            key = (runner['kind'], runner['name'])
+            seen.add(key)
+            with self._lock:
+                if key in self._restarting:
+                    results[key] = RESTARTING
+                    continue
+            state = self._states.setdefault(key, RunnerState())
+            results[key] = self._check(runner, state)
+        # Forget runners that were stopped
+        for key in list(self._states):
+            if key not in seen:
+                del self._states[key]
+        database.reclaim_ports()
+        return results
+
+    def reap_idle(self):
+        """Hibernate proxied tutors with no sessions for idle_timeout seconds. Returns {(kind, name): 'hibernated'}."""
+        results = {}
+        for dep in database.get_idle_deployments(self.idle_timeout):
+            key = ("deployment", str(dep['user_id']))
+            with self._lock:
+                if key in self._restarting:
+                    continue
+            rss = deployer.hibernate_student_app(dep['user_id'])
+            self._states.pop(key, None)
+            results[key] = HIBERNATED
+            logger.info("hibernated idle tutor %s, released %d MB", dep['user_id'], rss // 2**20)
+        return results
+
+    def _check(self, runner, state):
+        kind, name = runner['kind'], runner['name']
+        proc = self._process_for(runner, state)
+        if proc is None:
+            return self._handle_failure(runner, state, CRASHED)
+
+        try:
+            cpu = proc.cpu_percent(None)
+            rss = proc.memory_info().rss
+        except psutil.Error:
+            return self._handle_failure(runner, state, CRASHED)
+
+        if self.memory_limit_mb and rss > self.memory_limit_mb * 1024 * 1024:
+            logger.warning("runner %s:%s using %d MB, over the %d MB limit", kind, name, rss // 2**20, self.memory_limit_mb)
+            return self._handle_failure(runner, state, OVER_MEMORY, cpu, rss)
+
+        if self._probe(runner['port']):
+            state.health_failures = 0
+            now = time.time()
+            if state.healthy_since is None:
+                state.healthy_since = now
+            elif now - state.healthy_since >= STABLE_AFTER:
+                state.attempts = 0
+            database.record_runner_health(kind, name, HEALTHY, cpu, rss)
+            return HEALTHY
+
+        state.healthy_since = None
+        if _seconds_since(runner['updated_at']) < deployer.READY_TIMEOUT:
+            # Still booting; missed probes only count once the launch window has passed
+            database.record_runner_health(kind, name, STARTING, cpu, rss)
+            return STARTING
+        state.health_failures += 1
+        if state.health_failures >= MAX_HEALTH_FAILURES:
+            return self._handle_failure(runner, state, UNRESPONSIVE, cpu, rss)
+        database.record_runner_health(kind, name, DEGRADED, cpu, rss)
+        return DEGRADED
+
+    def _process_for(self, runner, state):
+        """The psutil.Process for a runner if it is alive and still the process we launched."""
+        pid, started = runner['pid'], runner['pid_started']
+        if state.proc is None or state.proc.pid != pid:
+            try:
+                state.proc = psutil.Process(pid) if pid else None
+            except psutil.Error:
+                state.proc = None
+        if state.proc is None or not deployer.is_runner_alive(pid, started):
+            state.proc = None
+        return state.proc
+
+    def _probe(self, port):
+        try:
+            return requests.get(f"http://127.0.0.1:{port}/_stcore/health", timeout=HEALTH_TIMEOUT).status_code == 200
+        except requests.RequestException:
+            return False
+
+    # --- Recovery ---
+
+    def _handle_failure(self, runner, state, reason, cpu=None, rss=None):
+        kind, name = runner['kind'], runner['name']
+        state.healthy_since = None
+        if runner.get('account_status') == 'banned':
+            deployer.stop_student_app(int(name))
+            return reason
+        if state.attempts >= MAX_RESTARTS:
+            logger.error("runner %s:%s failed %d restarts, giving up", kind, name, state.attempts)
+            if kind == "server":
+                deployer.stop_server(name)
+            else:
+                deployer.stop_student_app(int(name))
+            database.record_runner_health(kind, name, FAILED)
+            return FAILED
+
+        now = time.time()
+        if not state.next_restart:
+            state.next_restart = now + min(BACKOFF_MAX, BACKOFF_BASE * 2 ** state.attempts)
+        if now < state.next_restart:
+            database.record_runner_health(kind, name, reason, cpu, rss)
+            return reason
+
+        state.attempts += 1
+        state.next_restart = 0.0
+        state.health_failures = 0
+        state.proc = None
+        with self._lock:
+            self._restarting.add((kind, name))
+        database.record_runner_health(kind, name, RESTARTING, restarted=True)
+        logger.warning("restarting runner %s:%s (%s, attempt %d)", kind, name, reason, state.attempts)
+        self._restarter.submit(self._restart, runner)
+        return RESTARTING
+
+    def _restart(self, runner):
+        kind, name = runner['kind'], runner['name']
+        try:
+            # The teacher may have stopped or relaunched it while we were backing off
+            current = database.get_server(name) if kind == "server" else database.get_deployment(int(name))
+            if current and current['status'] == 'running' and current['pid'] == runner['pid']:
+                deployer.restart_runner(kind, name)
+        except Exception:
+            logger.exception("restart of runner %s:%s failed", kind, name)
+        finally:
+            with self._lock:
+                self._restarting.discard((kind, name))
+
+
+# Shared by everything in this process
+supervisor = Supervisor()
+
+def ensure_running(memory_limit_mb=None, interval=None, idle_timeout=None):
+    """Apply settings and make sure the supervisor thread is running."""
+    supervisor.configure(interval=interval, memory_limit_mb=memory_limit_mb, idle_timeout=idle_timeout)
+    return supervisor.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Supervise published tutor runners")
+    parser.add_argument("--interval", type=float, default=CHECK_INTERVAL)
+    parser.add_argument("--memory-limit-mb", type=int, default=0, help="restart runners above this RSS (0 = no limit)")
+    parser.add_argument("--idle-minutes", type=float, default=0, help="hibernate proxied tutors idle this long (0 = never)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    database.init_db()
+    supervisor.configure(interval=args.interval, memory_limit_mb=args.memory_limit_mb, idle_timeout=args.idle_minutes * 60)
+    if not supervisor.start():
+        parser.exit(1, f"Another supervisor holds {LOCK_FILE}\n")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
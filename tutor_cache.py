@@ -0,0 +1,73 @@
+"""Process-level cache for what a tutor reads on every rerun.
+
+Streamlit reruns the whole runner script on every click, so without a cache
+each rerun looked the user up in the platform database, parsed config.json and
+listed the history and notebook databases again, for every open tab. Entries
+here are shared by all sessions in the process (a runner, or the hub) and
+checked against a cheap signature instead of being re-read:
+
+  - file-backed values (config.json, the history index, notebook.db) against
+    the (inode, mtime, size) of their files: one stat() per file per rerun, and
+    a write by any process, including the teacher app's atomic config save,
+    changes it;
+  - values without a file (the user row) against a short TTL.
+
+Stores also call invalidate() after their own writes, so a change made in this
+process is never served stale even if the file's mtime did not move.
+Cached values are shared: callers must not modify them.
+"""
+import os
+import threading
+import time
+
+_lock = threading.Lock()
+_entries = {} # (kind, key, args) -> (signature, loaded_at, value)
+_generation = 0 # bumped by invalidate(), so a load that raced with a write is not stored
+_hits = 0
+_misses = 0
+
+
+def signature(paths):
+    sig = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            sig.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+def cached(kind, key, load, paths=(), ttl=None, args=()):
+    """load() through the cache, reloading when a file in `paths` changed or `ttl` seconds passed.
+
+    `key` is what invalidate() matches on (e.g. the username); `args` tells apart
+    several values cached for one key (e.g. history pages).
+    """
+    global _hits, _misses
+    sig = signature(paths)
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get((kind, key, args))
+        if entry and entry[0] == sig and (ttl is None or now - entry[1] < ttl):
+            _hits += 1
+            return entry[2]
+        _misses += 1
+        generation = _generation
+    # Signature taken before loading: a write racing with the load is picked up next time
+    value = load()
+    with _lock:
+        if generation == _generation:
+            _entries[(kind, key, args)] = (sig, now, value)
+    return value
+
+def invalidate(kind=None, key=None):
+    """Drop entries: all of them, all of one kind, or those of one kind and key."""
+    global _generation
+    with _lock:
+        _generation += 1
+        for k in [k for k in _entries if kind is None or (k[0] == kind and (key is None or k[1] == key))]:
+            del _entries[k]
+
+def stats():
+    with _lock:
+        return {"entries": len(_entries), "hits": _hits, "misses": _misses}
@@ -0,0 +1,195 @@
+"""The tutor page's background jobs: notebook summaries, practice questions and the question bank.
+
+runner.py enqueues these on job_queue instead of calling AnythingLLM inside
+the script run; the handlers run on the job workers of whichever tutor process
+claims them. Payloads carry the texts a handler needs, so any runner can
+finish a job another one started. The AnythingLLM URL, API key and workspace
+are not stored with the job: the handler reads them from the tutor's
+config.json when it runs, so jobs.db never holds a key (and a job picks up a
+key the teacher has since changed).
+
+The question bank job fills notebook_store's bank for the entries waiting for
+questions. It starts BANK_DELAY seconds after the first request, so entries
+added close together are handled by one job, and groups similar entries (by
+shared words in their titles and summaries) into one LLM call of up to
+BANK_BATCH entries.
+
+Entries the model gives no usable questions for, and those of a bank job that
+fails for good, are marked failed in the bank (notebook_store.fail_questions)
+instead of staying in line, so a bad reply cannot start a loop of bank jobs.
+The Practice view offers to retry them.
+"""
+import functools
+import json
+import os
+import re
+import socket
+
+import job_queue
+import metrics
+import tutor_cache
+from context_window import truncate_tokens
+from llm_client import call_anythingllm_chat
+from notebook_store import add_to_notebook, add_questions, fail_questions, pending_questions
+
+DATA_DIR = "data"
+
+NOTEBOOK_SUMMARY = "notebook_summary"
+PRACTICE = "practice_questions"
+QUESTION_BANK = "question_bank"
+
+BANK_QUESTIONS = 3 # per entry
+BANK_BATCH = 4 # similar entries per LLM call
+BANK_ENTRIES_PER_JOB = 12 # the rest are left to a follow-up job
+BANK_DELAY = 20 # seconds a bank job waits for more entries to batch
+BANK_SIMILARITY = 0.2 # word overlap (Jaccard) for two entries to share a call
+BANK_FIELD_TOKENS = 200 # of each entry's summary and question sent to the model
+
+SUMMARY_PROMPT = "Analyze this student's question and the answer. Summarize the key mistake the student might have made or the key concept they need to remember. Be concise.\n\nQuestion: {question}\nAnswer: {answer}"
+PRACTICE_PROMPT = "Based on these specific mistake entries from a student's notebook, generate 3 practice questions to test their understanding and help them avoid similar mistakes:\n{context}"
+BANK_PROMPT = (
+    "Below are {n} entries from a student's notebook of mistakes and key points. For each entry, write {k} practice questions "
+    "that test the same idea and help the student avoid the mistake. Reply with the questions only, one per line, each starting "
+    "with its entry's number in brackets, like this:\n[1] A question for entry 1\n[2] A question for entry 2\n\n{entries}"
+)
+
+_WORD = re.compile(r"[a-z0-9]{3,}|[\u4e00-\u9fff]")
+_STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "when", "from", "are", "was", "not", "you", "your", "its", "into",
+    "key", "point", "remember", "mistake", "student", "concept", "rule", "question", "answer", "use", "using",
+}
+_NUMBERED = re.compile(r"^\s*\[(\d+)\]\s*(.+?)\s*$")
+_LIST_MARK = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def _read_config(config_file):
+    try:
+        with open(config_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+@functools.lru_cache(maxsize=None)
+def default_url():
+    """AnythingLLM for tutors whose config names none: port 3001 on this server's address, as in runner.py."""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+    except Exception:
+        ip = "127.0.0.1"
+    return f"http://{ip}:3001/api/v1"
+
+def backend(tutor):
+    """(url, api_key, slug) of the tutor's AnythingLLM workspace, from its config.json."""
+    config_file = os.path.join(DATA_DIR, tutor, "config.json")
+    # Same cache entry as the runner's own config, re-read when the teacher saves a new one
+    config = tutor_cache.cached("config", tutor, lambda: _read_config(config_file), paths=(config_file,))
+    return (config.get("url", default_url()), config.get("api_key", ""), config.get("slug", "default"))
+
+def _ask(job, op, prompt):
+    with metrics.timer(op, job.tutor) as t:
+        reply = call_anythingllm_chat(*backend(job.tutor), prompt)
+        t.error = reply.startswith("[RAG Error]")
+    if t.error:
+        raise job_queue.JobError(reply)
+    return reply
+
+def summarize_qa(job):
+    summary = _ask(job, "notebook_summary", SUMMARY_PROMPT.format(question=job.payload["question"], answer=job.payload["answer"]))
+    if job.cancelled():
+        return None
+    with metrics.timer("notebook_add", job.tutor):
+        # Keyed by the job, so a job re-run after its runner died does not add the entry twice
+        add_to_notebook(job.tutor, job.payload["question"], job.payload["answer"], summary, entry_id=job.id)
+    fill_bank(job.tutor) # The new entry's practice questions, batched with any others added soon
+    return summary
+
+def practice_questions(job):
+    return _ask(job, "practice_questions", PRACTICE_PROMPT.format(context=job.payload["context"]))
+
+def _words(entry):
+    return set(_WORD.findall(f"{entry['title'] or ''} {entry['summary'] or ''}".lower())) - _STOPWORDS
+
+def group_similar(entries, size=BANK_BATCH, threshold=BANK_SIMILARITY):
+    """Greedy grouping: each entry joins the first group whose words it overlaps enough, or starts one."""
+    groups = [] # [entries, words]
+    for entry in entries:
+        words = _words(entry)
+        for group in groups:
+            union = group[1] | words
+            if len(group[0]) < size and union and len(group[1] & words) / len(union) >= threshold:
+                group[0].append(entry)
+                group[1] |= words
+                break
+        else:
+            groups.append([[entry], words])
+    return [group[0] for group in groups]
+
+def parse_bank(reply, count):
+    """Questions per entry from a BANK_PROMPT reply. Unnumbered lines go to every entry left without any."""
+    numbered = [[] for _ in range(count)]
+    loose = []
+    for line in reply.splitlines():
+        match = _NUMBERED.match(line)
+        if match and 1 <= int(match.group(1)) <= count:
+            numbered[int(match.group(1)) - 1].append(match.group(2))
+        elif line.strip():
+            loose.append(_LIST_MARK.sub("", line).strip())
+    return [questions[:BANK_QUESTIONS] or loose[:BANK_QUESTIONS] for questions in numbered]
+
+def build_bank(job):
+    entries = pending_questions(job.tutor, limit=BANK_ENTRIES_PER_JOB)
+    banked, failed = 0, []
+    done = set() # entry ids this attempt has finished with
+    try:
+        for batch in group_similar(entries):
+            if job.cancelled():
+                return f"Cancelled after {banked} entries"
+            text = "\n\n".join(
+                f"[{i}] Topic: {entry['title']}\nMistake/Key Point: {truncate_tokens(entry['summary'] or '', BANK_FIELD_TOKENS)}\n"
+                f"Original Q: {truncate_tokens(entry['question'] or '', BANK_FIELD_TOKENS)}"
+                for i, entry in enumerate(batch, 1)
+            )
+            reply = _ask(job, "question_bank", BANK_PROMPT.format(n=len(batch), k=BANK_QUESTIONS, entries=text))
+            for entry, questions in zip(batch, parse_bank(reply, len(batch))):
+                if not questions:
+                    failed.append(entry['id'])
+                elif add_questions(job.tutor, entry, questions):
+                    banked += 1
+                done.add(entry['id'])
+    except Exception:
+        if job.attempts >= job.max_attempts: # No retry left: don't leave the rest waiting for a job that won't come
+            failed.extend(entry['id'] for entry in entries if entry['id'] not in done)
+        raise
+    finally:
+        fail_questions(job.tutor, failed)
+    if len(entries) == BANK_ENTRIES_PER_JOB and banked:
+        fill_bank(job.tutor, delay=0) # More are waiting
+    return f"Prepared questions for {banked} entries"
+
+job_queue.register(NOTEBOOK_SUMMARY, summarize_qa)
+job_queue.register(PRACTICE, practice_questions)
+job_queue.register(QUESTION_BANK, build_bank)
+
+# --- Enqueueing (from the page) ---
+
+def add_qa(tutor, question, answer):
+    """Summarize a Q&A and add it to the tutor's notebook, in the background."""
+    payload = {"question": question, "answer": answer}
+    return job_queue.enqueue(NOTEBOOK_SUMMARY, tutor, payload, label=question[:60])
+
+def fill_bank(tutor, delay=BANK_DELAY):
+    """Generate banked questions for the tutor's waiting entries (one queued job per tutor at a time)."""
+    return job_queue.enqueue(QUESTION_BANK, tutor, {}, label="Preparing practice questions", delay=delay, unique=True)
+
+def practice(tutor, entries):
+    """Generate practice questions for notebook entries, in the background."""
+    context_text = "".join(
+        f"\n---\nTopic: {entry['title']}\nMistake/Key Point: {truncate_tokens(entry['summary'] or '', BANK_FIELD_TOKENS)}\n"
+        f"Original Q: {truncate_tokens(entry['question'] or '', BANK_FIELD_TOKENS)}\n"
+        for entry in entries
+    )
+    payload = {"context": context_text, "entry_ids": [entry['id'] for entry in entries]}
+    return job_queue.enqueue(PRACTICE, tutor, payload, label=", ".join(entry['title'] or "" for entry in entries)[:80])